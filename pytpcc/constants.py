@@ -168,3 +168,37 @@ TransactionTypes = enum(
     "PAYMENT",
     "STOCK_LEVEL",
 )
+
+#  The order of the transactions in the --mix command line argument
+TRANSACTION_MIX = [
+    TransactionTypes.STOCK_LEVEL,
+    TransactionTypes.DELIVERY,
+    TransactionTypes.ORDER_STATUS,
+    TransactionTypes.PAYMENT,
+    TransactionTypes.NEW_ORDER,
+]
+
+#  TPC-C 4.2 (page 54): the maximum tpmC per warehouse with keying and think times
+MAX_TPMC_PER_WAREHOUSE = 12.86
+
+#  TPC-C 5.2.5.7 (page 70): the minimum keying time and the mean think time of
+#  each transaction, in seconds. Think times follow a negative exponential
+#  distribution truncated at 10 times the mean (TPC-C 5.2.5.4)
+KEYING_TIMES = {
+    TransactionTypes.DELIVERY: 2.0,
+    TransactionTypes.NEW_ORDER: 18.0,
+    TransactionTypes.ORDER_STATUS: 2.0,
+    TransactionTypes.PAYMENT: 3.0,
+    TransactionTypes.STOCK_LEVEL: 2.0,
+}
+THINK_TIMES = {
+    TransactionTypes.DELIVERY: 5.0,
+    TransactionTypes.NEW_ORDER: 12.0,
+    TransactionTypes.ORDER_STATUS: 10.0,
+    TransactionTypes.PAYMENT: 12.0,
+    TransactionTypes.STOCK_LEVEL: 5.0,
+}
+MAX_THINK_TIME_FACTOR = 10
+
+#  TPC-C 4.2.2: every warehouse has 10 terminals, one for each district
+TERMINALS_PER_WAREHOUSE = 10
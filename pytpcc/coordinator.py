@@ -73,35 +73,84 @@ def getDrivers():
 ## ==============================================
 ## startLoading
 ## ==============================================
-def startLoading(scalParameters,args,config,channels):  
-    #Split the warehouses into chunks
-    procs = len(channels)
-    w_ids = map(lambda x:[], range(procs))
-    for w_id in range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1):
-        idx = w_id % procs
-        w_ids[idx].append(w_id)
-    print w_ids
+def startLoading(scalParameters,args,config,channels,shardMap=None):  
+    #Hand out the load units to whichever worker is idle. Each phase
+    #has to finish before the units of the next one can be sent
+    phases = loader.makeLoadUnits(scalParameters, scalParameters.starting_warehouse == 1)
+    manifest = None
+    if args['checkpoint']:
+        manifest = checkpoint.LoadManifest(args['checkpoint'], checkpoint.describeLoad(scalParameters, args), args['reset'])
+        phases = manifest.pending(phases)
+    #Spread consecutive units over the shards so they all load at once
+    if shardMap:
+        phases = [ loader.interleaveUnits(phase, shardMap) for phase in phases ]
+    progress = loader.LoadProgress(scalParameters, phases)
         
     load_start=time.time()
     for i in range(len(channels)):
-        m=message.Message(header=message.CMD_LOAD,data=[scalParameters,args,config,w_ids[i]])
+        m=message.Message(header=message.CMD_LOAD,data=[scalParameters,args,config,rand.nurandVar,i])
         channels[i].send(pickle.dumps(m,-1))
+    #Every worker answers once it is ready for its first unit
+    for ch in channels:
+        ch.receive()
+    idle = list(channels)
+    busy = [ ]
+    for phase in phases:
+        pending = list(phase)
+        while len(pending) > 0 or len(busy) > 0:
+            while len(pending) > 0 and len(idle) > 0:
+                ch = idle.pop()
+                m=message.Message(header=message.CMD_LOAD_UNIT,data=pending.pop(0))
+                ch.send(pickle.dumps(m,-1))
+                busy.append(ch)
+            ## WHILE
+            ch, m = receiveAny(busy)
+            client_id, unit, elapsed = m.data
+            progress.finished(unit, client_id, elapsed)
+            if manifest: manifest.finish(unit)
+            busy.remove(ch)
+            idle.append(ch)
+        ## WHILE
+    ## FOR
+    for ch in channels:
+        m=message.Message(header=message.CMD_LOAD_FINISH)
+        ch.send(pickle.dumps(m,-1))
     for ch in channels:
         ch.receive()
-        pass
+    if manifest: manifest.close()
     return time.time()-load_start
 
+## ==============================================
+## receiveAny
+## ==============================================
+def receiveAny(channels, timeout=0.05):
+    """Wait for the next message from any of the given channels. A receive
+    queue can't be used here because the channels are also read directly."""
+    while True:
+        for ch in channels:
+            try:
+                return (ch, pickle.loads(ch.receive(timeout)))
+            except ch.TimeoutError:
+                pass
+        ## FOR
+    ## WHILE
+## DEF
+
 
 ## ==============================================
 ## startExecution
 ## ==============================================
-def startExecution(scaleParameters, args, config,channels):
+def startExecution(scaleParameters, args, config,channels,homeSets=None):
     procs = len(channels)
     total_results = results.Results()
     
-    for ch in channels:
-        m=message.Message(header=message.CMD_EXECUTE,data=[scaleParameters,args,config])
-        ch.send(pickle.dumps(m,-1))
+    ## The workers split the warehouses between them when they emulate terminals
+    args = dict(args)
+    args['clients'] = procs
+    if homeSets == None: homeSets = [ None ] * procs
+    for i in range(len(channels)):
+        m=message.Message(header=message.CMD_EXECUTE,data=[scaleParameters,args,config,rand.nurandVar,i,homeSets[i]])
+        channels[i].send(pickle.dumps(m,-1))
     for ch in channels:
         r=pickle.loads(ch.receive()).data
         total_results.append(r)
@@ -122,16 +171,46 @@ if __name__ == '__main__':
                          help='Instruct the driver to reset the contents of the database')
     aparser.add_argument('--scalefactor', default=1, type=float, metavar='SF',
                          help='Benchmark scale factor')
+    aparser.add_argument('--mix', default='4,4,4,43,45', metavar='SL,D,OS,P,NO',
+                         help='Transaction mix')
     aparser.add_argument('--warehouses', default=4, type=int, metavar='W',
                          help='Number of Warehouses')
     aparser.add_argument('--duration', default=60, type=int, metavar='D',
                          help='How long to run the benchmark in seconds')
+    aparser.add_argument('--warmup', default=0, type=int, metavar='W',
+                         help='Seconds to run before the measured duration starts')
+    aparser.add_argument('--cooldown', default=0, type=int, metavar='C',
+                         help='Seconds to keep running after the measured duration ends')
+    aparser.add_argument('--sample-interval', default=1.0, type=float, metavar='S',
+                         help='Length in seconds of each time-series sample interval')
+    aparser.add_argument('--timeseries', metavar='FILE',
+                         help='Write the time-series samples to FILE (.json for JSON, otherwise CSV)')
+    aparser.add_argument('--results-json', metavar='FILE',
+                         help='Write a machine-readable summary of the results to FILE')
+    aparser.add_argument('--generator', default='python', choices=loader.GENERATORS,
+                         help='Data generator backend used by the loader')
+    aparser.add_argument('--load-pipeline', default=loader.DEFAULT_PIPELINE_DEPTH, type=int, metavar='N',
+                         help='Number of batches the loader may generate ahead of the database (0 disables the generator thread)')
+    aparser.add_argument('--checkpoint', metavar='FILE',
+                         help='Record the finished load units in FILE and skip the ones it already lists. Use with --seed so that a resumed load generates the same data')
+    aparser.add_argument('--seed', type=int, metavar='N',
+                         help='Seed the random generators so that runs are reproducible')
     aparser.add_argument('--ddl', default=os.path.realpath(os.path.join(os.path.dirname(__file__), "tpcc.sql")),
                          help='Path to the TPC-C DDL SQL file')
     ## number of processes per node
     aparser.add_argument('--clientprocs', default=1, type=int, metavar='N',
                          help='Number of processes on each client node.')
+    aparser.add_argument('--terminals', default=1, type=int, metavar='N',
+                         help='The number of virtual terminals that each client process runs as threads, each with its own connection')
+    aparser.add_argument('--emulate-terminals', action='store_true',
+                         help='Emulate 10 terminals per warehouse with TPC-C keying and think times, multiplexed over --terminals connections per client process')
                          
+    aparser.add_argument('--affinity', action='store_true',
+                         help='Give every client process its own set of home warehouses, following the shards on sharded drivers. Remote warehouses are still picked from all of them')
+    aparser.add_argument('--partitioning', default=partitioner.STRATEGY_MODULO, choices=partitioner.STRATEGIES,
+                         help='How the sharded drivers spread the warehouses over their nodes')
+    aparser.add_argument('--no-item-replication', action='store_true',
+                         help='Store the ITEM table only on the first shard instead of on every shard')
     aparser.add_argument('--stop-on-error', action='store_true',
                          help='Stop the transaction execution when the driver throws an exception.')
     aparser.add_argument('--no-load', action='store_true',
@@ -167,12 +246,20 @@ if __name__ == '__main__':
         logging.debug("Using default configuration for %s" % args['system'])
         defaultConfig = driver.makeDefaultConfig()
         config = dict(map(lambda x: (x, defaultConfig[x][1]), defaultConfig.keys()))
+    
+    ## Create ScaleParameters
+    scaleParameters = scaleparameters.makeWithScaleFactor(args['warehouses'], args['scalefactor'])
+    if args['debug']: logging.debug("Scale Parameters:\n%s" % scaleParameters)
+    
     config['reset'] = args['reset']
     config['load'] = False
     config['execute'] = False
+    config['partitioning'] = partitioner.makeSpec(args['partitioning'], scaleParameters, not args['no_item_replication'])
     if config['reset']: logging.info("Reseting database")
     driver.loadConfig(config)
     logging.info("Initializing TPC-C benchmark using %s" % driver)
+    shardMap = driver.getPartitioner()
+    if shardMap: logging.info(shardMap.formatSkew())
     
     
     ##Get a list of clientnodes from configuration file.
@@ -192,23 +279,33 @@ if __name__ == '__main__':
             ch=gw.remote_exec(worker)
             channels.append(ch)
     
-    ## Create ScaleParameters
-    scaleParameters = scaleparameters.makeWithScaleFactor(args['warehouses'], args['scalefactor'])
-    nurand = rand.setNURand(nurand.makeForLoad())
-    if args['debug']: logging.debug("Scale Parameters:\n%s" % scaleParameters)
+    ## With affinity every worker gets its own home warehouses, following the shards if
+    ## there are any. They are worked out now so that a bad setup fails before the load
+    homeSets = None
+    if args['affinity']:
+        homeSets = partitioner.assignWarehouses(scaleParameters, len(channels), shardMap)
+    
+    ## All clients must share the same NURand constants. See TPC-C 2.1.6 (page 20)
+    rand.seedProcess(args['seed'], "nurand")
+    loadC = nurand.makeForLoad()
+    runC = nurand.makeForRun(loadC)
     
     ## DATA LOADER!!!
     load_time = None
     if not args['no_load']:
-        load_time = startLoading(scaleParameters, args, config,channels)
+        rand.setNURand(loadC)
+        load_time = startLoading(scaleParameters, args, config,channels,shardMap)
         #print load_time
     ## IF
     
     ## WORKLOAD DRIVER!!!
     if not args['no_execute']:
-        results = startExecution(scaleParameters, args, config,channels)
+        rand.setNURand(runC)
+        results = startExecution(scaleParameters, args, config,channels,homeSets)
         assert results
         print results.show(load_time)
+        if args['timeseries']: results.exportTimeSeries(args['timeseries'])
+        if args['results_json']: results.exportSummary(args['results_json'], load_time)
     ## IF
     
 ## MAIN
\ No newline at end of file
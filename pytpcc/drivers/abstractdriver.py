@@ -28,6 +28,17 @@ from datetime import datetime
 
 import constants
 
+## ==============================================
+## parseBool
+## ==============================================
+def parseBool(value):
+    """Convert a configuration value to a bool. Values read from a configuration
+    file are strings, so bool("False") would be True."""
+    if isinstance(value, basestring):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+## DEF
+
 ## ==============================================
 ## AbstractDriver
 ## ==============================================
@@ -82,11 +93,37 @@ class AbstractDriver(object):
     def loadFinishDistrict(self, w_id, d_id):
         """Optional callback to indicate to the driver that the data for the given district is finished."""
         return None
+
+    def loadStartUnit(self, unit):
+        """Optional callback to indicate to the driver that the data for the given load unit is about to be
+        passed in (see runtime/loader.py). A unit may be loaded again after an interrupted load, so drivers
+        that can should remove whatever a previous attempt left behind."""
+        return None
+
+    def loadFinishUnit(self, unit):
+        """Optional callback to indicate to the driver that the data for the given load unit is finished.
+        Once this returns the unit is recorded as done and will not be loaded again."""
+        return None
+        
+    def getPartitioner(self):
+        """Optional callback for sharded drivers. Return the util.partitioner.Partitioner that maps the
+        warehouses onto the driver's nodes, or None if the driver does not shard its data."""
+        return None
         
     def loadTuples(self, tableName, tuples):
         """Load a list of tuples into the target table"""
         raise NotImplementedError("%s does not implement loadTuples" % (self.driver_name))
         
+    def supportsLoadColumns(self):
+        """Optional callback to tell the loader that this driver implements loadColumns.
+        Drivers that return False will only ever get their data through loadTuples."""
+        return False
+        
+    def loadColumns(self, tableName, columns):
+        """Load a batch into the target table, given as a list with one sequence per column.
+        All of the columns have the same length and are in the table's column order."""
+        self.loadTuples(tableName, zip(*columns))
+        
     def executeStart(self):
         """Optional callback before the execution phase starts"""
         return None
@@ -94,6 +131,12 @@ class AbstractDriver(object):
     def executeFinish(self):
         """Callback after the execution phase finishes"""
         return None
+
+    def compact(self):
+        """Optional callback for drivers that keep append-only event logs. Fold the events that
+        no longer change the current state of the database and return a dict describing what was
+        reclaimed (see runtime/compactor.py), or None if the driver has nothing to compact."""
+        return None
         
     def executeTransaction(self, txn, params):
         """Execute a transaction based on the given name"""
@@ -29,6 +29,7 @@ from pprint import pformat
 
 import constants
 from abstractdriver import *
+from util import partitioner
 
 import couchdb
 from uuid import uuid4
@@ -227,6 +228,7 @@ class CouchdbDriver(AbstractDriver):
         super(CouchdbDriver, self).__init__("couchdb", ddl)
         self.servers = [] # list of shards (couchdb server objects)
         self.dbs = None   # dict: 'db_name' -> (list of db_obj (shards))
+        self.partitioner = None # maps warehouses onto the shards
 
     ## ----------------------------------------------
     ## makeDefaultConfig
@@ -247,6 +249,7 @@ class CouchdbDriver(AbstractDriver):
             # we use delayed commits here since we don't care much about durability
             # note, that couchdb would commit the data once per several seconds anyway
             self.servers.append(couchdb.Server(url = srv_name, full_commit = False))
+        self.partitioner = partitioner.makePartitioner(config.get("partitioning"), len(self.servers))
 
         db_names = [db_from_table(table) for table in TPCC_SCM.keys()]
 
@@ -273,15 +276,21 @@ class CouchdbDriver(AbstractDriver):
             self.dbs[db] = sdb
 
     ## ----------------------------------------------
-    ## tuples_to_docs
+    ## shard_from_id
     ## ----------------------------------------------
     def shard_from_id(self, key):
         """
         Get the shard number from the key. Key is assumed to be integer.
 
-        Just a dumb round-robin.
+        The placement is up to the configured partitioning strategy.
         """
-        return key % len(self.servers)
+        return self.partitioner.shard(key)
+
+    ## ----------------------------------------------
+    ## getPartitioner
+    ## ----------------------------------------------
+    def getPartitioner(self):
+        return self.partitioner
 
     ## ----------------------------------------------
     ## tuples_to_docs
@@ -313,15 +322,17 @@ class CouchdbDriver(AbstractDriver):
             #
             # we use distr_key for that.
             #
-            # if the table doesn't have a distr key, we assume it's
-            # replicated over all shard nodes
+            # if the table doesn't have a distr key, it's replicated
+            # over all shard nodes, unless replication is switched off
             #
             # it is assumed that the 'distr_key' is integer
             if TPCC_SCM[table_name].has_key("distr_key"):
                 distr_key = int(doc[TPCC_SCM[table_name]["distr_key"]])
                 shard = self.shard_from_id(distr_key)
-            else:
+            elif self.partitioner.replicateItems:
                 shard = -1
+            else:
+                shard = self.partitioner.itemShards()[0]
 
             # emulate primary key with "id" or generate a random one
             doc['_id'] = gen_pk_doc(table_name, doc)
@@ -522,7 +533,7 @@ class CouchdbDriver(AbstractDriver):
         items = []
 
         # retrieve and store info about all the items
-        item_data = self.dbs[db_from_table('ITEM')][self.shard_from_id(w_id)].view('_all_docs',
+        item_data = self.dbs[db_from_table('ITEM')][self.partitioner.itemShard(w_id)].view('_all_docs',
                                 include_docs = 'true',
                                 keys = [str(i) for i in i_ids]).rows
 
@@ -33,8 +33,12 @@ from __future__ import with_statement
 
 import os
 import sys
+import time
 import logging
+import threading
 import pymongo
+from itertools import izip
+from pymongo import IndexModel, ReturnDocument, UpdateOne
 from pprint import pprint, pformat
 
 import constants
@@ -180,8 +184,8 @@ TABLE_INDEXES = {
                                          pymongo.ASCENDING), ("o_id", pymongo.ASCENDING)],
     ],
     constants.TABLENAME_ORDER_LINE: [
-        [("ol_w_id", pymongo.ASCENDING), ("ol_d_id", pymongo.ASCENDING)
-        ("ol_id", pymongo.ASCENDING), ("ol_number", pymongo.ASCENDING)],
+        [("ol_w_id", pymongo.ASCENDING), ("ol_d_id", pymongo.ASCENDING),
+        ("ol_o_id", pymongo.ASCENDING), ("ol_number", pymongo.ASCENDING)],
 
         [("ol_i_id", pymongo.ASCENDING), ("ol_supply_w_id", pymongo.ASCENDING)]
     ],
@@ -203,6 +207,35 @@ TABLE_INDEXES = {
     ],
 }
 
+# Extra indexes of the embedded schema. Order-Status finds the last order of a
+# customer and the customers with the same last name are sorted by first name
+EMBEDDED_INDEXES = {
+    constants.TABLENAME_CUSTOMER:   [
+        [("c_w_id", pymongo.ASCENDING), ("c_d_id", pymongo.ASCENDING),
+         ("c_last", pymongo.ASCENDING), ("c_first", pymongo.ASCENDING)]
+    ],
+    constants.TABLENAME_ORDERS:   [
+        [("o_w_id", pymongo.ASCENDING), ("o_d_id", pymongo.ASCENDING),
+         ("o_c_id", pymongo.ASCENDING), ("o_id", pymongo.DESCENDING)],
+        [("o_w_id", pymongo.ASCENDING), ("o_d_id", pymongo.ASCENDING),
+         ("o_carrier_id", pymongo.ASCENDING), ("o_id", pymongo.ASCENDING)]
+    ],
+}
+
+# The fields of an order line that are kept inside its order
+EMBEDDED_LINE_KEYS = [ "ol_number", "ol_i_id", "ol_supply_w_id", "ol_quantity", "ol_amount", "ol_dist_info" ]
+
+# Number of the most recent quantity changes kept inside each stock document
+STOCK_EVENTS_PER_ITEM = 16
+
+# The documents are built by zipping each tuple with its table's column names,
+# which are looked up once per table instead of once per column
+TABLE_KEYS = dict([ (name, tuple(columns)) for name, columns in TABLE_COLUMNS.iteritems() ])
+
+# Keeps track of the loaders that are still running, so that the last one to
+# finish builds the indexes once all of the data is in
+LOADERS_COLLECTION = "tpcc_loaders"
+
 # ==============================================
 # MongodbDriver
 # ==============================================
@@ -212,6 +245,9 @@ class MongodbDriver(AbstractDriver):
     DEFAULT_CONFIG = {
         "uri":          ("The connection URI to mongod", "mongodb://localhost:27017"),
         "name":         ("Collection name", "tpcc"),
+        "batch_size":   ("Number of documents sent in each unordered insert_many() while loading", 5000),
+        "defer_indexes": ("Build the indexes after the data is loaded instead of before", True),
+        "embedded":     ("Embed the order lines in their orders and the stock events in their stock, and mark delivered orders with their carrier", False),
     }
 
     def __init__(self, ddl):
@@ -240,28 +276,76 @@ class MongodbDriver(AbstractDriver):
         self.conn = pymongo.MongoClient(config['uri'])
         self.database = self.conn[str(config['name'])]
         self.denormalized_values = {}
+        self.batch_size = int(config["batch_size"])
+        self.defer_indexes = parseBool(config["defer_indexes"])
+        self.embedded = parseBool(config["embedded"])
+        assert self.batch_size > 0
+
+        self.indexes = dict([ (name, list(indexes)) for name, indexes in TABLE_INDEXES.iteritems() ])
+        if self.embedded:
+            for name, indexes in EMBEDDED_INDEXES.iteritems():
+                self.indexes[name] = self.indexes.get(name, [ ]) + indexes
+        # The documents of the embedded schema that wait for the rest of their data
+        self.pendingStock = { }
+        self.pendingOrders = { }
+        self.pendingCarriers = { }
 
         if config["reset"]:
             logging.debug("Deleting database '%s'" % self.database.name)
-            for name in constants.ALL_TABLES:
+            for name in constants.ALL_TABLES + [ LOADERS_COLLECTION ]:
                 if name in self.database.collection_names():
                     self.database.drop_collection(name)
                     logging.debug("Dropped collection %s" % name)
         # IF
 
         # Setup!
-        load_indexes = ('execute' in config and not config['execute']) and \
+        main_process = ('execute' in config and not config['execute']) and \
                        ('load' in config and not config['load'])
         for name in constants.ALL_TABLES:
             # Create member mapping to collections
             self.__dict__[name] = self.database[name]
+        # FOR
+        if main_process and not self.defer_indexes:
+            self.createIndexes()
+        elif main_process:
+            # The main process is set up before any loader starts, so this clears
+            # the count left behind by loaders that crashed in an earlier attempt
+            self.database[LOADERS_COLLECTION].update_one({"_id": "loaders"}, {"$set": {"running": 0}}, upsert=True)
 
-            # Create Indexes
-            if load_indexes and name in TABLE_INDEXES:
-                logging.debug("Creating index for %s" % name)
-                for index in TABLE_INDEXES[name]:
-                    self.database[name].create_index(index)
+    # ----------------------------------------------
+    # createIndexes
+    # ----------------------------------------------
+    def createIndexes(self):
+        """Build the indexes of all of the collections. Each collection is built by its
+        own thread, and all of its indexes are built in a single pass over it"""
+        start = time.time()
+        errors = [ ]
+        def build(name):
+            try:
+                logging.debug("Creating indexes for %s" % name)
+                self.database[name].create_indexes([ IndexModel(index) for index in self.indexes[name] ])
+            except Exception, ex:
+                errors.append((name, ex))
+        # DEF
+
+        threads = [ ]
+        for name in self.indexes.keys():
+            t = threading.Thread(target=build, args=(name,))
+            t.start()
+            threads.append(t)
         # FOR
+        for t in threads:
+            t.join()
+        if errors:
+            raise Exception("Failed to create the indexes for %s" % ", ".join([ "%s (%s)" % e for e in errors ]))
+        logging.info("Created the indexes of %d collections in %.1f seconds" % (len(self.indexes), time.time() - start))
+
+    # ----------------------------------------------
+    # loadStart
+    # ----------------------------------------------
+    def loadStart(self):
+        if self.defer_indexes:
+            self.database[LOADERS_COLLECTION].update_one({"_id": "loaders"}, {"$inc": {"running": 1}}, upsert=True)
 
     # ----------------------------------------------
     # loadTuples
@@ -272,20 +356,134 @@ class MongodbDriver(AbstractDriver):
         logging.debug("Loading %d tuples for tableName %s" %
                       (len(tuples), tableName))
 
-        assert tableName in TABLE_COLUMNS, "Unexpected table %s" % tableName
-        columns = TABLE_COLUMNS[tableName]
-        num_columns = range(len(columns))
+        assert tableName in TABLE_KEYS, "Unexpected table %s" % tableName
+        keys = TABLE_KEYS[tableName]
+        self.loadDocuments(tableName, [ dict(izip(keys, t)) for t in tuples ])
 
-        tuple_dicts = []
+    # ----------------------------------------------
+    # supportsLoadColumns
+    # ----------------------------------------------
+    def supportsLoadColumns(self):
+        return True
 
-        for t in tuples:
-            tuple_dicts.append(
-                dict(map(lambda i: (columns[i], t[i]), num_columns)))
-        # FOR
-        self.database[tableName].insert(tuple_dicts)
+    # ----------------------------------------------
+    # loadColumns
+    # ----------------------------------------------
+    def loadColumns(self, tableName, columns):
+        if len(columns) == 0 or len(columns[0]) == 0:
+            return
+        assert tableName in TABLE_KEYS, "Unexpected table %s" % tableName
+        keys = TABLE_KEYS[tableName]
+        self.loadDocuments(tableName, [ dict(izip(keys, t)) for t in izip(*columns) ])
+
+    # ----------------------------------------------
+    # loadDocuments
+    # ----------------------------------------------
+    def loadDocuments(self, tableName, documents):
+        if not self.embedded:
+            self.insertDocuments(tableName, documents)
+        elif tableName == constants.TABLENAME_CUSTOMER:
+            for c in documents:
+                c["c_balance"] = constants.INITIAL_BALANCE
+                c["c_ytd_payment"] = constants.INITIAL_YTD_PAYMENT
+                c["c_payment_cnt"] = constants.INITIAL_PAYMENT_CNT
+                c["c_delivery_cnt"] = constants.INITIAL_DELIVERY_CNT
+            self.insertDocuments(tableName, documents)
+        elif tableName == constants.TABLENAME_DISTRICT:
+            for d in documents:
+                d["d_next_o_id"] = 1
+            self.insertDocuments(tableName, documents)
+        elif tableName == constants.TABLENAME_STOCK:
+            for s in documents:
+                self.pendingStock[(s["s_w_id"], s["s_i_id"])] = s
+        elif tableName == constants.TABLENAME_STOCK_HISTORY:
+            self.loadStockEvents(documents)
+        elif tableName == constants.TABLENAME_ORDERS:
+            for o in documents:
+                o["o_lines"] = [ ]
+                o["o_total"] = 0
+                self.pendingOrders[(o["o_w_id"], o["o_d_id"], o["o_id"])] = o
+        elif tableName == constants.TABLENAME_ORDER_LINE:
+            self.loadOrderLines(documents)
+        elif tableName == constants.TABLENAME_DELIVERY:
+            for dl in documents:
+                self.pendingCarriers[(dl["dl_w_id"], dl["dl_delivery_d"])] = dl["dl_carrier_id"]
+            self.insertDocuments(tableName, documents)
+        elif tableName == constants.TABLENAME_DELIVERY_ORDERS:
+            self.loadDeliveredOrders(documents)
+        else:
+            self.insertDocuments(tableName, documents)
         # IF
 
-        return
+    # ----------------------------------------------
+    # loadStockEvents
+    # ----------------------------------------------
+    def loadStockEvents(self, events):
+        """The loader sends each batch of stock before its history, so the stock
+        documents are held back until their first quantity arrives"""
+        stock = [ ]
+        for sh in events:
+            s = self.pendingStock.pop((sh["sh_s_w_id"], sh["sh_s_i_id"]))
+            s["s_quantity"] = sh["sh_quantity"]
+            s["s_events"] = [ {"sh_date": sh["sh_date"], "sh_quantity": sh["sh_quantity"]} ]
+            stock.append(s)
+        # FOR
+        self.insertDocuments(constants.TABLENAME_STOCK, stock)
+
+    # ----------------------------------------------
+    # loadOrderLines
+    # ----------------------------------------------
+    def loadOrderLines(self, lines):
+        """The loader sends the orders before their lines, but a batch of lines can
+        end in the middle of an order, so each order is held back until all of its
+        o_ol_cnt lines are in. The districts' next order ids are moved past them"""
+        complete = [ ]
+        for ol in lines:
+            key = (ol["ol_w_id"], ol["ol_d_id"], ol["ol_o_id"])
+            o = self.pendingOrders[key]
+            o["o_lines"].append(dict([ (k, ol[k]) for k in EMBEDDED_LINE_KEYS ]))
+            o["o_total"] += ol["ol_amount"]
+            if len(o["o_lines"]) == o["o_ol_cnt"]:
+                complete.append(self.pendingOrders.pop(key))
+        # FOR
+        if not complete:
+            return
+        next_o_ids = { }
+        for o in complete:
+            key = (o["o_w_id"], o["o_d_id"])
+            next_o_ids[key] = max(next_o_ids.get(key, 0), o["o_id"] + 1)
+        self.insertDocuments(constants.TABLENAME_ORDERS, complete)
+
+        self.district.bulk_write([ UpdateOne({"d_w_id": w_id, "d_id": d_id}, {"$max": {"d_next_o_id": o_id}})
+                                   for (w_id, d_id), o_id in next_o_ids.iteritems() ], ordered=False)
+
+    # ----------------------------------------------
+    # loadDeliveredOrders
+    # ----------------------------------------------
+    def loadDeliveredOrders(self, deliveries):
+        """Mark the delivered orders with their carrier instead of keeping the
+        DELIVERY_ORDERS rows"""
+        updates = [ ]
+        for dlo in deliveries:
+            w_id, d_id, o_id = dlo["dlo_w_id"], dlo["dlo_d_id"], dlo["dlo_o_id"]
+            carrier = self.pendingCarriers[(w_id, dlo["dlo_delivery_d"])]
+            updates.append(UpdateOne({"o_w_id": w_id, "o_d_id": d_id, "o_id": o_id},
+                                     {"$set": {"o_carrier_id": carrier, "o_delivery_d": dlo["dlo_delivery_d"]}}))
+        # FOR
+        self.pendingCarriers = { }
+        for i in range(0, len(updates), self.batch_size):
+            self.orders.bulk_write(updates[i:i+self.batch_size], ordered=False)
+
+    # ----------------------------------------------
+    # insertDocuments
+    # ----------------------------------------------
+    def insertDocuments(self, tableName, documents):
+        """Send the documents in batches of batch_size. The inserts are unordered, so
+        the server can apply each batch in parallel and doesn't stop at the first error"""
+        collection = self.database[tableName]
+        for i in range(0, len(documents), self.batch_size):
+            collection.insert_many(documents[i:i+self.batch_size], ordered=False)
+        # FOR
 
     # ----------------------------------------------
     # loadFinishDistrict
@@ -297,7 +495,14 @@ class MongodbDriver(AbstractDriver):
     # loadFinish
     # ----------------------------------------------
     def loadFinish(self):
-        pass
+        if not self.defer_indexes:
+            return
+        loaders = self.database[LOADERS_COLLECTION].find_one_and_update(
+            {"_id": "loaders"}, {"$inc": {"running": -1}}, return_document=ReturnDocument.AFTER)
+        if loaders["running"] > 0:
+            logging.info("Leaving the indexes to the loaders still running")
+            return
+        self.createIndexes()
     
     def findTop(self, collection, filters, projection, sort, one = True):
       if one:
@@ -312,6 +517,7 @@ class MongodbDriver(AbstractDriver):
     # doDelivery
     # ----------------------------------------------
     def doDelivery(self, params):
+        if self.embedded: return self.embeddedDelivery(params)
         w_id = params["w_id"]
         o_carrier_id = params["o_carrier_id"]
         ol_delivery_d = params["ol_delivery_d"]
@@ -343,6 +549,7 @@ class MongodbDriver(AbstractDriver):
     # doNewOrder
     # ----------------------------------------------
     def doNewOrder(self, params):
+        if self.embedded: return self.embeddedNewOrder(params)
         w_id = params["w_id"]
         d_id = params["d_id"]
         c_id = params["c_id"]
@@ -488,6 +695,7 @@ class MongodbDriver(AbstractDriver):
     # doOrderStatus
     # ----------------------------------------------
     def doOrderStatus(self, params):
+        if self.embedded: return self.embeddedOrderStatus(params)
         w_id = params["w_id"]
         d_id = params["d_id"]
         c_id = params["c_id"]
@@ -600,6 +808,7 @@ class MongodbDriver(AbstractDriver):
     # doPayment
     # ----------------------------------------------
     def doPayment(self, params):
+        if self.embedded: return self.embeddedPayment(params)
         w_id = params["w_id"]
         d_id = params["d_id"]
         h_amount = params["h_amount"]
@@ -687,6 +896,7 @@ class MongodbDriver(AbstractDriver):
     # doStockLevel
     # ----------------------------------------------
     def doStockLevel(self, params):
+        if self.embedded: return self.embeddedStockLevel(params)
         w_id = params["w_id"]
         d_id = params["d_id"]
         threshold = params["threshold"]
@@ -748,5 +958,252 @@ class MongodbDriver(AbstractDriver):
             }
           ]), {"count": 0})["count"]
         
+    # ----------------------------------------------
+    # findCustomer
+    # ----------------------------------------------
+    def findCustomer(self, w_id, d_id, c_id, c_last, fields):
+        """Find the customer by id, or else the one in the middle of the customers
+        with the given last name sorted by first name (TPC-C 2.5.2.2)"""
+        if c_id != None:
+            c = self.customer.find_one({"c_w_id": w_id, "c_d_id": d_id, "c_id": c_id}, fields)
+        else:
+            all_customers = list(self.customer.find({"c_w_id": w_id, "c_d_id": d_id, "c_last": c_last}, fields)
+                                 .sort([("c_first", pymongo.ASCENDING)]))
+            assert len(all_customers) > 0
+            c = all_customers[(len(all_customers)-1)/2]
+        assert c
+        return c
+
+    # ----------------------------------------------
+    # embeddedDelivery
+    # ----------------------------------------------
+    def embeddedDelivery(self, params):
+        w_id = params["w_id"]
+        o_carrier_id = params["o_carrier_id"]
+        ol_delivery_d = params["ol_delivery_d"]
+
+        result = []
+        for d_id in range(1, constants.DISTRICTS_PER_WAREHOUSE+1):
+            # Claim the district's oldest undelivered order. Setting the carrier is
+            # atomic, so concurrent deliveries never get the same order, and an order
+            # id that a failed NEW_ORDER never inserted is simply not there
+            o = self.orders.find_one_and_update({"o_w_id": w_id, "o_d_id": d_id, "o_carrier_id": None},
+                {"$set": {"o_carrier_id": o_carrier_id, "o_delivery_d": ol_delivery_d}},
+                {"o_id": 1, "o_c_id": 1, "o_total": 1}, sort=[("o_id", pymongo.ASCENDING)])
+            if o == None:
+                # No orders for this district: skip it. Note: This must be reported if > 1%
+                continue
+            o_id = o["o_id"]
+
+            self.customer.update_one({"c_w_id": w_id, "c_d_id": d_id, "c_id": o["o_c_id"]},
+                                     {"$inc": {"c_balance": o["o_total"], "c_delivery_cnt": 1}})
+            result.append((d_id, o_id))
+        # FOR
+        self.delivery.insert_one({
+            "dl_delivery_d": ol_delivery_d,
+            "dl_w_id": w_id,
+            "dl_carrier_id": o_carrier_id
+        })
+        return result
+
+    # ----------------------------------------------
+    # embeddedNewOrder
+    # ----------------------------------------------
+    def embeddedNewOrder(self, params):
+        w_id = params["w_id"]
+        d_id = params["d_id"]
+        c_id = params["c_id"]
+        o_entry_d = params["o_entry_d"]
+        i_ids = params["i_ids"]
+        i_w_ids = params["i_w_ids"]
+        i_qtys = params["i_qtys"]
+        s_dist_col = "s_dist_%02d" % d_id
+
+        assert len(i_ids) > 0
+        assert len(i_ids) == len(i_w_ids)
+        assert len(i_ids) == len(i_qtys)
+
+        all_local = (not i_w_ids or [w_id] * len(i_w_ids) == i_w_ids)
+
+        items = dict([ (i["i_id"], i) for i in self.item.find({"i_id": {"$in": i_ids}},
+                       {"i_id": 1, "i_price": 1, "i_name": 1, "i_data": 1}) ])
+        # TPCC defines 1% of neworder gives a wrong itemid, causing rollback.
+        if len(items) != len(set(i_ids)):
+            return
+        # IF
+
+        # getWarehouseTaxRate
+        w = self.warehouse.find_one({"w_id": w_id}, {"w_tax": 1})
+        assert w
+        w_tax = w["w_tax"]
+
+        # getDistrict + incrementNextOrderId
+        d = self.district.find_one_and_update({"d_id": d_id, "d_w_id": w_id},
+            {"$inc": {"d_next_o_id": 1}}, {"d_tax": 1, "d_next_o_id": 1})
+        assert d
+        d_tax = d["d_tax"]
+        d_next_o_id = d["d_next_o_id"]
+
+        # getCustomer
+        c = self.customer.find_one({"c_id": c_id, "c_d_id": d_id, "c_w_id": w_id}, {
+                                   "c_discount": 1, "c_last": 1, "c_credit": 1})
+        assert c
+        c_discount = c["c_discount"]
+
+        item_data = []
+        total = 0
+        order_lines = []
+        for i in range(len(i_ids)):
+            ol_i_id = i_ids[i]
+            ol_supply_w_id = i_w_ids[i]
+            ol_quantity = i_qtys[i]
+            itemInfo = items[ol_i_id]
+            i_price = itemInfo["i_price"]
+
+            # updateStock: the new quantity is worked out by the server and appended
+            # to the item's most recent events
+            si = self.stock.find_one_and_update({"s_i_id": ol_i_id, "s_w_id": ol_supply_w_id}, [
+                {"$set": {"s_quantity": {"$cond": [{"$gte": ["$s_quantity", ol_quantity + 10]},
+                                                   {"$subtract": ["$s_quantity", ol_quantity]},
+                                                   {"$add": ["$s_quantity", 91 - ol_quantity]}]}}},
+                {"$set": {"s_events": {"$slice": [{"$concatArrays": ["$s_events", [{"sh_date": o_entry_d, "sh_quantity": "$s_quantity"}]]},
+                                                  -STOCK_EVENTS_PER_ITEM]}}},
+            ], {"s_quantity": 1, "s_data": 1, s_dist_col: 1}, return_document=ReturnDocument.AFTER)
+            assert si, "Failed to find s_i_id: %d\n%s" % (ol_i_id, pformat(itemInfo))
+            s_quantity = si["s_quantity"]
+
+            if itemInfo["i_data"].find(constants.ORIGINAL_STRING) != -1 and si["s_data"].find(constants.ORIGINAL_STRING) != -1:
+                brand_generic = 'B'
+            else:
+                brand_generic = 'G'
+            ol_amount = ol_quantity * i_price
+            total += ol_amount
+
+            order_lines.append({"ol_number": i + 1, "ol_i_id": ol_i_id, "ol_supply_w_id": ol_supply_w_id,
+                                "ol_quantity": ol_quantity, "ol_amount": ol_amount, "ol_dist_info": si[s_dist_col]})
+            item_data.append((itemInfo["i_name"], s_quantity, brand_generic, i_price, ol_amount))
+        # FOR
+
+        # createOrder: the order and all of its lines are a single document
+        self.orders.insert_one({
+            "o_id": d_next_o_id,
+            "o_d_id": d_id,
+            "o_w_id": w_id,
+            "o_c_id": c_id,
+            "o_ol_cnt": len(i_ids),
+            "o_all_local": all_local,
+            "o_entry_d": o_entry_d,
+            "o_total": total,
+            "o_lines": order_lines
+        })
+
+        total *= (1 - c_discount) * (1 + w_tax + d_tax)
+        misc = [(w_tax, d_tax, d_next_o_id, total)]
+        return [c, misc, item_data]
+
+    # ----------------------------------------------
+    # embeddedOrderStatus
+    # ----------------------------------------------
+    def embeddedOrderStatus(self, params):
+        w_id = params["w_id"]
+        d_id = params["d_id"]
+        c_id = params["c_id"]
+        c_last = params["c_last"]
+
+        c = self.findCustomer(w_id, d_id, c_id, c_last, {"c_id": 1, "c_first": 1,
+                              "c_middle": 1, "c_last": 1, "c_balance": 1})
+
+        # getLastOrder: the lines come with it
+        order = self.orders.find_one({"o_w_id": w_id, "o_d_id": d_id, "o_c_id": c["c_id"]},
+            {"o_id": 1, "o_carrier_id": 1, "o_entry_d": 1, "o_delivery_d": 1, "o_lines": 1},
+            sort=[("o_id", pymongo.DESCENDING)])
+        orderLines = [ ]
+        if order:
+            for ol in order.pop("o_lines"):
+                orderLines.append({"ol_supply_w_id": ol["ol_supply_w_id"], "ol_i_id": ol["ol_i_id"],
+                                   "ol_quantity": ol["ol_quantity"], "ol_amount": ol["ol_amount"],
+                                   "ol_delivery_d": order.get("o_delivery_d")})
+        # IF
+        return [c, order, orderLines]
+
+    # ----------------------------------------------
+    # embeddedPayment
+    # ----------------------------------------------
+    def embeddedPayment(self, params):
+        w_id = params["w_id"]
+        d_id = params["d_id"]
+        h_amount = params["h_amount"]
+        c_w_id = params["c_w_id"]
+        c_d_id = params["c_d_id"]
+        c_id = params["c_id"]
+        c_last = params["c_last"]
+        h_date = params["h_date"]
+
+        return_fields = {"c_id": 1, "c_first": 1, "c_middle": 1, "c_last": 1,
+                        "c_street_1": 1, "c_street_2": 1, "c_city": 1, "c_state": 1, "c_zip": 1,
+                        "c_phone": 1, "c_since": 1, "c_discount": 1, "c_credit": 1, "c_credit_lim": 1,
+                        "c_balance": 1, "c_ytd_payment": 1, "c_payment_cnt": 1, "c_data": 1}
+        c = self.findCustomer(c_w_id, c_d_id, c_id, c_last, return_fields)
+        c_id = c["c_id"]
+
+        # updateCustomer
+        update = {"$inc": {"c_balance": -1 * h_amount, "c_ytd_payment": h_amount, "c_payment_cnt": 1}}
+        if c["c_credit"] == constants.BAD_CREDIT:
+            newData = " ".join(map(str, [c_id, c_d_id, c_w_id, d_id, w_id, h_amount]))
+            c_data = (newData + "|" + c["c_data"])
+            if len(c_data) > constants.MAX_C_DATA: c_data = c_data[:constants.MAX_C_DATA]
+            update["$set"] = {"c_data": c_data}
+            self.customer_history.insert_one({
+              "ch_c_id": c_id,
+              "ch_c_d_id": c_d_id,
+              "ch_c_w_id": c_w_id,
+              "ch_date": h_date,
+              "ch_data": c_data
+            })
+        # IF
+        c = self.customer.find_one_and_update({"_id": c["_id"]}, update, return_fields,
+                                              return_document=ReturnDocument.AFTER)
+        if c["c_credit"] != constants.BAD_CREDIT:
+            c["c_data"] = ""
+
+        # getWarehouse
+        w = self.warehouse.find_one({"w_id": w_id}, {
+                                    "w_name": 1, "w_street_1": 1, "w_street_2": 1, "w_city": 1, "w_state": 1, "w_zip": 1})
+        assert w
+
+        # getDistrict
+        d = self.district.find_one({"d_w_id": w_id, "d_id": d_id}, {
+                                   "d_name": 1, "d_street_1": 1, "d_street_2": 1, "d_city": 1, "d_state": 1, "d_zip": 1})
+        assert d
+
+        # insertHistory
+        h_data = "%s    %s" % (w["w_name"], d["d_name"])
+        self.history.insert_one({"h_c_id": c_id, "h_c_d_id": c_d_id, "h_c_w_id": c_w_id, "h_d_id": d_id, "h_w_id": w_id,
+                                 "h_date": h_date, "h_amount": h_amount, "h_data": h_data})
+
+        return [w, d, c]
+
+    # ----------------------------------------------
+    # embeddedStockLevel
+    # ----------------------------------------------
+    def embeddedStockLevel(self, params):
+        w_id = params["w_id"]
+        d_id = params["d_id"]
+        threshold = params["threshold"]
+
+        # getOId
+        d = self.district.find_one({"d_w_id": w_id, "d_id": d_id}, {"d_next_o_id": 1})
+        assert d
+        o_id = d["d_next_o_id"]
+
+        # getStockCount: the item ids of the last 20 orders are inside the orders
+        ol_ids = set()
+        for o in self.orders.find({"o_w_id": w_id, "o_d_id": d_id, "o_id": {"$lt": o_id, "$gte": o_id-20}},
+                                  {"o_lines.ol_i_id": 1}):
+            for ol in o["o_lines"]:
+                ol_ids.add(ol["ol_i_id"])
+        # FOR
+        return self.stock.count_documents({"s_w_id": w_id, "s_i_id": {"$in": list(ol_ids)},
+                                           "s_quantity": {"$lt": threshold}})
 
 # CLASS
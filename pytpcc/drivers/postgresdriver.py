@@ -37,12 +37,18 @@ from __future__ import with_statement
 import os
 import psycopg2
 from psycopg2.sql import SQL, Identifier
+from psycopg2.extras import execute_values
 import logging
 import commands
+import time
+from cStringIO import StringIO
+from datetime import datetime
 from pprint import pprint,pformat
 
 import constants
 from abstractdriver import *
+from statementcache import StatementCache, formatStats
+from util import rand
 
 TXN_QUERIES = {
     "DELIVERY": {
@@ -54,13 +60,18 @@ TXN_QUERIES = {
     "NEW_ORDER": {
         "getWarehouseTaxRate": "SELECT w_tax FROM warehouse WHERE w_id = %s", # w_id
         "getDistrict": "SELECT d_tax FROM district WHERE d_id = %s AND d_w_id = %s", # d_id, w_id
-        "getOId": "SELECT MAX(o_id) + 1 as d_next_o_id FROM orders WHERE o_d_id = %s AND o_w_id = %s", # d_id, w_id
+        "getNextOId": "UPDATE district_order_counter SET d_next_o_id = d_next_o_id + 1 WHERE d_id = %s AND d_w_id = %s RETURNING d_next_o_id - 1", # d_id, w_id
         "getCustomer": "SELECT c_discount, c_last, c_credit FROM customer WHERE c_w_id = %s AND c_d_id = %s AND c_id = %s", # w_id, d_id, c_id
         "insertNewOrderEvent": "INSERT INTO orders VALUES (%s, %s, %s, %s, %s, %s, %s)", # o_id, o_d_id, o_w_id, o_c_id, o_ol_cnt, o_all_local, o_entry_d
         "insertOrderLine": "INSERT INTO order_line VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", # ol_o_id, ol_d_id, ol_w_id, ol_number, ol_i_id, ol_supply_w_id, ol_quantity, ol_dist_info
         "getItemInfo": "SELECT i_price, i_name, i_data FROM item WHERE i_id = %s", # ol_i_id
         "getStockInfo": "SELECT s_quantity, s_data, {} FROM stock_view WHERE s_i_id = %s AND s_w_id = %s", # d_id, ol_i_id, ol_supply_w_id
-        "updateStock": "INSERT INTO stock_history VALUES (%s, %s, %s, %s)" # sh_i_id, sh_w_id, sh_date, sh_quantity
+        "updateStock": "INSERT INTO stock_history VALUES (%s, %s, %s, %s)", # sh_i_id, sh_w_id, sh_date, sh_quantity
+        ## Batched variants: all of the rows of the order in one round trip
+        "getItemInfoBatch": "SELECT i_id, i_price, i_name, i_data FROM item WHERE i_id = ANY(%s)", # ol_i_ids
+        "getStockInfoBatch": "SELECT s_i_id, s_w_id, s_quantity, s_data, {} FROM stock_view WHERE s_i_id = ANY(%s) AND s_w_id = ANY(%s)", # d_id, ol_i_ids, ol_supply_w_ids
+        "updateStockBatch": "INSERT INTO stock_history VALUES %s", # (sh_i_id, sh_w_id, sh_date, sh_quantity), ...
+        "insertOrderLineBatch": "INSERT INTO order_line VALUES %s", # (ol_o_id, ol_d_id, ol_w_id, ol_number, ol_i_id, ol_supply_w_id, ol_quantity, ol_amount, ol_dist_info), ...
     },
     "ORDER_STATUS": {
         "getCustomerByCustomerId": "SELECT c_id, c_first, c_middle, c_last, c_balance FROM customer_view WHERE c_w_id = %s AND c_d_id = %s AND c_id = %s", # w_id, d_id, c_id
@@ -77,7 +88,7 @@ TXN_QUERIES = {
         "updateBCCustomer": "INSERT INTO customer_history VALUES (%s, %s, %s, %s, %s)" # ch_id, ch_d_id, ch_w_id, ch_date, ch_data
     },
     "STOCK_LEVEL": {
-        "getOId": "SELECT MAX(o_id) + 1 as d_next_o_id FROM orders WHERE o_w_id = %s AND o_d_id = %s",
+        "getOId": "SELECT d_next_o_id FROM district_order_counter WHERE d_w_id = %s AND d_id = %s", # w_id, d_id
         "getStockCount": """
             SELECT COUNT(DISTINCT(s_i_id)) FROM order_line, stock_view
             WHERE
@@ -91,8 +102,254 @@ TXN_QUERIES = {
     },
 }
 
+## Replacements for TXN_QUERIES in snapshot mode, where the current state of the stock
+## and the customers is read from the tables maintained by tpcc_snapshot.sql
+SNAPSHOT_QUERIES = {
+    "NEW_ORDER": {
+        "getStockInfo": "SELECT s_quantity, s_data, {} FROM stock JOIN stock_state USING (s_w_id, s_i_id) WHERE s_i_id = %s AND s_w_id = %s", # d_id, ol_i_id, ol_supply_w_id
+        "getStockInfoBatch": "SELECT s_i_id, s_w_id, s_quantity, s_data, {} FROM stock JOIN stock_state USING (s_w_id, s_i_id) WHERE s_i_id = ANY(%s) AND s_w_id = ANY(%s)", # d_id, ol_i_ids, ol_supply_w_ids
+    },
+    "ORDER_STATUS": {
+        "getCustomerByCustomerId": "SELECT c_id, c_first, c_middle, c_last, c_balance FROM customer JOIN customer_state USING (c_w_id, c_d_id, c_id) WHERE c_w_id = %s AND c_d_id = %s AND c_id = %s", # w_id, d_id, c_id
+        "getCustomersByLastName": "SELECT c_id, c_first, c_middle, c_last, c_balance FROM customer JOIN customer_state USING (c_w_id, c_d_id, c_id) WHERE c_w_id = %s AND c_d_id = %s AND c_last = %s ORDER BY c_first", # w_id, d_id, c_last
+    },
+    "PAYMENT": {
+        "getCustomerByCustomerId": "SELECT c_id, c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, c_since, c_discount, c_credit, c_credit_lim, customer_state.c_data FROM customer JOIN customer_state USING (c_w_id, c_d_id, c_id) WHERE c_w_id = %s AND c_d_id = %s AND c_id = %s", # w_id, d_id, c_id
+        "getCustomersByLastName": "SELECT c_id, c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, c_since, c_discount, c_credit, c_credit_lim, customer_state.c_data FROM customer JOIN customer_state USING (c_w_id, c_d_id, c_id) WHERE c_w_id = %s AND c_d_id = %s AND c_last = %s ORDER BY c_first", # w_id, d_id, c_last
+    },
+    "STOCK_LEVEL": {
+        "getStockCount": """
+            SELECT COUNT(DISTINCT(s_i_id)) FROM order_line, stock_state
+            WHERE
+                ol_w_id = %s AND
+                ol_d_id = %s AND
+                ol_o_id >= %s AND
+                s_w_id = %s AND
+                s_i_id = ol_i_id AND
+                s_quantity < %s;
+        """,
+    },
+}
+
+## Creates and seeds the tables used in snapshot mode
+SNAPSHOT_DDL = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "tpcc_snapshot.sql"))
+
+## Replacements for TXN_QUERIES in delivery queue mode, where the next undelivered order
+## of every district is found from the watermarks maintained by tpcc_delivery.sql
+DELIVERY_QUEUE_QUERIES = {
+    "DELIVERY": {
+        ## Concurrent deliveries of the same warehouse wait for each other here. This has
+        ## to be a statement of its own: FOR UPDATE in the INSERT below would only re-check
+        ## the locked watermark rows and not redo the join with orders, so the second
+        ## delivery would find no order for the districts the first one delivered
+        "lockWatermarks": "SELECT dw_d_id FROM delivery_watermark WHERE dw_w_id = %s ORDER BY dw_d_id FOR UPDATE", # w_id
+        ## Runs with a new snapshot once the locks are held, so it sees the new watermarks
+        "deliverNextNewOrders": """
+            INSERT INTO delivery_orders (dlo_delivery_d, dlo_w_id, dlo_o_id, dlo_d_id)
+            SELECT %s, dw_w_id, o_id, dw_d_id
+            FROM delivery_watermark
+            JOIN orders ON o_w_id = dw_w_id AND o_d_id = dw_d_id AND o_id = dw_next_o_id
+            WHERE dw_w_id = %s
+            RETURNING dlo_d_id, dlo_o_id
+        """, # dl_delivery_d, w_id
+    },
+}
+
+## Creates and seeds the watermarks used in delivery queue mode
+DELIVERY_QUEUE_DDL = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "tpcc_delivery.sql"))
+
+## In procedures mode every transaction is a single call to one of the functions
+## installed from tpcc_procedures.sql
+PROCEDURE_QUERIES = {
+    "DELIVERY": "SELECT * FROM tpcc_delivery(%s, %s, %s, %s)", # w_id, o_carrier_id, ol_delivery_d, districts
+    "NEW_ORDER": "SELECT * FROM tpcc_new_order(%s, %s, %s, %s, %s, %s, %s)", # w_id, d_id, c_id, o_entry_d, i_ids, i_w_ids, i_qtys
+    "ORDER_STATUS": "SELECT * FROM tpcc_order_status(%s, %s, %s, %s)", # w_id, d_id, c_id, c_last
+    "PAYMENT": "SELECT * FROM tpcc_payment(%s, %s, %s, %s, %s, %s, %s, %s)", # w_id, d_id, h_amount, c_w_id, c_d_id, c_id, c_last, h_date
+    "STOCK_LEVEL": "SELECT tpcc_stock_level(%s, %s, %s)", # w_id, d_id, threshold
+}
+PROCEDURES_DDL = os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "tpcc_procedures.sql"))
+
+## pg_prepared_statements only counts the plans since PostgreSQL 14
+PLAN_COUNTS_QUERY = "SELECT COALESCE(SUM(generic_plans), 0), COALESCE(SUM(custom_plans), 0) FROM pg_prepared_statements"
+PLAN_COUNTS_VERSION = 140000
+
+## ----------------------------------------------
+## prepareStatement
+## ----------------------------------------------
+def prepareStatement(cursor, idx, query):
+    """PREPARE the given query as a server-side statement and return the EXECUTE
+    that runs it with the same parameters"""
+    name = "tpcc_%d" % idx
+    num_params = query.count("%s")
+    for i in range(num_params):
+        query = query.replace("%s", "$%d" % (i + 1), 1)
+    cursor.execute("PREPARE %s AS %s" % (name, query))
+    if num_params == 0: return "EXECUTE %s" % name
+    return "EXECUTE %s (%s)" % (name, ", ".join(["%s"] * num_params))
+## DEF
+
+## ----------------------------------------------
+## statementStats
+## ----------------------------------------------
+def statementStats(conn, cursor, statements):
+    """Return the counters of the StatementCache, along with the number of generic and
+    custom plans that the server made for them if it keeps track of that"""
+    stats = statements.stats()
+    if conn.server_version >= PLAN_COUNTS_VERSION:
+        cursor.execute(PLAN_COUNTS_QUERY)
+        stats["generic_plans"], stats["custom_plans"] = map(int, cursor.fetchone())
+        conn.commit()
+    return stats
+## DEF
+
+LOAD_QUERIES = {
+    "getForeignKeys": """
+        SELECT con.conname, tc.relname, pg_get_constraintdef(con.oid)
+        FROM pg_constraint con
+        JOIN pg_class tc ON tc.oid = con.conrelid
+        JOIN pg_namespace ns ON ns.oid = tc.relnamespace
+        WHERE ns.nspname = %s AND con.contype = 'f'
+    """, # schema
+    "getIndexes": """
+        SELECT ic.relname, tc.relname, pg_get_indexdef(ix.indexrelid)
+        FROM pg_index ix
+        JOIN pg_class ic ON ic.oid = ix.indexrelid
+        JOIN pg_class tc ON tc.oid = ix.indrelid
+        JOIN pg_namespace ns ON ns.oid = tc.relnamespace
+        WHERE ns.nspname = %s AND NOT ix.indisprimary AND NOT ix.indisunique
+    """, # schema
+    "createDeferredTable": "CREATE TABLE tpcc_deferred_ddl (name varchar(128) PRIMARY KEY, tablename varchar(128), kind char(1), definition text)",
+    "lockDeferred": "LOCK TABLE tpcc_deferred_ddl IN EXCLUSIVE MODE",
+    ## Every loader holds a shared advisory lock until it is done. Session locks go away with
+    ## the connection, so loaders that died in an interrupted load are not waited for
+    "joinLoaders": "SELECT pg_advisory_lock_shared(%s)", # key
+    "leaveLoaders": "SELECT pg_advisory_unlock_shared(%s)", # key
+    "tryLastLoader": "SELECT pg_try_advisory_lock(%s)", # key
+    "releaseLastLoader": "SELECT pg_advisory_unlock(%s)", # key
+    ## CREATE OR REPLACE FUNCTION fails when another loader replaces the same function
+    "lockProcedures": "SELECT pg_advisory_xact_lock(%s)", # key
+    "insertDeferred": "INSERT INTO tpcc_deferred_ddl VALUES (%s, %s, %s, %s)", # name, tablename, kind, definition
+    "getDeferred": "SELECT name, tablename, kind, definition FROM tpcc_deferred_ddl ORDER BY kind DESC", # indexes ('i') before foreign keys ('f')
+    "clearDeferred": "DELETE FROM tpcc_deferred_ddl",
+    
+    ## Next o_id of every district, so that NEW_ORDER and STOCK_LEVEL don't need MAX(o_id)
+    ## over the orders. It is updated in the NEW_ORDER transaction so it never has gaps
+    "createOrderCounter": """
+        DROP TABLE IF EXISTS district_order_counter;
+        CREATE TABLE district_order_counter AS (
+            SELECT d_w_id, d_id, COALESCE(MAX(o_id), 0) + 1 AS d_next_o_id
+            FROM district
+            LEFT JOIN orders ON o_w_id = d_w_id AND o_d_id = d_id
+            GROUP BY d_w_id, d_id
+        );
+        ALTER TABLE district_order_counter ADD PRIMARY KEY (d_w_id, d_id);
+    """,
+    
+    ## Remove the rows of a partially loaded unit, keyed by the kind of load unit
+    ## (see runtime/loader.py). Children come before their parents
+    "deleteUnit": {
+        "item": [
+            "DELETE FROM item WHERE i_id BETWEEN %s AND %s", # first_i_id, last_i_id
+        ],
+        "stock": [
+            "DELETE FROM stock_history WHERE sh_s_w_id = %s", # w_id
+            "DELETE FROM stock WHERE s_w_id = %s", # w_id
+            "DELETE FROM warehouse WHERE w_id = %s", # w_id
+        ],
+        "district": [
+            "DELETE FROM order_line WHERE ol_w_id = %s", # w_id
+            "DELETE FROM orders WHERE o_w_id = %s", # w_id
+            "DELETE FROM history WHERE h_c_w_id = %s", # w_id
+            "DELETE FROM customer_history WHERE ch_c_w_id = %s", # w_id
+            "DELETE FROM customer WHERE c_w_id = %s", # w_id
+            "DELETE FROM district WHERE d_w_id = %s", # w_id
+        ],
+        "delivery": [
+            "DELETE FROM delivery_orders WHERE dlo_w_id = %s", # w_id
+            "DELETE FROM delivery WHERE dl_w_id = %s", # w_id
+        ],
+    },
+}
+
+## Advisory lock key shared by all of the loaders of a database
+LOAD_LOCK_KEY = 7470636301
+PROCEDURES_LOCK_KEY = LOAD_LOCK_KEY + 1
+
+## Used by compact(). The views only read the latest event of each key from these
+## tables, so every older event can be deleted without changing what they return
+COMPACT_QUERIES = {
+    "getWarehouses": "SELECT w_id FROM warehouse ORDER BY w_id",
+    "getMaxItemId": "SELECT MAX(i_id) FROM item",
+    "getMaxCustomerId": "SELECT MAX(c_id) FROM customer WHERE c_w_id = %s AND c_d_id = 1", # w_id
+    "getSize": "SELECT pg_total_relation_size(%s), reltuples FROM pg_class WHERE oid = %s::regclass", # table, table
+    "compact": {
+        "stock_history": """
+            DELETE FROM stock_history sh
+            USING (
+                SELECT sh_s_w_id, sh_s_i_id, MAX(sh_date) AS sh_last_date
+                FROM stock_history
+                WHERE sh_s_w_id = %s
+                GROUP BY sh_s_w_id, sh_s_i_id
+                HAVING COUNT(*) > 1
+            ) latest
+            WHERE sh.sh_s_w_id = latest.sh_s_w_id AND sh.sh_s_i_id = latest.sh_s_i_id AND sh.sh_date < latest.sh_last_date
+        """, # w_id
+        "customer_history": """
+            DELETE FROM customer_history ch
+            USING (
+                SELECT ch_c_w_id, ch_c_d_id, ch_c_id, MAX(ch_date) AS ch_last_date
+                FROM customer_history
+                WHERE ch_c_w_id = %s
+                GROUP BY ch_c_w_id, ch_c_d_id, ch_c_id
+                HAVING COUNT(*) > 1
+            ) latest
+            WHERE ch.ch_c_w_id = latest.ch_c_w_id AND ch.ch_c_d_id = latest.ch_c_d_id AND ch.ch_c_id = latest.ch_c_id
+              AND ch.ch_date < latest.ch_last_date
+        """, # w_id
+    },
+}
+
+## Number of random lookups timed before and after each compaction
+COMPACT_PROBE_SIZE = 50
+
 REPORT_MODE = True
 
+## ==============================================
+## COPY text format
+## ==============================================
+def copyString(value):
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def copyBool(value):
+    return "t" if value else "f"
+
+def copyNull(value):
+    return "\\N"
+
+def copyTimestamp(value):
+    return value.isoformat()
+
+def copyUnicode(value):
+    return copyString(value.encode("utf-8"))
+
+COPY_FORMATTERS = {
+    bool: copyBool,
+    int: str,
+    long: str,
+    float: repr,
+    str: copyString,
+    unicode: copyUnicode,
+    datetime: copyTimestamp,
+    type(None): copyNull,
+}
+
+def copyFormat(value):
+    """Format a single value for PostgreSQL's COPY text format"""
+    formatter = COPY_FORMATTERS.get(type(value), None)
+    if formatter == None: return copyString(str(value))
+    return formatter(value)
+## DEF
+
 
 ## ==============================================
 ## PostgresDriver
@@ -101,6 +358,13 @@ class PostgresDriver(AbstractDriver):
     DEFAULT_CONFIG = {
         "database": ("The connection string to the PostgreSQL database", "host=localhost dbname=tpcc" ),
         "schema": ("The schema in PostgreSQL database", "public" ),
+        "copy": ("Load the data with COPY FROM STDIN instead of INSERT", True ),
+        "defer_indexes": ("Drop the secondary indexes and foreign keys while loading and rebuild them at the end", False ),
+        "snapshot": ("Read the current stock and customer state from tables kept up to date by triggers instead of the views (must also be set when loading)", False ),
+        "delivery_queue": ("Find the next undelivered order of every district in one statement using per-district watermarks kept up to date by a trigger (must also be set when loading)", False ),
+        "procedures": ("Run every transaction as a single call to a PL/pgSQL function that reads the views (must also be set when loading)", False ),
+        "batch": ("Read the items and stock of a NEW_ORDER with one query each and insert its order lines and stock events with one statement each", False ),
+        "prepare": ("PREPARE every transaction query on the server when the execution starts and run them by name", False ),
     }
     
     def __init__(self, ddl):
@@ -108,6 +372,9 @@ class PostgresDriver(AbstractDriver):
         self.database = None
         self.conn = None
         self.cursor = None
+        self.inUnit = False
+        self.statements = None
+        self.districtQueries = { }
     
     ## ----------------------------------------------
     ## makeDefaultConfig
@@ -126,6 +393,21 @@ class PostgresDriver(AbstractDriver):
         self.schema = config["schema"]
 
         self.reset = bool(config["reset"])
+        self.copy = parseBool(config["copy"])
+        self.defer_indexes = parseBool(config["defer_indexes"])
+        self.snapshot = parseBool(config["snapshot"])
+        self.delivery_queue = parseBool(config["delivery_queue"])
+        self.procedures = parseBool(config["procedures"])
+        self.batch = parseBool(config["batch"])
+        self.prepare = parseBool(config["prepare"])
+        ## The functions in tpcc_procedures.sql always read the views and scan the orders
+        assert not (self.procedures and (self.snapshot or self.delivery_queue)), \
+            "The procedures can't be combined with the snapshot or delivery_queue modes"
+        self.queries = TXN_QUERIES
+        if self.snapshot:
+            self.queries = dict([ (txn, dict(self.queries[txn], **SNAPSHOT_QUERIES.get(txn, { }))) for txn in self.queries ])
+        if self.delivery_queue:
+            self.queries = dict([ (txn, dict(self.queries[txn], **DELIVERY_QUEUE_QUERIES.get(txn, { }))) for txn in self.queries ])
 
         self.output = bool(config["output"])
                     
@@ -149,22 +431,160 @@ class PostgresDriver(AbstractDriver):
             logging.debug("Loading DDL file '%s'" % (self.ddl))
             self.cursor.execute("CREATE DOMAIN TINYINT AS SMALLINT")
             self.cursor.execute(open(self.ddl, "r").read())
+            self.cursor.execute(LOAD_QUERIES["createDeferredTable"])
             self.conn.commit()
 
+        if self.procedures:
+            self.installProcedures()
+
+        ## The last loader to finish does the work that needs all of the data
+        self.cursor.execute(LOAD_QUERIES["joinLoaders"], [LOAD_LOCK_KEY])
+        if self.defer_indexes:
+            self.dropDeferredIndexes()
+
     ## ----------------------------------------------
     ## loadTuples
     ## ----------------------------------------------
     def loadTuples(self, tableName, tuples):
         if len(tuples) == 0: return
         
-        p = ["%s"]*len(tuples[0])
-        sql = "INSERT INTO %s VALUES (%s)" % (tableName, ",".join(p))
-        self.cursor.executemany(sql, tuples)
-        self.conn.commit()
+        if self.copy:
+            self.copyColumns(tableName, zip(*tuples))
+        else:
+            p = ["%s"]*len(tuples[0])
+            sql = "INSERT INTO %s VALUES (%s)" % (tableName, ",".join(p))
+            self.cursor.executemany(sql, tuples)
+        if not self.inUnit: self.conn.commit()
 
         logging.debug("Loaded %d tuples for tableName %s" % (len(tuples), tableName))
         return
 
+    ## ----------------------------------------------
+    ## supportsLoadColumns
+    ## ----------------------------------------------
+    def supportsLoadColumns(self):
+        return self.copy
+
+    ## ----------------------------------------------
+    ## loadColumns
+    ## ----------------------------------------------
+    def loadColumns(self, tableName, columns):
+        if len(columns) == 0 or len(columns[0]) == 0: return
+
+        self.copyColumns(tableName, columns)
+        if not self.inUnit: self.conn.commit()
+
+        logging.debug("Loaded %d tuples for tableName %s" % (len(columns[0]), tableName))
+        return
+
+    ## ----------------------------------------------
+    ## loadStartUnit
+    ## ----------------------------------------------
+    def loadStartUnit(self, unit):
+        """Load units are committed as a single transaction, after deleting anything
+        an earlier, interrupted attempt at the same unit managed to commit"""
+        self.conn.commit()
+        for sql in LOAD_QUERIES["deleteUnit"][unit[0]]:
+            self.cursor.execute(sql, unit[1:sql.count("%s")+1])
+        self.inUnit = True
+
+    ## ----------------------------------------------
+    ## loadFinishUnit
+    ## ----------------------------------------------
+    def loadFinishUnit(self, unit):
+        self.conn.commit()
+        self.inUnit = False
+
+    ## ----------------------------------------------
+    ## copyColumns
+    ## ----------------------------------------------
+    def copyColumns(self, tableName, columns):
+        """Send a batch to the server with a single COPY FROM STDIN.
+        Each column is formatted on its own and the rows are assembled
+        in memory, so nothing touches the disk."""
+        text = [ map(copyFormat, column) for column in columns ]
+        buf = StringIO()
+        for row in zip(*text):
+            buf.write("\t".join(row))
+            buf.write("\n")
+        ## FOR
+        buf.seek(0)
+        self.cursor.copy_expert("COPY %s FROM STDIN" % tableName, buf)
+
+    ## ----------------------------------------------
+    ## dropDeferredIndexes
+    ## ----------------------------------------------
+    def dropDeferredIndexes(self):
+        """Save the definitions of the secondary indexes and foreign keys and
+        drop them, so that they are built once over the loaded data instead of
+        being maintained for every row. The last of the parallel loaders to
+        finish rebuilds them."""
+        self.cursor.execute(LOAD_QUERIES["lockDeferred"])
+
+        ## Foreign keys have to go first since they depend on the indexes
+        self.cursor.execute(LOAD_QUERIES["getForeignKeys"], [self.schema])
+        for name, table, definition in self.cursor.fetchall():
+            self.cursor.execute(LOAD_QUERIES["insertDeferred"], [name, table, 'f', definition])
+            self.cursor.execute("ALTER TABLE %s DROP CONSTRAINT %s" % (table, name))
+        ## FOR
+        self.cursor.execute(LOAD_QUERIES["getIndexes"], [self.schema])
+        for name, table, definition in self.cursor.fetchall():
+            self.cursor.execute(LOAD_QUERIES["insertDeferred"], [name, table, 'i', definition])
+            self.cursor.execute("DROP INDEX %s" % name)
+        ## FOR
+        self.conn.commit()
+
+    ## ----------------------------------------------
+    ## rebuildDeferredIndexes
+    ## ----------------------------------------------
+    def rebuildDeferredIndexes(self):
+        self.cursor.execute(LOAD_QUERIES["lockDeferred"])
+        self.cursor.execute(LOAD_QUERIES["getDeferred"])
+        for name, table, kind, definition in self.cursor.fetchall():
+            start = time.time()
+            if kind == 'i':
+                self.cursor.execute(definition)
+            else:
+                self.cursor.execute("ALTER TABLE %s ADD CONSTRAINT %s %s" % (table, name, definition))
+            logging.info("Rebuilt %s on %s in %.2f sec" % (name, table, time.time() - start))
+        ## FOR
+        self.cursor.execute(LOAD_QUERIES["clearDeferred"])
+        self.conn.commit()
+
+    ## ----------------------------------------------
+    ## buildSnapshot
+    ## ----------------------------------------------
+    def buildSnapshot(self):
+        """Seed the current-state tables from the views and install the triggers
+        that keep them up to date"""
+        logging.info("Building the snapshot tables from '%s'" % SNAPSHOT_DDL)
+        start = time.time()
+        self.cursor.execute(open(SNAPSHOT_DDL, "r").read())
+        self.conn.commit()
+        logging.info("Built the snapshot tables in %.2f sec" % (time.time() - start))
+
+    ## ----------------------------------------------
+    ## installProcedures
+    ## ----------------------------------------------
+    def installProcedures(self):
+        """Create or replace the PL/pgSQL functions of the five transactions"""
+        logging.debug("Installing the transaction procedures from '%s'" % PROCEDURES_DDL)
+        self.cursor.execute(LOAD_QUERIES["lockProcedures"], [PROCEDURES_LOCK_KEY])
+        self.cursor.execute(open(PROCEDURES_DDL, "r").read())
+        self.conn.commit()
+
+    ## ----------------------------------------------
+    ## buildDeliveryQueue
+    ## ----------------------------------------------
+    def buildDeliveryQueue(self):
+        """Seed the delivered watermarks from delivery_orders and install the
+        trigger that moves them forward"""
+        logging.info("Building the delivery watermarks from '%s'" % DELIVERY_QUEUE_DDL)
+        start = time.time()
+        self.cursor.execute(open(DELIVERY_QUEUE_DDL, "r").read())
+        self.conn.commit()
+        logging.info("Built the delivery watermarks in %.2f sec" % (time.time() - start))
+
     ## ----------------------------------------------
     ## loadFinish
     ## ----------------------------------------------
@@ -172,11 +592,145 @@ class PostgresDriver(AbstractDriver):
         logging.info("Commiting changes to database")
         self.conn.commit()
 
+        self.cursor.execute(LOAD_QUERIES["leaveLoaders"], [LOAD_LOCK_KEY])
+        self.cursor.execute(LOAD_QUERIES["tryLastLoader"], [LOAD_LOCK_KEY])
+        if not self.cursor.fetchone()[0]:
+            logging.info("Leaving the end of the load to the loaders still running")
+            self.conn.commit()
+            return
+
+        if self.defer_indexes:
+            self.rebuildDeferredIndexes()
+        self.cursor.execute(LOAD_QUERIES["createOrderCounter"])
+        self.conn.commit()
+        if self.snapshot:
+            self.buildSnapshot()
+        if self.delivery_queue:
+            self.buildDeliveryQueue()
+
+        self.cursor.execute(LOAD_QUERIES["releaseLastLoader"], [LOAD_LOCK_KEY])
+        self.conn.commit()
+
+    ## ----------------------------------------------
+    ## executeStart
+    ## ----------------------------------------------
+    def executeStart(self):
+        if not self.prepare: return
+        self.statements = StatementCache(self.cursor, lambda idx, query: prepareStatement(self.cursor, idx, query))
+        for txn in self.queries:
+            for query in self.queries[txn].values():
+                ## The multi-row inserts of execute_values() have a different text every time
+                if query.find("VALUES %s") != -1:
+                    continue
+                if query.find("{}") != -1:
+                    for d_id in range(1, constants.DISTRICTS_PER_WAREHOUSE+1):
+                        self.statements.prepare(self.districtQuery(query, d_id))
+                else:
+                    self.statements.prepare(query)
+            ## FOR
+        ## FOR
+        if self.procedures:
+            for query in PROCEDURE_QUERIES.values():
+                self.statements.prepare(query)
+        self.conn.commit()
+        logging.debug("Prepared %d statements in %.3f sec" % (len(self.statements.handles), self.statements.prepareTime))
+        self.cursor = self.statements
+
+    ## ----------------------------------------------
+    ## executeFinish
+    ## ----------------------------------------------
+    def executeFinish(self):
+        if self.statements == None: return
+        self.cursor = self.statements.cursor
+        logging.info(formatStats(statementStats(self.conn, self.cursor, self.statements)))
+
+    ## ----------------------------------------------
+    ## districtQuery
+    ## ----------------------------------------------
+    def districtQuery(self, query, d_id):
+        """Return the text of a query that reads the s_dist_XX column of the given district"""
+        key = (query, d_id)
+        if not key in self.districtQueries:
+            self.districtQueries[key] = SQL(query).format(Identifier('s_dist_%02d'%d_id)).as_string(self.conn)
+        return self.districtQueries[key]
+
+    ## ----------------------------------------------
+    ## compact
+    ## ----------------------------------------------
+    def compact(self):
+        """Delete the stock_history and customer_history events that have been superseded
+        by a newer one for the same key, one warehouse per transaction, then VACUUM the
+        tables so that the space is reused instead of the tables growing without end."""
+        q = COMPACT_QUERIES
+        start = time.time()
+        self.cursor.execute(q["getWarehouses"])
+        w_ids = [ row[0] for row in self.cursor.fetchall() ]
+        self.conn.commit()
+        
+        stats = { "tables": { }, "probe_before": self.probe(w_ids) }
+        for table in sorted(q["compact"].keys()):
+            self.cursor.execute(q["getSize"], [table, table])
+            size, tuples = self.cursor.fetchone()
+            rows = 0
+            for w_id in w_ids:
+                self.cursor.execute(q["compact"][table], [w_id])
+                rows += self.cursor.rowcount
+                self.conn.commit()
+            ## FOR
+            
+            ## VACUUM can't run inside a transaction
+            self.conn.autocommit = True
+            self.cursor.execute("VACUUM %s" % table)
+            self.conn.autocommit = False
+            
+            self.cursor.execute(q["getSize"], [table, table])
+            stats["tables"][table] = {
+                "rows": rows,
+                "bytes": self.cursor.fetchone()[0],
+                "bytes_freed": int(size * min(1.0, rows / tuples)) if tuples > 0 else 0,
+            }
+            self.conn.commit()
+        ## FOR
+        stats["probe_after"] = self.probe(w_ids)
+        stats["duration"] = time.time() - start
+        return stats
+
+    ## ----------------------------------------------
+    ## probe
+    ## ----------------------------------------------
+    def probe(self, w_ids):
+        """Average milliseconds taken by the NEW_ORDER stock lookup and the PAYMENT
+        customer lookup for COMPACT_PROBE_SIZE random keys"""
+        q = COMPACT_QUERIES
+        self.cursor.execute(q["getMaxItemId"])
+        max_i_id = self.cursor.fetchone()[0]
+        self.cursor.execute(q["getMaxCustomerId"], [w_ids[0]])
+        max_c_id = self.cursor.fetchone()[0]
+        
+        stockInfo = SQL(self.queries["NEW_ORDER"]["getStockInfo"]).format(Identifier('s_dist_01'))
+        lookups = {
+            "getStockInfo": (stockInfo, lambda: [rand.number(1, max_i_id), w_ids[rand.number(0, len(w_ids)-1)]]),
+            "getCustomer": (self.queries["PAYMENT"]["getCustomerByCustomerId"], \
+                            lambda: [w_ids[rand.number(0, len(w_ids)-1)], rand.number(1, constants.DISTRICTS_PER_WAREHOUSE), rand.number(1, max_c_id)]),
+        }
+        ret = { }
+        for name, (sql, makeParams) in lookups.items():
+            start = time.time()
+            for i in range(COMPACT_PROBE_SIZE):
+                self.cursor.execute(sql, makeParams())
+                self.cursor.fetchall()
+            ## FOR
+            ret[name] = (time.time() - start) * 1000.0 / COMPACT_PROBE_SIZE
+        ## FOR
+        self.conn.commit()
+        return ret
+
     ## ----------------------------------------------
     ## doDelivery
     ## ----------------------------------------------
     def doDelivery(self, params):
-        q = TXN_QUERIES["DELIVERY"]
+        if self.procedures: return self.callDelivery(params)
+        q = self.queries["DELIVERY"]
         result = []
         
         ol_delivery_d = params["ol_delivery_d"]
@@ -184,6 +738,15 @@ class PostgresDriver(AbstractDriver):
         o_carrier_id = params["o_carrier_id"]
 
         self.cursor.execute(q["insertDeliveryEvent"], [ol_delivery_d, w_id, o_carrier_id])
+        if self.delivery_queue:
+            ## Districts without an undelivered order are skipped, as below
+            self.cursor.execute(q["lockWatermarks"], [w_id])
+            self.cursor.execute(q["deliverNextNewOrders"], [ol_delivery_d, w_id])
+            result = sorted(self.cursor.fetchall())
+            self.conn.commit()
+            return result
+        ## IF
+
         for d_id in range(1, constants.DISTRICTS_PER_WAREHOUSE+1):
             self.cursor.execute(q["getNextNewOrder"], [d_id, w_id])
             nextOrder = self.cursor.fetchone()
@@ -206,7 +769,9 @@ class PostgresDriver(AbstractDriver):
     ## doNewOrder
     ## ----------------------------------------------
     def doNewOrder(self, params):
-        q = TXN_QUERIES["NEW_ORDER"]
+        if self.procedures: return self.callNewOrder(params)
+        if self.batch: return self.doNewOrderBatch(params)
+        q = self.queries["NEW_ORDER"]
         
         w_id = params["w_id"]
         d_id = params["d_id"]
@@ -247,7 +812,9 @@ class PostgresDriver(AbstractDriver):
         district_info = self.cursor.fetchone()
         d_tax = district_info[0]
 
-        self.cursor.execute(q["getOId"], [d_id, w_id])
+        ## Taking the district's counter row also serializes the NEW_ORDERs of the district,
+        ## so they can't pick the same o_id and abort on the primary key
+        self.cursor.execute(q["getNextOId"], [d_id, w_id])
         d_next_o_id = self.cursor.fetchone()[0]
 
         self.cursor.execute(q["getCustomer"], [w_id, d_id, c_id])
@@ -271,7 +838,7 @@ class PostgresDriver(AbstractDriver):
             ol_i_id = i_ids[i]
             ol_quantity = i_qtys[i]
 
-            self.cursor.execute(SQL(q["getStockInfo"]).format(Identifier('s_dist_%02d'%d_id)), [ol_i_id, ol_supply_w_id])
+            self.cursor.execute(self.districtQuery(q["getStockInfo"], d_id), [ol_i_id, ol_supply_w_id])
             stockInfo = self.cursor.fetchone()
             s_quantity = stockInfo[0]
             s_data = stockInfo[1]
@@ -314,11 +881,126 @@ class PostgresDriver(AbstractDriver):
         
         return result
 
+    ## ----------------------------------------------
+    ## doNewOrderBatch
+    ## ----------------------------------------------
+    def doNewOrderBatch(self, params):
+        """Same as doNewOrder, but with one round trip for all of the items, one for all
+        of the stock rows and one for each of the multi-row inserts"""
+        q = self.queries["NEW_ORDER"]
+        
+        w_id = params["w_id"]
+        d_id = params["d_id"]
+        c_id = params["c_id"]
+        o_entry_d = params["o_entry_d"]
+        i_ids = params["i_ids"]
+        i_w_ids = params["i_w_ids"]
+        i_qtys = params["i_qtys"]
+            
+        assert len(i_ids) > 0
+        assert len(i_ids) == len(i_w_ids)
+        assert len(i_ids) == len(i_qtys)
+
+        all_local = all([ i_w_id == w_id for i_w_id in i_w_ids ])
+        self.cursor.execute(q["getItemInfoBatch"], [list(set(i_ids))])
+        items = dict([ (row[0], row[1:]) for row in self.cursor.fetchall() ])
+
+        ## TPCC defines 1% of neworder gives a wrong itemid, causing rollback.
+        ## Note that this will happen with 1% of transactions on purpose.
+        for i_id in i_ids:
+            if not i_id in items:
+                self.conn.rollback()
+                return
+        ## FOR
+
+        self.cursor.execute(q["getWarehouseTaxRate"], [w_id])
+        w_tax = self.cursor.fetchone()[0]
+        
+        self.cursor.execute(q["getDistrict"], [d_id, w_id])
+        district_info = self.cursor.fetchone()
+        d_tax = district_info[0]
+
+        self.cursor.execute(q["getNextOId"], [d_id, w_id])
+        d_next_o_id = self.cursor.fetchone()[0]
+
+        self.cursor.execute(q["getCustomer"], [w_id, d_id, c_id])
+        customer_info = self.cursor.fetchone()
+        c_discount = customer_info[0]
+        
+        ## ----------------
+        ## Insert Order Information
+        ## ----------------
+        o_ol_cnt = len(i_ids)
+        self.cursor.execute(q["insertNewOrderEvent"], [d_next_o_id, d_id, w_id, c_id, o_ol_cnt, all_local, o_entry_d])
+
+        ## ----------------
+        ## Insert Order Item Information
+        ## ----------------
+        ## ANY() on both columns returns every combination of the items and the supplying
+        ## warehouses, but only the pairs of the order are looked at
+        self.cursor.execute(self.districtQuery(q["getStockInfoBatch"], d_id), [list(set(i_ids)), list(set(i_w_ids))])
+        stock = dict([ ((row[0], row[1]), row[2:]) for row in self.cursor.fetchall() ])
+
+        item_data = [ ]
+        stock_rows = [ ]
+        order_line_rows = [ ]
+        total = 0
+        for i in range(len(i_ids)):
+            ol_number = i + 1
+            ol_supply_w_id = i_w_ids[i]
+            ol_i_id = i_ids[i]
+            ol_quantity = i_qtys[i]
+
+            ## The executor never repeats an item within an order, so every line has its own stock row
+            stockInfo = stock[(ol_i_id, ol_supply_w_id)]
+            s_quantity = stockInfo[0]
+            s_data = stockInfo[1]
+            ol_dist_info = stockInfo[2]
+
+            ## Update stock
+            if s_quantity >= ol_quantity + 10:
+                s_quantity = s_quantity - ol_quantity
+            else:
+                s_quantity = s_quantity + 91 - ol_quantity
+            stock_rows.append( (ol_i_id, ol_supply_w_id, o_entry_d, s_quantity) )
+
+            itemInfo = items[ol_i_id]
+            i_price = itemInfo[0]
+            i_name = itemInfo[1]
+            i_data = itemInfo[2]
+
+            ol_amount = ol_quantity * i_price
+            order_line_rows.append( (d_next_o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, ol_quantity, ol_amount, ol_dist_info) )
+
+            if i_data.find(constants.ORIGINAL_STRING) != -1 and s_data.find(constants.ORIGINAL_STRING) != -1:
+                brand_generic = 'B'
+            else:
+                brand_generic = 'G'
+
+            total += ol_amount
+
+            item_data.append( (i_name, s_quantity, brand_generic, i_price, ol_amount) )
+        ## FOR
+
+        execute_values(self.cursor, q["updateStockBatch"], stock_rows, page_size=len(stock_rows))
+        execute_values(self.cursor, q["insertOrderLineBatch"], order_line_rows, page_size=len(order_line_rows))
+        
+        ## Commit!
+        self.conn.commit()
+
+        total *= (1 - c_discount) * (1 + w_tax + d_tax)
+
+        misc = [ (w_tax, d_tax, d_next_o_id, total) ]
+        result = [ customer_info, misc, item_data ]
+        
+        return result
+
     ## ----------------------------------------------
     ## doOrderStatus
     ## ----------------------------------------------
     def doOrderStatus(self, params):
-        q = TXN_QUERIES["ORDER_STATUS"]
+        if self.procedures: return self.callOrderStatus(params)
+        q = self.queries["ORDER_STATUS"]
         
         w_id = params["w_id"]
         d_id = params["d_id"]
@@ -358,7 +1040,8 @@ class PostgresDriver(AbstractDriver):
     ## doPayment
     ## ----------------------------------------------    
     def doPayment(self, params):
-        q = TXN_QUERIES["PAYMENT"]
+        if self.procedures: return self.callPayment(params)
+        q = self.queries["PAYMENT"]
         result = []
 
         w_id = params["w_id"]
@@ -416,7 +1099,8 @@ class PostgresDriver(AbstractDriver):
     ## doStockLevel
     ## ----------------------------------------------    
     def doStockLevel(self, params):
-        q = TXN_QUERIES["STOCK_LEVEL"]
+        if self.procedures: return self.callStockLevel(params)
+        q = self.queries["STOCK_LEVEL"]
 
         w_id = params["w_id"]
         d_id = params["d_id"]
@@ -433,5 +1117,62 @@ class PostgresDriver(AbstractDriver):
         self.conn.commit()
         
         return int(result[0])
+
+    ## ----------------------------------------------
+    ## Procedures mode
+    ## The call* methods return the same results as the matching do* methods
+    ## ----------------------------------------------
+    def callDelivery(self, params):
+        self.cursor.execute(PROCEDURE_QUERIES["DELIVERY"], [params["w_id"], params["o_carrier_id"], params["ol_delivery_d"], constants.DISTRICTS_PER_WAREHOUSE])
+        result = [ tuple(row) for row in self.cursor.fetchall() ]
+        self.conn.commit()
+        return result
+
+    def callNewOrder(self, params):
+        assert len(params["i_ids"]) > 0
+        assert len(params["i_ids"]) == len(params["i_w_ids"])
+        assert len(params["i_ids"]) == len(params["i_qtys"])
+
+        self.cursor.execute(PROCEDURE_QUERIES["NEW_ORDER"], [params["w_id"], params["d_id"], params["c_id"], params["o_entry_d"], params["i_ids"], params["i_w_ids"], params["i_qtys"]])
+        (c_discount, c_last, c_credit, w_tax, d_tax, d_next_o_id, total,
+         i_names, s_quantities, brand_generics, i_prices, ol_amounts) = self.cursor.fetchone()
+
+        ## An unknown item: nothing was written
+        if d_next_o_id == None:
+            self.conn.rollback()
+            return
+        self.conn.commit()
+
+        customer_info = (c_discount, c_last, c_credit)
+        misc = [ (w_tax, d_tax, d_next_o_id, total) ]
+        item_data = zip(i_names, s_quantities, brand_generics, i_prices, ol_amounts)
+        return [ customer_info, misc, item_data ]
+
+    def callOrderStatus(self, params):
+        assert params["w_id"], pformat(params)
+        assert params["d_id"], pformat(params)
+
+        self.cursor.execute(PROCEDURE_QUERIES["ORDER_STATUS"], [params["w_id"], params["d_id"], params["c_id"], params["c_last"]])
+        row = self.cursor.fetchone()
+        self.conn.commit()
+
+        customer = row[0:5]
+        order = row[5:8] if row[5] != None else None
+        orderLines = zip(*[ column or [ ] for column in row[8:13] ])
+        return [ customer, order, orderLines ]
+
+    def callPayment(self, params):
+        self.cursor.execute(PROCEDURE_QUERIES["PAYMENT"], [params["w_id"], params["d_id"], params["h_amount"], params["c_w_id"], params["c_d_id"], params["c_id"], params["c_last"], params["h_date"]])
+        row = self.cursor.fetchone()
+        self.conn.commit()
+
+        return [ row[0:6], row[6:12], row[12:27] ]
+
+    def callStockLevel(self, params):
+        self.cursor.execute(PROCEDURE_QUERIES["STOCK_LEVEL"], [params["w_id"], params["d_id"], params["threshold"]])
+        result = self.cursor.fetchone()
+        self.conn.commit()
+
+        return int(result[0])
         
 ## CLASS
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+from __future__ import with_statement
+
+import logging
+from pprint import pprint,pformat
+
+import constants
+from postgresdriver import PostgresDriver
+
+## ----------------------------------------------
+## pipeline
+## ----------------------------------------------
+def pipeline(queries):
+    """Combine independent statements from TXN_QUERIES into a single one, so that they
+    are sent to the server in one round trip. Takes a list of (query, params) pairs and
+    returns the combined (query, params). The statements that write go into the WITH
+    clause and the SELECTs are joined as derived tables. The result has the columns of
+    every SELECT and RETURNING, in the given order. All but one of them must return
+    exactly one row."""
+    withs = [ ]
+    withParams = [ ]
+    tables = [ ]
+    tableParams = [ ]
+    for i in range(len(queries)):
+        query, params = queries[i]
+        query = query.strip().rstrip(";")
+        name = "q%d" % i
+        if query.split(None, 1)[0].upper() == "SELECT":
+            tables.append("(%s) AS %s" % (query, name))
+            tableParams.extend(params)
+        else:
+            withs.append("%s AS (%s)" % (name, query))
+            withParams.extend(params)
+            if query.upper().find("RETURNING") != -1:
+                tables.append(name)
+    ## FOR
+    assert len(tables) > 0
+    combined = "SELECT * FROM %s" % ", ".join(tables)
+    if len(withs) > 0:
+        combined = "WITH %s %s" % (", ".join(withs), combined)
+    return (combined, withParams + tableParams)
+## DEF
+
+## ----------------------------------------------
+## multiValues
+## ----------------------------------------------
+def multiValues(cursor, query, rows):
+    """Return the text of a "VALUES %s" insert with all of the given rows"""
+    return query.replace("%s", ", ".join([ cursor.mogrify("%s", [ tuple(row) ]) for row in rows ]))
+## DEF
+
+## ==============================================
+## PostgrespipelineDriver
+## ==============================================
+class PostgrespipelineDriver(PostgresDriver):
+    """
+        The postgres driver with the independent statements of NEW_ORDER and PAYMENT
+        sent together, so that the server works through them without waiting for the
+        client in between. It runs the same TXN_QUERIES on the same schema and takes
+        the same configuration. The transactions that are not overridden here, and
+        all of them in procedures mode, are run by PostgresDriver.
+    """
+
+    def __init__(self, ddl):
+        super(PostgrespipelineDriver, self).__init__(ddl)
+        self.name = "postgrespipeline"
+        self.driver_name = "%sDriver" % self.name.title()
+
+    ## ----------------------------------------------
+    ## doNewOrder
+    ## ----------------------------------------------
+    def doNewOrder(self, params):
+        if self.procedures: return PostgresDriver.doNewOrder(self, params)
+        q = self.queries["NEW_ORDER"]
+        
+        w_id = params["w_id"]
+        d_id = params["d_id"]
+        c_id = params["c_id"]
+        o_entry_d = params["o_entry_d"]
+        i_ids = params["i_ids"]
+        i_w_ids = params["i_w_ids"]
+        i_qtys = params["i_qtys"]
+            
+        assert len(i_ids) > 0
+        assert len(i_ids) == len(i_w_ids)
+        assert len(i_ids) == len(i_qtys)
+
+        all_local = all([ i_w_id == w_id for i_w_id in i_w_ids ])
+        self.cursor.execute(q["getItemInfoBatch"], [list(set(i_ids))])
+        items = dict([ (row[0], row[1:]) for row in self.cursor.fetchall() ])
+
+        ## TPCC defines 1% of neworder gives a wrong itemid, causing rollback.
+        ## Note that this will happen with 1% of transactions on purpose.
+        for i_id in i_ids:
+            if not i_id in items:
+                self.conn.rollback()
+                return
+        ## FOR
+
+        ## The warehouse, the district, the next o_id and the customer in one go
+        self.cursor.execute(*pipeline([
+            (q["getWarehouseTaxRate"], [w_id]),
+            (q["getDistrict"], [d_id, w_id]),
+            (q["getNextOId"], [d_id, w_id]),
+            (q["getCustomer"], [w_id, d_id, c_id]),
+        ]))
+        row = self.cursor.fetchone()
+        assert row, pformat(params)
+        w_tax = row[0]
+        d_tax = row[1]
+        d_next_o_id = row[2]
+        customer_info = row[3:6]
+        c_discount = customer_info[0]
+        
+        ## Insert the order and read the stock of all of its lines in one go.
+        ## ANY() on both columns returns every combination of the items and the supplying
+        ## warehouses, but only the pairs of the order are looked at
+        o_ol_cnt = len(i_ids)
+        self.cursor.execute(*pipeline([
+            (q["insertNewOrderEvent"], [d_next_o_id, d_id, w_id, c_id, o_ol_cnt, all_local, o_entry_d]),
+            (self.districtQuery(q["getStockInfoBatch"], d_id), [list(set(i_ids)), list(set(i_w_ids))]),
+        ]))
+        stock = dict([ ((row[0], row[1]), row[2:]) for row in self.cursor.fetchall() ])
+
+        item_data = [ ]
+        stock_rows = [ ]
+        order_line_rows = [ ]
+        total = 0
+        for i in range(len(i_ids)):
+            ol_number = i + 1
+            ol_supply_w_id = i_w_ids[i]
+            ol_i_id = i_ids[i]
+            ol_quantity = i_qtys[i]
+
+            ## The executor never repeats an item within an order, so every line has its own stock row
+            stockInfo = stock[(ol_i_id, ol_supply_w_id)]
+            s_quantity = stockInfo[0]
+            s_data = stockInfo[1]
+            ol_dist_info = stockInfo[2]
+
+            ## Update stock
+            if s_quantity >= ol_quantity + 10:
+                s_quantity = s_quantity - ol_quantity
+            else:
+                s_quantity = s_quantity + 91 - ol_quantity
+            stock_rows.append( (ol_i_id, ol_supply_w_id, o_entry_d, s_quantity) )
+
+            itemInfo = items[ol_i_id]
+            i_price = itemInfo[0]
+            i_name = itemInfo[1]
+            i_data = itemInfo[2]
+
+            ol_amount = ol_quantity * i_price
+            order_line_rows.append( (d_next_o_id, d_id, w_id, ol_number, ol_i_id, ol_supply_w_id, ol_quantity, ol_amount, ol_dist_info) )
+
+            if i_data.find(constants.ORIGINAL_STRING) != -1 and s_data.find(constants.ORIGINAL_STRING) != -1:
+                brand_generic = 'B'
+            else:
+                brand_generic = 'G'
+
+            total += ol_amount
+
+            item_data.append( (i_name, s_quantity, brand_generic, i_price, ol_amount) )
+        ## FOR
+
+        ## Both of the multi-row inserts in one go
+        self.cursor.execute("; ".join([
+            multiValues(self.cursor, q["updateStockBatch"], stock_rows),
+            multiValues(self.cursor, q["insertOrderLineBatch"], order_line_rows),
+        ]))
+        
+        ## Commit!
+        self.conn.commit()
+
+        total *= (1 - c_discount) * (1 + w_tax + d_tax)
+
+        misc = [ (w_tax, d_tax, d_next_o_id, total) ]
+        result = [ customer_info, misc, item_data ]
+        
+        return result
+
+    ## ----------------------------------------------
+    ## doPayment
+    ## ----------------------------------------------    
+    def doPayment(self, params):
+        if self.procedures: return PostgresDriver.doPayment(self, params)
+        q = self.queries["PAYMENT"]
+
+        w_id = params["w_id"]
+        d_id = params["d_id"]
+        h_amount = params["h_amount"]
+        c_w_id = params["c_w_id"]
+        c_d_id = params["c_d_id"]
+        c_id = params["c_id"]
+        c_last = params["c_last"]
+        h_date = params["h_date"]
+
+        ## The warehouse, the district and the customer in one go. Looking the customer up
+        ## by last name returns several rows, so it is sent on its own
+        reads = [
+            (q["getWarehouse"], [w_id]),
+            (q["getDistrict"], [w_id, d_id]),
+        ]
+        if c_id != None:
+            reads.append((q["getCustomerByCustomerId"], [c_w_id, c_d_id, c_id]))
+        self.cursor.execute(*pipeline(reads))
+        row = self.cursor.fetchone()
+        assert row, pformat(params)
+        warehouse = row[0:6]
+        district = row[6:12]
+
+        if c_id != None:
+            customer = row[12:]
+        else:
+            # Get the midpoint customer's id
+            self.cursor.execute(q["getCustomersByLastName"], [c_w_id, c_d_id, c_last])
+            all_customers = self.cursor.fetchall()
+            assert len(all_customers) > 0
+            namecnt = len(all_customers)
+            index = (namecnt-1)/2
+            customer = all_customers[index]
+            c_id = customer[0]
+        assert len(customer) > 0
+
+        # Customer Credit Information
+        writes = [ ]
+        c_data = customer[14]
+        c_credit = customer[12]
+        if c_credit == constants.BAD_CREDIT:
+            newData = " ".join(map(str, [c_id, c_d_id, c_w_id, d_id, w_id, h_amount]))
+            c_data = (newData + "|" + c_data)
+            if len(c_data) > constants.MAX_C_DATA: c_data = c_data[:constants.MAX_C_DATA]
+            writes.append(self.cursor.mogrify(q["updateBCCustomer"], [c_id, c_d_id, c_w_id, h_date, c_data]))
+        else:
+            c_data = ""
+
+        # Concatenate w_name, four spaces, d_name
+        h_data = "%s    %s" % (warehouse[0], district[0])
+
+        # Create the history record, along with the new c_data
+        writes.append(self.cursor.mogrify(q["insertPaymentEvent"], [c_id, c_d_id, c_w_id, d_id, w_id, h_date, h_amount, h_data]))
+        self.cursor.execute("; ".join(writes))
+
+        self.conn.commit()
+
+        return [ warehouse, district, customer ]
+
+## CLASS
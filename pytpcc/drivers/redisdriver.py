@@ -2,6 +2,7 @@ import os, redis, time, sys
 from datetime import datetime
 from pprint import pprint,pformat
 from abstractdriver import *
+from util import partitioner
 
 #----------------------------------------------------------------------------
 # Redis TPC-C Driver
@@ -297,6 +298,278 @@ class RedisDriver(AbstractDriver):
 		'debug-order-status' : ("Show Order Status Performance", 'None'),
 		'debug-payment' : ("Show Payment Performance", 'None'),
 		'debug-stock-level' : ("Show Stock Level Performance", 'None'),
+		'lua-scripts' : ("Run each transaction as a single Lua script (EVALSHA) on its home node", 'False'),
+	}
+	
+	#------------------------------------------------------------------------
+	# Lua scripts of the 'lua-scripts' mode. Each TPC-C transaction is one
+	# EVALSHA on the node of its home warehouse, so it runs atomically and in
+	# a single round trip. The scripts use the same keys as the do*()
+	# methods. The nodes are separate servers (not a Redis Cluster), so the
+	# keys are built inside the scripts from the ids in ARGV.
+	#------------------------------------------------------------------------
+	SCRIPT_FUNCTIONS = '''
+		local function findCustomer(w_id, d_id, c_id, c_last)
+			if c_id ~= '' then
+				return w_id .. ':' .. d_id .. ':' .. c_id
+			end
+			-- TPC-C 2.5.2.2: the customer in the middle when sorted by C_FIRST
+			local keys = redis.call('SMEMBERS', 'CUSTOMER.INDEXES.NAMESEARCH.' .. w_id .. ':' .. d_id .. ':' .. c_last)
+			if #keys == 0 then return nil end
+			local firsts = { }
+			for _, key in ipairs(keys) do
+				firsts[key] = redis.call('HGET', 'CUSTOMER.' .. key, 'C_FIRST')
+			end
+			table.sort(keys, function(a, b) return firsts[a] < firsts[b] end)
+			return keys[math.floor((#keys - 1) / 2) + 1]
+		end
+		
+		local function updateStock(w_id, supply_w_id, i_id, qty, s_dist_col)
+			local key = 'STOCK.' .. supply_w_id .. ':' .. i_id
+			local s = redis.call('HMGET', key, 'S_QUANTITY', 'S_YTD', 'S_ORDER_CNT', 'S_REMOTE_CNT', 'S_DATA', s_dist_col)
+			local s_quantity = tonumber(s[1])
+			if s_quantity >= qty + 10 then
+				s_quantity = s_quantity - qty
+			else
+				s_quantity = s_quantity + 91 - qty
+			end
+			local s_remote_cnt = tonumber(s[4])
+			if supply_w_id ~= w_id then s_remote_cnt = s_remote_cnt + 1 end
+			redis.call('HMSET', key,
+				'S_QUANTITY', s_quantity,
+				'S_YTD', tonumber(s[2]) + qty,
+				'S_ORDER_CNT', tonumber(s[3]) + 1,
+				'S_REMOTE_CNT', s_remote_cnt)
+			return { tostring(s_quantity), s[5], s[6] }
+		end
+		
+		local function itemsExist(first, count, stride)
+			for i = 0, count - 1 do
+				if redis.call('EXISTS', 'ITEM.' .. ARGV[first + i * stride]) == 0 then
+					return false
+				end
+			end
+			return true
+		end
+	'''
+	
+	SCRIPTS = {
+		# ARGV: w_id, o_carrier_id, ol_delivery_d, districts
+		'DELIVERY' : '''
+			local w_id, o_carrier_id, ol_delivery_d = ARGV[1], ARGV[2], ARGV[3]
+			local result = { }
+			for d_id = 1, tonumber(ARGV[4]) do
+				local index_key = 'NEW_ORDER.INDEXES.GETNEWORDER.' .. d_id .. ':' .. w_id
+				-- The oldest new order of the district
+				local no_key, no_o_id = nil, nil
+				for _, key in ipairs(redis.call('SMEMBERS', index_key)) do
+					local o_id = tonumber(string.match(key, '^[^:]+'))
+					if no_o_id == nil or o_id < no_o_id then
+						no_key, no_o_id = key, o_id
+					end
+				end
+				if no_key ~= nil then
+					redis.call('DEL', 'NEW_ORDER.' .. no_key)
+					redis.call('SREM', 'NEW_ORDER.IDS', no_key)
+					redis.call('SREM', index_key, no_key)
+					
+					local order_key = 'ORDERS.' .. w_id .. ':' .. d_id .. ':' .. no_o_id
+					local c_id = redis.call('HGET', order_key, 'O_C_ID')
+					redis.call('HSET', order_key, 'O_CARRIER_ID', o_carrier_id)
+					
+					local total = 0
+					for _, ol_key in ipairs(redis.call('SMEMBERS', 'ORDER_LINE.INDEXES.SUMOLAMOUNT.' .. no_o_id .. ':' .. d_id .. ':' .. w_id)) do
+						total = total + tonumber(redis.call('HGET', 'ORDER_LINE.' .. ol_key, 'OL_AMOUNT'))
+						redis.call('HSET', 'ORDER_LINE.' .. ol_key, 'OL_DELIVERY_D', ol_delivery_d)
+					end
+					
+					if c_id then
+						local customer_key = 'CUSTOMER.' .. w_id .. ':' .. d_id .. ':' .. c_id
+						redis.call('HINCRBYFLOAT', customer_key, 'C_BALANCE', total)
+						redis.call('HINCRBYFLOAT', customer_key, 'C_DELIVERY_CNT', 1)
+					end
+					table.insert(result, { d_id, no_o_id })
+				end
+			end
+			return result
+		''',
+		
+		# ARGV: w_id, d_id, c_id, o_entry_d, ol_cnt, all_local, null_carrier_id,
+		#       then for each line: i_id, supply_w_id, quantity, remote,
+		#       s_quantity, s_data, s_dist (the last three only when remote)
+		'NEW_ORDER' : '''
+			local w_id, d_id, c_id, o_entry_d = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+			local ol_cnt = tonumber(ARGV[5])
+			local LINE = 8
+			local STRIDE = 7
+			
+			-- TPCC defines 1% of neworder gives a wrong itemid, causing rollback.
+			-- The items are checked before anything is written
+			if not itemsExist(LINE, ol_cnt, STRIDE) then return { } end
+			
+			local w_tax = redis.call('HGET', 'WAREHOUSE.' .. w_id, 'W_TAX')
+			local district_key = 'DISTRICT.' .. w_id .. ':' .. d_id
+			local d = redis.call('HMGET', district_key, 'D_TAX', 'D_NEXT_O_ID')
+			local o_id = d[2]
+			redis.call('HINCRBY', district_key, 'D_NEXT_O_ID', 1)
+			local customer = redis.call('HGETALL', 'CUSTOMER.' .. w_id .. ':' .. d_id .. ':' .. c_id)
+			
+			local order_key = w_id .. ':' .. d_id .. ':' .. o_id
+			redis.call('SADD', 'ORDERS.IDS', order_key)
+			redis.call('HMSET', 'ORDERS.' .. order_key,
+				'O_ID', o_id, 'O_D_ID', d_id, 'O_W_ID', w_id, 'O_C_ID', c_id,
+				'O_ENTRY_D', o_entry_d, 'O_CARRIER_ID', ARGV[7],
+				'O_OL_CNT', ol_cnt, 'O_ALL_LOCAL', ARGV[6])
+			redis.call('SADD', 'ORDERS.INDEXES.ORDERSEARCH.' .. w_id .. ':' .. d_id .. ':' .. c_id, order_key)
+			
+			local new_order_key = o_id .. ':' .. w_id .. ':' .. d_id
+			redis.call('SADD', 'NEW_ORDER.IDS', new_order_key)
+			redis.call('HMSET', 'NEW_ORDER.' .. new_order_key, 'NO_O_ID', o_id, 'NO_D_ID', d_id, 'NO_W_ID', w_id)
+			redis.call('SADD', 'NEW_ORDER.INDEXES.GETNEWORDER.' .. d_id .. ':' .. w_id, new_order_key)
+			
+			local s_dist_col = string.format('S_DIST_%02d', tonumber(d_id))
+			local total = 0
+			local lines = { }
+			for i = 0, ol_cnt - 1 do
+				local b = LINE + i * STRIDE
+				local i_id, supply_w_id, qty = ARGV[b], ARGV[b + 1], tonumber(ARGV[b + 2])
+				local stock
+				if ARGV[b + 3] == '1' then
+					stock = { ARGV[b + 4], ARGV[b + 5], ARGV[b + 6] }
+				else
+					stock = updateStock(w_id, supply_w_id, i_id, qty, s_dist_col)
+				end
+				local item = redis.call('HMGET', 'ITEM.' .. i_id, 'I_PRICE', 'I_NAME', 'I_DATA')
+				local ol_amount = qty * tonumber(item[1])
+				total = total + ol_amount
+				
+				local ol_key = order_key .. ':' .. (i + 1)
+				redis.call('SADD', 'ORDER_LINE.IDS', ol_key)
+				redis.call('HMSET', 'ORDER_LINE.' .. ol_key,
+					'OL_O_ID', o_id, 'OL_D_ID', d_id, 'OL_W_ID', w_id, 'OL_NUMBER', i + 1,
+					'OL_I_ID', i_id, 'OL_SUPPLY_W_ID', supply_w_id, 'OL_DELIVERY_D', o_entry_d,
+					'OL_QUANTITY', qty, 'OL_AMOUNT', ol_amount, 'OL_DIST_INFO', stock[3])
+				redis.call('SADD', 'ORDER_LINE.INDEXES.SUMOLAMOUNT.' .. o_id .. ':' .. d_id .. ':' .. w_id, ol_key)
+				table.insert(lines, { item[2], stock[1], item[3], stock[2], item[1], tostring(ol_amount) })
+			end
+			return { customer, { w_tax, d[1], o_id, tostring(total) }, lines }
+		''',
+		
+		# The first phase of a NEW_ORDER with lines supplied by warehouses on
+		# other nodes. ARGV: w_id, d_id, ol_cnt, all of the item ids, then for
+		# each line supplied by this node: i_id, supply_w_id, quantity
+		'STOCK' : '''
+			local w_id, d_id = ARGV[1], ARGV[2]
+			local ol_cnt = tonumber(ARGV[3])
+			-- The items are on every node, so each of them rejects an unknown
+			-- item before anything is written anywhere
+			if not itemsExist(4, ol_cnt, 1) then return { } end
+			
+			local s_dist_col = string.format('S_DIST_%02d', tonumber(d_id))
+			local result = { }
+			for b = 4 + ol_cnt, #ARGV, 3 do
+				for _, value in ipairs(updateStock(w_id, ARGV[b + 1], ARGV[b], tonumber(ARGV[b + 2]), s_dist_col)) do
+					table.insert(result, value)
+				end
+			end
+			return result
+		''',
+		
+		# ARGV: w_id, d_id, c_id (or ''), c_last
+		'ORDER_STATUS' : '''
+			local w_id, d_id = ARGV[1], ARGV[2]
+			local customer_key = findCustomer(w_id, d_id, ARGV[3], ARGV[4])
+			if customer_key == nil then return { } end
+			local customer = redis.call('HGETALL', 'CUSTOMER.' .. customer_key)
+			local c_id = redis.call('HGET', 'CUSTOMER.' .. customer_key, 'C_ID')
+			
+			-- The order with the highest O_ID is the customer's last one
+			local order_key, last = nil, nil
+			for _, key in ipairs(redis.call('SMEMBERS', 'ORDERS.INDEXES.ORDERSEARCH.' .. w_id .. ':' .. d_id .. ':' .. c_id)) do
+				local o_id = tonumber(string.match(key, '[^:]+$'))
+				if last == nil or o_id > last then
+					order_key, last = key, o_id
+				end
+			end
+			if order_key == nil then return { customer, { }, { } } end
+			
+			local order = redis.call('HMGET', 'ORDERS.' .. order_key, 'O_ID', 'O_CARRIER_ID', 'O_ENTRY_D')
+			local lines = { }
+			for _, ol_key in ipairs(redis.call('SMEMBERS', 'ORDER_LINE.INDEXES.SUMOLAMOUNT.' .. last .. ':' .. d_id .. ':' .. w_id)) do
+				table.insert(lines, redis.call('HMGET', 'ORDER_LINE.' .. ol_key,
+					'OL_SUPPLY_W_ID', 'OL_I_ID', 'OL_QUANTITY', 'OL_AMOUNT', 'OL_DELIVERY_D'))
+			end
+			return { customer, order, lines }
+		''',
+		
+		# ARGV: w_id, d_id, h_amount, c_w_id, c_d_id, c_id (or ''), c_last,
+		#       h_date, do_home, do_customer, bad_credit, max_c_data
+		# A payment for a customer on another node runs the script there
+		# with only do_customer set, and on the home node with only do_home
+		'PAYMENT' : '''
+			local w_id, d_id, h_amount = ARGV[1], ARGV[2], ARGV[3]
+			local c_w_id, c_d_id, h_c_id = ARGV[4], ARGV[5], ARGV[6]
+			local warehouse, district, customer = { }, { }, { }
+			
+			if ARGV[10] == '1' then
+				local customer_key = findCustomer(c_w_id, c_d_id, ARGV[6], ARGV[7])
+				if customer_key == nil then return { } end
+				customer_key = 'CUSTOMER.' .. customer_key
+				local c = redis.call('HMGET', customer_key, 'C_ID', 'C_CREDIT', 'C_DATA')
+				h_c_id = c[1]
+				redis.call('HINCRBYFLOAT', customer_key, 'C_BALANCE', -tonumber(h_amount))
+				redis.call('HINCRBYFLOAT', customer_key, 'C_YTD_PAYMENT', h_amount)
+				redis.call('HINCRBYFLOAT', customer_key, 'C_PAYMENT_CNT', 1)
+				local c_data = ''
+				if c[2] == ARGV[11] then
+					c_data = table.concat({ c[1], c_d_id, c_w_id, d_id, w_id, h_amount }, ' ') .. '|' .. c[3]
+					c_data = string.sub(c_data, 1, tonumber(ARGV[12]))
+				end
+				redis.call('HSET', customer_key, 'C_DATA', c_data)
+				customer = redis.call('HGETALL', customer_key)
+			end
+			
+			if ARGV[9] == '1' then
+				local warehouse_key = 'WAREHOUSE.' .. w_id
+				local district_key = 'DISTRICT.' .. w_id .. ':' .. d_id
+				redis.call('HINCRBYFLOAT', warehouse_key, 'W_YTD', h_amount)
+				redis.call('HINCRBYFLOAT', district_key, 'D_YTD', h_amount)
+				warehouse = redis.call('HGETALL', warehouse_key)
+				district = redis.call('HGETALL', district_key)
+				
+				local w_name = redis.call('HGET', warehouse_key, 'W_NAME')
+				local d_name = redis.call('HGET', district_key, 'D_NAME')
+				local history_key = w_id .. ':' .. redis.call('INCR', 'HISTORY.next_score.' .. w_id)
+				redis.call('SADD', 'HISTORY.IDS', history_key)
+				redis.call('HMSET', 'HISTORY.' .. history_key,
+					'H_C_ID', h_c_id, 'H_C_D_ID', c_d_id, 'H_C_W_ID', c_w_id,
+					'H_D_ID', d_id, 'H_W_ID', w_id, 'H_DATE', ARGV[8],
+					'H_AMOUNT', h_amount, 'H_DATA', w_name .. '    ' .. d_name)
+			end
+			return { warehouse, district, customer }
+		''',
+		
+		# ARGV: w_id, d_id, threshold
+		'STOCK_LEVEL' : '''
+			local w_id, d_id = ARGV[1], ARGV[2]
+			local threshold = tonumber(ARGV[3])
+			local o_id = tonumber(redis.call('HGET', 'DISTRICT.' .. w_id .. ':' .. d_id, 'D_NEXT_O_ID'))
+			local seen = { }
+			local count = 0
+			for o = o_id - 20, o_id - 1 do
+				for _, ol_key in ipairs(redis.call('SMEMBERS', 'ORDER_LINE.INDEXES.SUMOLAMOUNT.' .. o .. ':' .. d_id .. ':' .. w_id)) do
+					local i_id = redis.call('HGET', 'ORDER_LINE.' .. ol_key, 'OL_I_ID')
+					if i_id and not seen[i_id] then
+						seen[i_id] = true
+						local s_quantity = redis.call('HGET', 'STOCK.' .. w_id .. ':' .. i_id, 'S_QUANTITY')
+						if s_quantity and tonumber(s_quantity) < threshold then
+							count = count + 1
+						end
+					end
+				end
+			end
+			return count
+		''',
 	}
 	
 	#------------------------------------------------------------------------
@@ -323,6 +596,9 @@ class RedisDriver(AbstractDriver):
 			'stock-level'  : 'None',
 		}
 		self.hosts = [ ]
+		self.use_scripts = False
+		self.scripts = [ ]
+		self.partitioner = None
 	# End __init__()
 	
 	#------------------------------------------------------------------------
@@ -336,6 +612,8 @@ class RedisDriver(AbstractDriver):
 	#	}
 	#------------------------------------------------------------------------
 	def doDelivery(self, params) :
+		if self.use_scripts :
+			return self.scriptDelivery(params)
 		if self.debug['delivery'] != 'None' :
 			print 'TXN DELIVERY STARTING ------------------'
 			tt = time.time()
@@ -547,6 +825,8 @@ class RedisDriver(AbstractDriver):
 	#	}
 	#------------------------------------------------------------------------
 	def doNewOrder(self, params) :
+		if self.use_scripts :
+			return self.scriptNewOrder(params)
 		if self.debug['new-order'] != 'None' :
 			print 'TXN NEW ORDER STARTING -----------------'
 			tt = time.time()
@@ -576,10 +856,11 @@ class RedisDriver(AbstractDriver):
 		all_local = True
 		items = [ ]
 		pipe_results = [ ]
+		item_rdr = self.r_pipes[self.partitioner.itemShard(w_id)]
 		for i in range(len(i_ids)):
 			all_local = all_local and i_w_ids[i] == w_id
-			rdr.hgetall('ITEM.' + str(i_ids[i]))
-		pipe_results = rdr.execute()
+			item_rdr.hgetall('ITEM.' + str(i_ids[i]))
+		pipe_results = item_rdr.execute()
 		
 		for pr in pipe_results :
 			if len(pr) > 0 :
@@ -852,6 +1133,8 @@ class RedisDriver(AbstractDriver):
 	#	}
 	#------------------------------------------------------------------------
 	def doOrderStatus(self, params) :
+		if self.use_scripts :
+			return self.scriptOrderStatus(params)
 		if self.debug['order-status'] != 'None' :
 			print 'TXN ORDER STATUS STARTING --------------'
 			tt = time.time()
@@ -999,6 +1282,8 @@ class RedisDriver(AbstractDriver):
 	#	}
 	#------------------------------------------------------------------------
 	def doPayment(self, params) :
+		if self.use_scripts :
+			return self.scriptPayment(params)
 		if self.debug['payment'] != 'None' :
 			print 'TXN PAYMENT STARTING -------------------'
 			tt = time.time()
@@ -1228,6 +1513,8 @@ class RedisDriver(AbstractDriver):
 	#	}
 	#------------------------------------------------------------------------	
 	def doStockLevel(self, params) :
+		if self.use_scripts :
+			return self.scriptStockLevel(params)
 		if self.debug['order-status'] != 'None' :
 			print 'TXN STOCK LEVEL STARTING ---------------'
 			tt = time.time()
@@ -1285,6 +1572,190 @@ class RedisDriver(AbstractDriver):
 			
 		return len(stock_counts)
 		
+	#------------------------------------------------------------------------
+	# Execute TPC-C Delivery Transaction as one Lua script
+	#
+	# @param dictionary params (transaction parameters)
+	#------------------------------------------------------------------------
+	def scriptDelivery(self, params) :
+		w_id = params["w_id"]
+		node = self.shard(w_id)
+		results = self.runScript(node, 'DELIVERY', [
+			w_id,
+			params["o_carrier_id"],
+			params["ol_delivery_d"],
+			constants.DISTRICTS_PER_WAREHOUSE,
+		])
+		return [ (int(d_id), int(no_o_id)) for d_id, no_o_id in results ]
+	# End scriptDelivery()
+	
+	#------------------------------------------------------------------------
+	# Execute TPC-C New Order Transaction as one Lua script. Lines that are
+	# supplied by a warehouse on another node take a two-phase path: their
+	# stock is updated on that node first, and the home node's script is
+	# given the results.
+	#
+	# @param dictionary params (transaction parameters)
+	#------------------------------------------------------------------------
+	def scriptNewOrder(self, params) :
+		w_id = params["w_id"]
+		d_id = params["d_id"]
+		i_ids = params["i_ids"]
+		i_w_ids = params["i_w_ids"]
+		i_qtys = params["i_qtys"]
+		node = self.shard(w_id)
+		
+		assert len(i_ids) > 0
+		assert len(i_ids) == len(i_w_ids)
+		assert len(i_ids) == len(i_qtys)
+		
+		all_local = True
+		remote = { }
+		for i in range(len(i_ids)) :
+			all_local = all_local and i_w_ids[i] == w_id
+			supply_node = self.shard(i_w_ids[i])
+			if supply_node != node :
+				remote.setdefault(supply_node, [ ]).append(i)
+		
+		#---------------------------------
+		# Phase One: Remote Stock Updates
+		#---------------------------------
+		stock_info = { }
+		for supply_node, lines in remote.items() :
+			args = [ w_id, d_id, len(i_ids) ] + i_ids
+			for i in lines :
+				args += [ i_ids[i], i_w_ids[i], i_qtys[i] ]
+			results = self.runScript(supply_node, 'STOCK', args)
+			## Every node rejects an unknown item before writing anything
+			if len(results) == 0 :
+				return
+			for index, i in enumerate(lines) :
+				stock_info[i] = results[index * 3:index * 3 + 3]
+		
+		#-----------------------------
+		# Phase Two: Home Order Entry
+		#-----------------------------
+		args = [ w_id, d_id, params["c_id"], params["o_entry_d"], len(i_ids), all_local, constants.NULL_CARRIER_ID ]
+		for i in range(len(i_ids)) :
+			if i in stock_info :
+				args += [ i_ids[i], i_w_ids[i], i_qtys[i], 1 ] + stock_info[i]
+			else :
+				args += [ i_ids[i], i_w_ids[i], i_qtys[i], 0, '', '', '' ]
+		results = self.runScript(node, 'NEW_ORDER', args)
+		
+		## TPCC defines 1% of neworder gives a wrong itemid, causing rollback.
+		if len(results) == 0 :
+			return
+		
+		customer_info = self.toDict(results[0])
+		w_tax, d_tax, d_next_o_id, total = results[1]
+		w_tax = float(w_tax)
+		d_tax = float(d_tax)
+		item_data = [ ]
+		for i_name, s_quantity, i_data, s_data, i_price, ol_amount in results[2] :
+			if i_data.find(constants.ORIGINAL_STRING) != -1 and s_data.find(constants.ORIGINAL_STRING) != -1:
+				brand_generic = 'B'
+			else:
+				brand_generic = 'G'
+			item_data.append( (i_name, float(s_quantity), brand_generic, float(i_price), float(ol_amount)) )
+		
+		## Adjust the total for the discount
+		total = float(total) * (1 - float(customer_info['C_DISCOUNT'])) * (1 + w_tax + d_tax)
+		misc = [ (w_tax, d_tax, int(d_next_o_id), total) ]
+		return [ customer_info, misc, item_data ]
+	# End scriptNewOrder()
+	
+	#------------------------------------------------------------------------
+	# Execute TPC-C Order Status Transaction as one Lua script
+	#
+	# @param dictionary params (transaction parameters)
+	#------------------------------------------------------------------------
+	def scriptOrderStatus(self, params) :
+		w_id = params["w_id"]
+		c_id = params["c_id"]
+		node = self.shard(w_id)
+		results = self.runScript(node, 'ORDER_STATUS', [
+			w_id,
+			params["d_id"],
+			c_id if c_id != None else '',
+			params["c_last"] if params["c_last"] != None else '',
+		])
+		assert len(results) > 0
+		customer, order, orderLines = results
+		return [ self.toDict(customer), order, orderLines ]
+	# End scriptOrderStatus()
+	
+	#------------------------------------------------------------------------
+	# Execute TPC-C Payment Transaction as one Lua script. The payment of a
+	# customer of a warehouse on another node runs the customer's half of
+	# the script on that node.
+	#
+	# @param dictionary params (transaction parameters)
+	#------------------------------------------------------------------------
+	def scriptPayment(self, params) :
+		w_id = params["w_id"]
+		c_w_id = params["c_w_id"]
+		c_id = params["c_id"]
+		node = self.shard(w_id)
+		customer_node = self.shard(c_w_id)
+		
+		args = [
+			w_id,
+			params["d_id"],
+			params["h_amount"],
+			c_w_id,
+			params["c_d_id"],
+			c_id if c_id != None else '',
+			params["c_last"] if params["c_last"] != None else '',
+			params["h_date"],
+		]
+		if customer_node == node :
+			results = self.runScript(node, 'PAYMENT', args + [ 1, 1, constants.BAD_CREDIT, constants.MAX_C_DATA ])
+			assert len(results) > 0
+			warehouse, district, customer = results
+		else :
+			results = self.runScript(customer_node, 'PAYMENT', args + [ 0, 1, constants.BAD_CREDIT, constants.MAX_C_DATA ])
+			assert len(results) > 0
+			customer = results[2]
+			## The history row needs the id of a customer found by last name
+			args[5] = self.toDict(customer)['C_ID']
+			warehouse, district, unused = self.runScript(node, 'PAYMENT', args + [ 1, 0, constants.BAD_CREDIT, constants.MAX_C_DATA ])
+		
+		return [ self.toDict(warehouse), self.toDict(district), self.toDict(customer) ]
+	# End scriptPayment()
+	
+	#------------------------------------------------------------------------
+	# Execute TPC-C Stock Level Transaction as one Lua script
+	#
+	# @param dictionary params (transaction parameters)
+	#------------------------------------------------------------------------
+	def scriptStockLevel(self, params) :
+		w_id = params["w_id"]
+		node = self.shard(w_id)
+		return int(self.runScript(node, 'STOCK_LEVEL', [ w_id, params["d_id"], params["threshold"] ]))
+	# End scriptStockLevel()
+	
+	#------------------------------------------------------------------------
+	# Run one of the registered Lua scripts on the given node. EVALSHA falls
+	# back to EVAL (and caches the script) if the node doesn't have it.
+	#
+	# @param int node
+	# @param string name (key of SCRIPTS)
+	# @param list args
+	#------------------------------------------------------------------------
+	def runScript(self, node, name, args) :
+		return self.scripts[node][name](args = [ str(a) for a in args ])
+	# End runScript()
+	
+	#------------------------------------------------------------------------
+	# Convert the flat field/value list of a Lua HGETALL to a dictionary
+	#
+	# @param list values
+	#------------------------------------------------------------------------
+	def toDict(self, values) :
+		return dict(zip(values[0::2], values[1::2]))
+	# End toDict()
+	
 	#------------------------------------------------------------------------
 	# Load the specified configuration for Redis TPC-C run
 	#
@@ -1313,6 +1784,19 @@ class RedisDriver(AbstractDriver):
 			c_num += 1
 			self.db_count += 1
 		
+		# Map the warehouses onto the nodes
+		self.partitioner = partitioner.makePartitioner(config.get('partitioning'), self.db_count)
+		
+		# Register the Lua scripts on every node
+		self.use_scripts = parseBool(config['lua-scripts'])
+		if self.use_scripts :
+			assert self.partitioner.replicateItems, "The Lua scripts read ITEM on the home node, so they need ITEM replication"
+			for db in self.databases :
+				scripts = { }
+				for name, body in self.SCRIPTS.items() :
+					scripts[name] = db.register_script(self.SCRIPT_FUNCTIONS + body)
+				self.scripts.append(scripts)
+		
 		# Reset Databases if required
 		if config['reset'] :
 			for db in self.databases :
@@ -1596,10 +2080,10 @@ class RedisDriver(AbstractDriver):
 					key
 				)
 				self.w_sizes[node] += 3
-			elif tableName == 'ITEMS' :
+			elif tableName == 'ITEM' :
 				key = self.safeKey([record[0]]);
-				pi = 0
-				for pipe in self.w_pipes :
+				for pi in self.partitioner.itemShards() :
+					pipe = self.w_pipes[pi]
 					pipe.sadd('ITEM.IDS', key)
 					pipe.hmset(
 						'ITEM.' + key,
@@ -1659,5 +2143,14 @@ class RedisDriver(AbstractDriver):
 	# @return int
 	#------------------------------------------------------------------------
 	def shard(self, w_id) :
-		return int(w_id) % self.db_count
-	# End shard()
\ No newline at end of file
+		return self.partitioner.shard(w_id)
+	# End shard()
+	
+	#------------------------------------------------------------------------
+	# Return the map of warehouses to nodes
+	#
+	# @return Partitioner
+	#------------------------------------------------------------------------
+	def getPartitioner(self) :
+		return self.partitioner
+	# End getPartitioner()
\ No newline at end of file
@@ -39,6 +39,7 @@ from pprint import pprint,pformat
 
 import constants
 from abstractdriver import *
+from statementcache import StatementCache, formatStats
 
 TXN_QUERIES = {
     "DELIVERY": {
@@ -97,6 +98,37 @@ TXN_QUERIES = {
     },
 }
 
+## Remove the rows of a partially loaded unit, keyed by the kind of load unit
+## (see runtime/loader.py). Children come before their parents
+LOAD_QUERIES = {
+    "deleteUnit": {
+        "item": [
+            "DELETE FROM item WHERE i_id BETWEEN ? AND ?", # first_i_id, last_i_id
+        ],
+        "stock": [
+            "DELETE FROM stock_history WHERE sh_s_w_id = ?", # w_id
+            "DELETE FROM stock WHERE s_w_id = ?", # w_id
+            "DELETE FROM warehouse WHERE w_id = ?", # w_id
+        ],
+        "district": [
+            "DELETE FROM order_line WHERE ol_w_id = ?", # w_id
+            "DELETE FROM orders WHERE o_w_id = ?", # w_id
+            "DELETE FROM history WHERE h_c_w_id = ?", # w_id
+            "DELETE FROM customer_history WHERE ch_c_w_id = ?", # w_id
+            "DELETE FROM customer WHERE c_w_id = ?", # w_id
+            "DELETE FROM district WHERE d_w_id = ?", # w_id
+        ],
+        "delivery": [
+            "DELETE FROM delivery_orders WHERE dlo_w_id = ?", # w_id
+            "DELETE FROM delivery WHERE dl_w_id = ?", # w_id
+        ],
+    },
+}
+
+## The sqlite3 module compiles every statement once and keeps it in a per-connection
+## cache keyed by its text. This is large enough for all of TXN_QUERIES
+CACHED_STATEMENTS = 256
+
 
 ## ==============================================
 ## SqliteDriver
@@ -104,6 +136,7 @@ TXN_QUERIES = {
 class SqliteDriver(AbstractDriver):
     DEFAULT_CONFIG = {
         "database": ("The path to the SQLite database", "/tmp/tpcc.db" ),
+        "prepare": ("Build the text of every transaction query when the execution starts and count the hits in the statement cache", False ),
     }
     
     def __init__(self, ddl):
@@ -111,6 +144,8 @@ class SqliteDriver(AbstractDriver):
         self.database = None
         self.conn = None
         self.cursor = None
+        self.statements = None
+        self.districtQueries = { }
     
     ## ----------------------------------------------
     ## makeDefaultConfig
@@ -126,6 +161,7 @@ class SqliteDriver(AbstractDriver):
             assert key in config, "Missing parameter '%s' in %s configuration" % (key, self.name)
         
         self.database = str(config["database"])
+        self.prepare = parseBool(config["prepare"])
         
         if config["reset"] and os.path.exists(self.database):
             logging.debug("Deleting database '%s'" % self.database)
@@ -139,7 +175,7 @@ class SqliteDriver(AbstractDriver):
             assert result == 0, cmd + "\n" + output
         ## IF
             
-        self.conn = sqlite3.connect(self.database)
+        self.conn = sqlite3.connect(self.database, cached_statements=CACHED_STATEMENTS)
         self.cursor = self.conn.cursor()
     
     ## ----------------------------------------------
@@ -162,6 +198,60 @@ class SqliteDriver(AbstractDriver):
         logging.info("Commiting changes to database")
         self.conn.commit()
 
+    ## ----------------------------------------------
+    ## loadStartUnit
+    ## ----------------------------------------------
+    def loadStartUnit(self, unit):
+        """Remove anything an earlier, interrupted attempt at the same unit managed to commit"""
+        self.conn.commit()
+        for sql in LOAD_QUERIES["deleteUnit"][unit[0]]:
+            self.cursor.execute(sql, unit[1:sql.count("?")+1])
+
+    ## ----------------------------------------------
+    ## loadFinishUnit
+    ## ----------------------------------------------
+    def loadFinishUnit(self, unit):
+        self.conn.commit()
+
+    ## ----------------------------------------------
+    ## executeStart
+    ## ----------------------------------------------
+    def executeStart(self):
+        """There is no way to compile a statement ahead of time through the sqlite3 module,
+        so the statements are their own query text and are compiled by the connection's
+        cache the first time they are run"""
+        if not self.prepare: return
+        self.statements = StatementCache(self.cursor, lambda idx, query: query)
+        for txn in TXN_QUERIES:
+            for query in TXN_QUERIES[txn].values():
+                if query.find("%02d") != -1:
+                    for d_id in range(1, constants.DISTRICTS_PER_WAREHOUSE+1):
+                        self.statements.prepare(self.districtQuery(query, d_id))
+                else:
+                    self.statements.prepare(query)
+            ## FOR
+        ## FOR
+        assert len(self.statements.handles) <= CACHED_STATEMENTS
+        self.cursor = self.statements
+
+    ## ----------------------------------------------
+    ## executeFinish
+    ## ----------------------------------------------
+    def executeFinish(self):
+        if self.statements == None: return
+        self.cursor = self.statements.cursor
+        logging.info(formatStats(self.statements.stats()))
+
+    ## ----------------------------------------------
+    ## districtQuery
+    ## ----------------------------------------------
+    def districtQuery(self, query, d_id):
+        """Return the text of a query that reads the S_DIST_XX column of the given district"""
+        key = (query, d_id)
+        if not key in self.districtQueries:
+            self.districtQueries[key] = query % d_id
+        return self.districtQueries[key]
+
     ## ----------------------------------------------
     ## doDelivery
     ## ----------------------------------------------
@@ -283,7 +373,7 @@ class SqliteDriver(AbstractDriver):
             i_data = itemInfo[2]
             i_price = itemInfo[0]
 
-            self.cursor.execute(q["getStockInfo"] % (d_id), [ol_i_id, ol_supply_w_id])
+            self.cursor.execute(self.districtQuery(q["getStockInfo"], d_id), [ol_i_id, ol_supply_w_id])
             stockInfo = self.cursor.fetchone()
             if len(stockInfo) == 0:
                 logging.warn("No STOCK record for (ol_i_id=%d, ol_supply_w_id=%d)" % (ol_i_id, ol_supply_w_id))
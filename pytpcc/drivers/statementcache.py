@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import time
+
+## ==============================================
+## StatementCache
+## ==============================================
+class StatementCache:
+    """
+        Prepared statements for the fixed queries of a SQL driver. Each query is
+        prepared once with the function given by the driver, which returns the
+        handle to execute in its place. The statements are looked up by their query
+        text, so a driver can swap this in for its cursor and keep executing its
+        TXN_QUERIES as before. Anything that was not prepared is passed through.
+    """
+
+    def __init__(self, cursor, prepareFunc):
+        self.cursor = cursor
+        self.prepareFunc = prepareFunc
+        self.handles = { }
+        self.hits = 0
+        self.misses = 0
+        self.prepareTime = 0.0
+    ## DEF
+
+    def prepare(self, query):
+        """Prepare the given query, unless it already was"""
+        if query in self.handles: return
+        start = time.time()
+        self.handles[query] = self.prepareFunc(len(self.handles), query)
+        self.prepareTime += time.time() - start
+    ## DEF
+
+    def execute(self, query, params = None):
+        handle = self.handles.get(query, None)
+        if handle == None:
+            self.misses += 1
+            handle = query
+        else:
+            self.hits += 1
+        if params == None:
+            return self.cursor.execute(handle)
+        return self.cursor.execute(handle, params)
+    ## DEF
+
+    def stats(self):
+        return {
+            "prepared": len(self.handles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "prepare_time": self.prepareTime,
+        }
+    ## DEF
+
+    def __getattr__(self, name):
+        ## fetchone(), fetchall(), rowcount, ... come from the real cursor
+        return getattr(self.cursor, name)
+    ## DEF
+
+## CLASS
+
+def formatStats(stats):
+    """Return a one-line summary of the counters of a StatementCache"""
+    ret = "%(prepared)d prepared statements: %(hits)d hits, %(misses)d misses, %(prepare_time).3f sec preparing" % stats
+    if "generic_plans" in stats:
+        ret += ", %(generic_plans)d generic / %(custom_plans)d custom plans" % stats
+    return ret
+## DEF
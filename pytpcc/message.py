@@ -46,6 +46,9 @@ CMD_EXECUTE = 2
 CMD_STOP = 3
 LOAD_COMPLETED = 4
 EXECUTE_COMPLETED = 5
+CMD_LOAD_UNIT = 6
+LOAD_UNIT_COMPLETED = 7
+CMD_LOAD_FINISH = 8
  
 class Message:
     def __init__(self,header=EMPTY,data=None):
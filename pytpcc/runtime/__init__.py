@@ -1,3 +1,3 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ["executor", "loader"]
+__all__ = ["executor", "loader", "checkpoint", "compactor", "terminals"]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import os
+import json
+import logging
+
+## ==============================================
+## describeLoad
+## ==============================================
+def describeLoad(scaleParameters, args):
+    """Everything that changes the generated data. A manifest can only be
+    resumed by a load with the same description."""
+    return {
+        "seed": args['seed'],
+        "generator": args['generator'],
+        "items": scaleParameters.items,
+        "warehouses": scaleParameters.warehouses,
+        "starting_warehouse": scaleParameters.starting_warehouse,
+        "districts": scaleParameters.districtsPerWarehouse,
+        "customers": scaleParameters.customersPerDistrict,
+        "new_orders": scaleParameters.newOrdersPerDistrict,
+    }
+## DEF
+
+## ==============================================
+## LoadManifest
+## ==============================================
+class LoadManifest:
+    """
+        Append-only record of the load units that have been committed, so that
+        an interrupted load can pick up where it stopped. The first line is the
+        description of the load from describeLoad and every line after it is a
+        finished unit, both as JSON.
+    """
+    
+    def __init__(self, path, description, reset = False):
+        self.path = path
+        self.description = description
+        self.finished = set()
+        
+        if reset or not os.path.exists(path) or os.path.getsize(path) == 0:
+            self.file = open(path, "w")
+            self.write(description)
+        else:
+            self.read()
+            self.file = open(path, "a")
+    ## DEF
+    
+    def read(self):
+        with open(self.path, "r") as f:
+            lines = f.readlines()
+        header = json.loads(lines[0])
+        if header != self.description:
+            raise Exception("The load manifest '%s' is for a different load: %s" % (self.path, header))
+        
+        for line in lines[1:]:
+            try:
+                self.finished.add(tuple(json.loads(line)))
+            except ValueError:
+                ## The last line is cut short if we died while writing it
+                logging.warn("Ignoring a damaged line in the load manifest '%s'" % self.path)
+        ## FOR
+        logging.info("Resuming the load from '%s' with %d units already finished" % (self.path, len(self.finished)))
+    ## DEF
+    
+    def write(self, value):
+        self.file.write(json.dumps(value) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    ## DEF
+    
+    def pending(self, phases):
+        """Return the given phases without the finished units. Phases that are
+        left without any units are dropped."""
+        ret = [ ]
+        for phase in phases:
+            units = [ unit for unit in phase if not unit in self.finished ]
+            if len(units) > 0: ret.append(units)
+        ## FOR
+        return (ret)
+    ## DEF
+    
+    def finish(self, unit):
+        """Record that the unit has been committed by the driver"""
+        self.finished.add(unit)
+        self.write(list(unit))
+    ## DEF
+    
+    def close(self):
+        self.file.close()
+    ## DEF
+    
+## CLASS
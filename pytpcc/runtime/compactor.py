@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import logging
+
+## ==============================================
+## Compactor
+## ==============================================
+class Compactor:
+    """
+        Runs the driver's compact() every interval seconds while the benchmark
+        is executing, so that long runs reach a steady state instead of
+        slowing down as the event logs grow. Each round is a dict with:
+            tables: { name: { rows, bytes, bytes_freed } }
+                rows is the number of events removed, bytes the size of the table
+                and bytes_freed an estimate of the space made reusable
+            probe_before, probe_after: { lookup name: average milliseconds }
+            duration: seconds spent in the round
+    """
+    
+    def __init__(self, handle, interval):
+        assert interval > 0
+        self.handle = handle
+        self.interval = interval
+        self.rounds = [ ]
+    ## DEF
+    
+    def run(self, stop):
+        """Compact until the given multiprocessing.Event is set and return the rounds"""
+        while not stop.wait(self.interval):
+            stats = self.handle.compact()
+            if stats == None:
+                logging.info("%s has nothing to compact" % self.handle)
+                break
+            self.rounds.append(stats)
+            logging.info("Compaction round %d: %s" % (len(self.rounds), formatRound(stats)))
+        ## WHILE
+        return (self.rounds)
+    ## DEF
+    
+## CLASS
+
+## ==============================================
+## formatRound
+## ==============================================
+def formatRound(stats):
+    tables = [ "%s -%d rows (~%d KB freed of %d KB)" % (name, t["rows"], t["bytes_freed"] / 1024, t["bytes"] / 1024) \
+               for name, t in sorted(stats["tables"].items()) ]
+    probes = [ "%s %.2f -> %.2f ms" % (name, stats["probe_before"][name], stats["probe_after"][name]) \
+               for name in sorted(stats["probe_before"].keys()) ]
+    return "%s; %s [%.1f sec]" % (", ".join(tables), ", ".join(probes), stats["duration"])
+## DEF
+
+## ==============================================
+## formatSummary
+## ==============================================
+def formatSummary(rounds):
+    """Total rows and space reclaimed over all of the rounds, and the lookup
+    latencies before the first round and after the last one"""
+    if len(rounds) == 0: return "Compaction: no rounds were run"
+    
+    ret = "Compaction: %d rounds in %.1f sec" % (len(rounds), sum([ r["duration"] for r in rounds ]))
+    for name in sorted(rounds[0]["tables"].keys()):
+        rows = sum([ r["tables"][name]["rows"] for r in rounds ])
+        freed = sum([ r["tables"][name]["bytes_freed"] for r in rounds ])
+        ret += "\n  %-20s %d rows removed, ~%d KB freed for reuse, %d KB now" % \
+               (name, rows, freed / 1024, rounds[-1]["tables"][name]["bytes"] / 1024)
+    ## FOR
+    for name in sorted(rounds[0]["probe_before"].keys()):
+        ret += "\n  %-20s %.2f ms before the first round, %.2f ms after the last" % \
+               (name, rounds[0]["probe_before"][name], rounds[-1]["probe_after"][name])
+    ## FOR
+    return (ret)
+## DEF
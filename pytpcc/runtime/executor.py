@@ -44,21 +44,28 @@ from util import *
 
 class Executor:
     
-    def __init__(self, driver, scaleParameters, txnprob, stop_on_error = False):
+    def __init__(self, driver, scaleParameters, txnprob, stop_on_error = False, home = None, warehouses = None):
         self.driver = driver
         self.scaleParameters = scaleParameters
         self.stop_on_error = stop_on_error
+        ## The (w_id, d_id) of the terminal the transactions come from, if any (see TPC-C 2.8.1.1)
+        self.home = home
+        ## The warehouses that this executor picks its home W_IDs from (see Partitioner.clientWarehouses).
+        ## Remote warehouses are still chosen from the whole range
+        self.warehouses = warehouses
+        self.mix = list(txnprob)
         self.txnprob = [ sum(txnprob[:i+1]) for i in range(len(txnprob)) ]
     ## DEF
     
-    def execute(self, duration):
-        r = results.Results()
+    def execute(self, duration, warmup = 0, cooldown = 0, interval = 1.0):
+        r = results.Results(warmup, cooldown, interval, self.mix, self.scaleParameters.warehouses)
         assert r
-        logging.info("Executing benchmark for %d seconds" % duration)
-        start = r.startBenchmark()
+        logging.info("Executing benchmark for %d seconds [warmup=%d, cooldown=%d]" % (duration, warmup, cooldown))
+        start = r.startBenchmark(duration)
         debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
-        while (time.time() - start) <= duration:
+        ## The warmup and cooldown windows run on top of the measured duration
+        while (time.time() - start) <= (warmup + duration + cooldown):
             txn, params = self.doOne()
             txn_id = r.startTransaction(txn)
             
@@ -89,22 +96,39 @@ class Executor:
         ## This is not strictly accurate: The requirement is for certain
         ## *minimum* percentages to be maintained. This is close to the right
         ## thing, but not precisely correct. See TPC-C 5.2.4 (page 68).
+        txn = self.chooseTransaction()
+        return (txn, self.generateParams(txn))
+    ## DEF
+
+    def chooseTransaction(self):
+        """Select the type of the next transaction according to the mix"""
         x = rand.number(1, self.txnprob[4])
-        params = None
-        txn = None
         if x <= self.txnprob[0]: ## 4%
-            txn, params = (constants.TransactionTypes.STOCK_LEVEL, self.generateStockLevelParams())
+            return constants.TransactionTypes.STOCK_LEVEL
         elif x <= self.txnprob[1]: ## 4%
-            txn, params = (constants.TransactionTypes.DELIVERY, self.generateDeliveryParams())
+            return constants.TransactionTypes.DELIVERY
         elif x <= self.txnprob[2]: ## 4%
-            txn, params = (constants.TransactionTypes.ORDER_STATUS, self.generateOrderStatusParams())
+            return constants.TransactionTypes.ORDER_STATUS
         elif x <= self.txnprob[3]: ## 43%
-            txn, params = (constants.TransactionTypes.PAYMENT, self.generatePaymentParams())
+            return constants.TransactionTypes.PAYMENT
         else: ## 45%
             assert x > self.txnprob[3]
-            txn, params = (constants.TransactionTypes.NEW_ORDER, self.generateNewOrderParams())
-        
-        return (txn, params)
+            return constants.TransactionTypes.NEW_ORDER
+    ## DEF
+
+    def generateParams(self, txn):
+        """Return the parameters for a transaction of the given type"""
+        if txn == constants.TransactionTypes.STOCK_LEVEL:
+            return self.generateStockLevelParams()
+        elif txn == constants.TransactionTypes.DELIVERY:
+            return self.generateDeliveryParams()
+        elif txn == constants.TransactionTypes.ORDER_STATUS:
+            return self.generateOrderStatusParams()
+        elif txn == constants.TransactionTypes.PAYMENT:
+            return self.generatePaymentParams()
+        else:
+            assert txn == constants.TransactionTypes.NEW_ORDER
+            return self.generateNewOrderParams()
     ## DEF
 
     ## ----------------------------------------------
@@ -227,12 +251,15 @@ class Executor:
     def generateStockLevelParams(self):
         """Returns parameters for STOCK_LEVEL"""
         w_id = self.makeWarehouseId()
-        d_id = self.makeDistrictId()
+        ## A terminal always checks the stock level of its own district
+        d_id = self.home[1] if self.home else self.makeDistrictId()
         threshold = rand.number(constants.MIN_STOCK_LEVEL_THRESHOLD, constants.MAX_STOCK_LEVEL_THRESHOLD)
         return makeParameterDict(locals(), "w_id", "d_id", "threshold")
     ## DEF
 
     def makeWarehouseId(self):
+        if self.home: return self.home[0]
+        if self.warehouses: return self.warehouses[rand.number(0, len(self.warehouses)-1)]
         w_id = rand.number(self.scaleParameters.starting_warehouse, self.scaleParameters.ending_warehouse)
         assert(w_id >= self.scaleParameters.starting_warehouse), "Invalid W_ID: %d" % w_id
         assert(w_id <= self.scaleParameters.ending_warehouse), "Invalid W_ID: %d" % w_id
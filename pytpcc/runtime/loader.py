@@ -31,34 +31,221 @@
 
 import os
 import sys
+import Queue
+import threading
+import time
 
 import logging
 from datetime import datetime
-from random import shuffle
 from pprint import pprint,pformat
 
 import constants
 from util import *
 
+## Data generator backends that can be passed to getLoaderClass
+GENERATORS = [ "python", "numpy" ]
+
+## Number of batches the generator thread may get ahead of the driver
+DEFAULT_PIPELINE_DEPTH = 4
+
+## Kinds of load units. See makeLoadUnits
+UNIT_ITEM = "item"
+UNIT_STOCK = "stock"
+UNIT_DISTRICT = "district"
+UNIT_DELIVERY = "delivery"
+
+## Number of ITEM rows in each load unit
+ITEM_CHUNK_SIZE = 10000
+
+## ==============================================
+## getLoaderClass
+## ==============================================
+def getLoaderClass(generator):
+    """Return the Loader implementation for the given data generator backend"""
+    assert generator in GENERATORS, "Unexpected generator '%s'" % generator
+    if generator == "numpy":
+        ## NumPy is optional, so only import it when it is asked for
+        import nploader
+        return nploader.NumpyLoader
+    return Loader
+## DEF
+
+## ==============================================
+## makeLoadUnits
+## ==============================================
+def makeLoadUnits(scaleParameters, loadItems):
+    """
+        Split the initial load into units that any loader can pick up. Returns
+        a list of phases, where each phase is a list of units. The units of a
+        phase only depend on the rows loaded by the previous phases (foreign
+        keys), so a phase has to be finished before the next one is started.
+        A unit is (UNIT_ITEM, first_i_id, last_i_id) or (kind, w_id).
+    """
+    phases = [ ]
+    if loadItems:
+        phases.append([ (UNIT_ITEM, first, min(first + ITEM_CHUNK_SIZE - 1, scaleParameters.items)) for first in range(1, scaleParameters.items+1, ITEM_CHUNK_SIZE) ])
+    w_ids = range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1)
+    for kind in [ UNIT_STOCK, UNIT_DISTRICT, UNIT_DELIVERY ]:
+        phases.append([ (kind, w_id) for w_id in w_ids ])
+    return (phases)
+## DEF
+
+## ==============================================
+## interleaveUnits
+## ==============================================
+def interleaveUnits(units, partitioner):
+    """
+        Reorder the warehouse units of a phase so that consecutive units go to
+        different shards. The loaders pull units off the front of the queue, so
+        this keeps every shard busy instead of loading one block at a time.
+    """
+    byShard = { }
+    for unit in units:
+        shard = partitioner.shard(unit[1]) if unit[0] != UNIT_ITEM else -1
+        byShard.setdefault(shard, [ ]).append(unit)
+    queues = [ byShard[s] for s in sorted(byShard.keys()) ]
+    ret = [ ]
+    for i in range(max([ len(q) for q in queues ] + [ 0 ])):
+        ret.extend([ q[i] for q in queues if i < len(q) ])
+    return (ret)
+## DEF
+
+## ==============================================
+## unitName
+## ==============================================
+def unitName(unit):
+    if unit[0] == UNIT_ITEM:
+        return "%s[I_ID=%d-%d]" % (unit[0].upper(), unit[1], unit[2])
+    return "%s[W_ID=%d]" % (unit[0].upper(), unit[1])
+## DEF
+
+## ==============================================
+## unitRows
+## ==============================================
+def unitRows(scaleParameters, unit):
+    """Approximate number of rows generated by the given load unit"""
+    kind = unit[0]
+    sp = scaleParameters
+    if kind == UNIT_ITEM:
+        return unit[2] - unit[1] + 1
+    elif kind == UNIT_STOCK:
+        return 1 + 2 * sp.items
+    elif kind == UNIT_DISTRICT:
+        avgOrderLines = (constants.MIN_OL_CNT + constants.MAX_OL_CNT) / 2.0
+        return sp.districtsPerWarehouse * (1 + sp.customersPerDistrict * (4 + avgOrderLines))
+    elif kind == UNIT_DELIVERY:
+        return (sp.customersPerDistrict - sp.newOrdersPerDistrict) * (1 + sp.districtsPerWarehouse)
+    assert False, "Unexpected load unit %s" % str(unit)
+## DEF
+
+## ==============================================
+## LoadProgress
+## ==============================================
+class LoadProgress:
+    """
+        Tracks the load units finished by all of the loaders and logs the
+        overall progress, with an ETA based on the rows loaded so far.
+    """
+    
+    def __init__(self, scaleParameters, phases):
+        self.scaleParameters = scaleParameters
+        self.num_units = sum(map(len, phases))
+        self.total_rows = sum([ unitRows(scaleParameters, unit) for phase in phases for unit in phase ])
+        self.finished_units = 0
+        self.finished_rows = 0
+        self.start = time.time()
+    ## DEF
+    
+    def finished(self, unit, client_id, elapsed):
+        self.finished_units += 1
+        self.finished_rows += unitRows(self.scaleParameters, unit)
+        duration = time.time() - self.start
+        eta = duration * (self.total_rows - self.finished_rows) / max(self.finished_rows, 1)
+        logging.info("LOAD - %s finished by client %d in %.1f sec [%d / %d units, %.1f%%, ETA %d sec]" % \
+                     (unitName(unit), client_id, elapsed, self.finished_units, self.num_units,
+                      100.0 * self.finished_rows / max(self.total_rows, 1), eta))
+    ## DEF
+    
+## CLASS
+
 class Loader:
+    """
+        Generates the initial database and hands it to the driver in batches.
+        With a pipeline depth above zero the data is generated in a separate
+        thread and the batches are passed to the calling thread through a
+        bounded queue, so generation overlaps the driver's I/O and at most
+        pipelineDepth batches are held in memory at any time. The driver is
+        only ever called from the thread that called execute().
+    """
     
-    def __init__(self, handle, scaleParameters, w_ids, needLoadItems):
+    def __init__(self, handle, scaleParameters, w_ids, needLoadItems, pipelineDepth = DEFAULT_PIPELINE_DEPTH):
         self.handle = handle
         self.scaleParameters = scaleParameters
         self.w_ids = w_ids
         self.needLoadItems = needLoadItems
         self.batch_size = 2500
+        self.columnar = handle.supportsLoadColumns()
+        self.pipelineDepth = pipelineDepth
+        self.queue = None
+        self.aborted = False
+        self.finishItemPending = False
         
     ## ==============================================
     ## execute
     ## ==============================================
     def execute(self):
+        self.run(self.generate)
+        return (None)
+
+    ## ==============================================
+    ## executeUnit
+    ## ==============================================
+    def executeUnit(self, unit):
+        """Load a single unit from makeLoadUnits"""
+        self.run(self.generateUnit, unit)
+
+    ## ==============================================
+    ## finishUnits
+    ## ==============================================
+    def finishUnits(self):
+        """Must be called after the last call to executeUnit"""
+        if self.finishItemPending:
+            self.handle.loadFinishItem()
+            self.finishItemPending = False
+
+    ## ==============================================
+    ## run
+    ## ==============================================
+    def run(self, func, *args):
+        if self.pipelineDepth <= 0:
+            func(*args)
+            return
+        
+        self.aborted = False
+        self.queue = Queue.Queue(self.pipelineDepth)
+        producer = threading.Thread(target=self.produce, args=(func, args), name="LoaderGenerator")
+        producer.daemon = True
+        producer.start()
+        try:
+            self.consume()
+        except:
+            ## Unblock the generator thread so that it can stop
+            self.aborted = True
+            raise
+        finally:
+            producer.join()
+            self.queue = None
+
+    ## ==============================================
+    ## generate
+    ## ==============================================
+    def generate(self):
         
         ## Item Table
         if self.needLoadItems:
             logging.debug("Loading ITEM table")
             self.loadItems()
-            self.handle.loadFinishItem()
+            self.submit(self.handle.loadFinishItem)
             
         ## Then create the warehouse-specific tuples
         for w_id in self.w_ids:
@@ -68,33 +255,131 @@ class Loader:
         for w_id in self.w_ids:
             self.loadWarehouseDeliveries(w_id)
         for w_id in self.w_ids:
-            self.handle.loadFinishWarehouse(w_id)
+            self.submit(self.handle.loadFinishWarehouse, w_id)
         ## FOR
+
+    ## ==============================================
+    ## generateUnit
+    ## ==============================================
+    def generateUnit(self, unit):
+        kind = unit[0]
         
-        return (None)
+        ## The ITEM phase is over once any other unit shows up
+        if kind != UNIT_ITEM and self.finishItemPending:
+            self.submit(self.handle.loadFinishItem)
+            self.finishItemPending = False
+        
+        self.submit(self.handle.loadStartUnit, unit)
+        if kind == UNIT_ITEM:
+            self.loadItems(unit[1], unit[2])
+            self.finishItemPending = True
+        elif kind == UNIT_STOCK:
+            self.loadWarehouse(unit[1])
+        elif kind == UNIT_DISTRICT:
+            self.loadDistricts(unit[1])
+        elif kind == UNIT_DELIVERY:
+            self.loadWarehouseDeliveries(unit[1])
+            self.submit(self.handle.loadFinishWarehouse, unit[1])
+        else:
+            assert False, "Unexpected load unit %s" % str(unit)
+        self.submit(self.handle.loadFinishUnit, unit)
+
+    ## ==============================================
+    ## produce
+    ## ==============================================
+    def produce(self, func, args):
+        """Body of the generator thread. The last item in the queue is always
+        (None, exc_info), where exc_info is None if generation succeeded."""
+        exc_info = None
+        try:
+            func(*args)
+        except:
+            exc_info = sys.exc_info()
+        if not self.aborted:
+            self.queue.put((None, exc_info))
+
+    ## ==============================================
+    ## consume
+    ## ==============================================
+    def consume(self):
+        """Run the driver calls queued by the generator thread until it is done"""
+        while True:
+            func, args = self.queue.get()
+            if func == None:
+                if args != None: raise args[0], args[1], args[2]
+                break
+            func(*args)
+        ## WHILE
+
+    ## ==============================================
+    ## submit
+    ## ==============================================
+    def submit(self, func, *args):
+        """Call func(*args) in the driver's thread, after everything submitted before it"""
+        if self.queue == None:
+            func(*args)
+            return
+        
+        while not self.aborted:
+            try:
+                self.queue.put((func, args), True, 1.0)
+                return
+            except Queue.Full:
+                pass
+        ## WHILE
+        raise Exception("The data loader was aborted")
+    ## DEF
+
+    ## ==============================================
+    ## loadTuples
+    ## ==============================================
+    def loadTuples(self, tableName, tuples):
+        if len(tuples) == 0: return
+        self.submit(self.handle.loadTuples, tableName, tuples)
+    ## DEF
+
+    ## ==============================================
+    ## loadColumns
+    ## ==============================================
+    def loadColumns(self, tableName, columns):
+        """Pass columns to the driver in batches of at most batch_size rows.
+        If the driver can't take columns, the tuples are only built here
+        at the driver boundary."""
+        num_rows = len(columns[0])
+        for offset in range(0, num_rows, self.batch_size):
+            batch = [ column[offset:offset + self.batch_size] for column in columns ]
+            if self.columnar:
+                self.submit(self.handle.loadColumns, tableName, batch)
+            else:
+                self.submit(self.handle.loadTuples, tableName, zip(*batch))
+        ## FOR
+    ## DEF
 
     ## ==============================================
     ## loadItems
     ## ==============================================
-    def loadItems(self):
+    def loadItems(self, first = 1, last = None):
+        if last == None: last = self.scaleParameters.items
+        num_items = last - first + 1
+        
         ## Select 10% of the rows to be marked "original"
-        originalRows = rand.selectUniqueIds(self.scaleParameters.items / 10, 1, self.scaleParameters.items)
+        originalRows = rand.selectUniqueIds(num_items / 10, first, last)
         
         ## Load all of the items
         tuples = [ ]
         total_tuples = 0
-        for i in range(1, self.scaleParameters.items+1):
+        for i in range(first, last+1):
             original = (i in originalRows)
             tuples.append(self.generateItem(i, original))
             total_tuples += 1
             if len(tuples) == self.batch_size:
-                logging.debug("LOAD - %s: %5d / %d" % (constants.TABLENAME_ITEM, total_tuples, self.scaleParameters.items))
-                self.handle.loadTuples(constants.TABLENAME_ITEM, tuples)
+                logging.debug("LOAD - %s: %5d / %d" % (constants.TABLENAME_ITEM, total_tuples, num_items))
+                self.loadTuples(constants.TABLENAME_ITEM, tuples)
                 tuples = [ ]
         ## FOR
         if len(tuples) > 0:
-            logging.debug("LOAD - %s: %5d / %d" % (constants.TABLENAME_ITEM, total_tuples, self.scaleParameters.items))
-            self.handle.loadTuples(constants.TABLENAME_ITEM, tuples)
+            logging.debug("LOAD - %s: %5d / %d" % (constants.TABLENAME_ITEM, total_tuples, num_items))
+            self.loadTuples(constants.TABLENAME_ITEM, tuples)
     ## DEF
 
     ## ==============================================
@@ -105,7 +390,7 @@ class Loader:
         
         ## WAREHOUSE
         w_tuples = [ self.generateWarehouse(w_id) ]
-        self.handle.loadTuples(constants.TABLENAME_WAREHOUSE, w_tuples)
+        self.loadTuples(constants.TABLENAME_WAREHOUSE, w_tuples)
 
         ## Select 10% of the stock to be marked "original"
         s_tuples = [ ]
@@ -118,16 +403,16 @@ class Loader:
             sh_tuples.append(self.generateStockHistory(w_id, i_id))
             if len(s_tuples) >= self.batch_size:
                 logging.debug("LOAD - %s [W_ID=%d]: %5d / %d" % (constants.TABLENAME_STOCK, w_id, total_tuples, self.scaleParameters.items))
-                self.handle.loadTuples(constants.TABLENAME_STOCK, s_tuples)
-                self.handle.loadTuples(constants.TABLENAME_STOCK_HISTORY, sh_tuples)
+                self.loadTuples(constants.TABLENAME_STOCK, s_tuples)
+                self.loadTuples(constants.TABLENAME_STOCK_HISTORY, sh_tuples)
                 s_tuples = [ ]
                 sh_tuples = [ ]
             total_tuples += 1
         ## FOR
         if len(s_tuples) > 0:
             logging.debug("LOAD - %s [W_ID=%d]: %5d / %d" % (constants.TABLENAME_STOCK, w_id, total_tuples, self.scaleParameters.items))
-            self.handle.loadTuples(constants.TABLENAME_STOCK, s_tuples)
-            self.handle.loadTuples(constants.TABLENAME_STOCK_HISTORY, sh_tuples)
+            self.loadTuples(constants.TABLENAME_STOCK, s_tuples)
+            self.loadTuples(constants.TABLENAME_STOCK_HISTORY, sh_tuples)
     ## DEF
 
     ## ==============================================
@@ -140,12 +425,11 @@ class Loader:
         d_tuples = [ ]
         for d_id in range(1, self.scaleParameters.districtsPerWarehouse+1):
             d_tuples = [ self.generateDistrict(w_id, d_id) ]
+            self.loadTuples(constants.TABLENAME_DISTRICT, d_tuples)
             
             c_tuples = [ ]
             ch_tuples = [ ]
             h_tuples = [ ]
-            dl_tuples = [ ]
-            dlo_tuples = [ ]
 
             ## Select 10% of the customers to have bad credit
             selectedRows = rand.selectUniqueIds(self.scaleParameters.customersPerDistrict / 10, 1, self.scaleParameters.customersPerDistrict)
@@ -161,10 +445,16 @@ class Loader:
                 ch_tuples.append(self.generateCustomerHistory(w_id, d_id, c_id))
                 h_tuples.append(self.generateHistory(w_id, d_id, c_id))
                 cIdPermutation.append(c_id)
+                if len(c_tuples) >= self.batch_size:
+                    self.loadCustomers(c_tuples, ch_tuples, h_tuples)
+                    c_tuples = [ ]
+                    ch_tuples = [ ]
+                    h_tuples = [ ]
             ## FOR
+            self.loadCustomers(c_tuples, ch_tuples, h_tuples)
             assert cIdPermutation[0] == 1
             assert cIdPermutation[self.scaleParameters.customersPerDistrict - 1] == self.scaleParameters.customersPerDistrict
-            shuffle(cIdPermutation)
+            rand.shuffle(cIdPermutation)
             
             o_tuples = [ ]
             ol_tuples = [ ]
@@ -178,18 +468,30 @@ class Loader:
                 for ol_number in range(0, o_ol_cnt):
                     ol_tuples.append(self.generateOrderLine(o_id, w_id, d_id, ol_number, self.scaleParameters.items))
                 ## FOR
+                
+                ## The orders have to be sent before their order lines
+                if len(ol_tuples) >= self.batch_size:
+                    self.loadTuples(constants.TABLENAME_ORDERS, o_tuples)
+                    self.loadTuples(constants.TABLENAME_ORDER_LINE, ol_tuples)
+                    o_tuples = [ ]
+                    ol_tuples = [ ]
             ## FOR
-            
-            self.handle.loadTuples(constants.TABLENAME_DISTRICT, d_tuples)
-            self.handle.loadTuples(constants.TABLENAME_CUSTOMER, c_tuples)
-            self.handle.loadTuples(constants.TABLENAME_CUSTOMER_HISTORY, ch_tuples)
-            self.handle.loadTuples(constants.TABLENAME_ORDERS, o_tuples)
-            self.handle.loadTuples(constants.TABLENAME_ORDER_LINE, ol_tuples)
-            self.handle.loadTuples(constants.TABLENAME_HISTORY, h_tuples)
+            self.loadTuples(constants.TABLENAME_ORDERS, o_tuples)
+            self.loadTuples(constants.TABLENAME_ORDER_LINE, ol_tuples)
         ## FOR
         
     ## DEF
 
+    ## ==============================================
+    ## loadCustomers
+    ## ==============================================
+    def loadCustomers(self, c_tuples, ch_tuples, h_tuples):
+        """Send a batch of customers followed by the history rows that refer to them"""
+        self.loadTuples(constants.TABLENAME_CUSTOMER, c_tuples)
+        self.loadTuples(constants.TABLENAME_CUSTOMER_HISTORY, ch_tuples)
+        self.loadTuples(constants.TABLENAME_HISTORY, h_tuples)
+    ## DEF
+
     def loadWarehouseDeliveries(self, w_id):
         logging.debug("LOAD - %s: %d / %d" % (constants.TABLENAME_WAREHOUSE, w_id, len(self.w_ids)))
     
@@ -204,12 +506,19 @@ class Loader:
             for d_id in range(1, self.scaleParameters.districtsPerWarehouse+1):
                 dlo_tuples.append(self.generateDeliveryOrder(dl_delivery_d, w_id, o_id, d_id))
             ## FOR
+            
+            ## Each batch of DELIVERY rows has to be sent before the DELIVERY_ORDERS rows that refer to it
+            if len(dlo_tuples) >= self.batch_size:
+                self.loadTuples(constants.TABLENAME_DELIVERY, dl_tuples)
+                self.loadTuples(constants.TABLENAME_DELIVERY_ORDERS, dlo_tuples)
+                dl_tuples = [ ]
+                dlo_tuples = [ ]
         ## FOR
 
-        self.handle.loadTuples(constants.TABLENAME_DELIVERY, dl_tuples)
-        self.handle.loadTuples(constants.TABLENAME_DELIVERY_ORDERS, dlo_tuples)
+        self.loadTuples(constants.TABLENAME_DELIVERY, dl_tuples)
+        self.loadTuples(constants.TABLENAME_DELIVERY_ORDERS, dlo_tuples)
         for d_id in range(1, self.scaleParameters.districtsPerWarehouse+1):
-            self.handle.loadFinishDistrict(w_id, d_id)
+            self.submit(self.handle.loadFinishDistrict, w_id, d_id)
     ## DEF
 
     ## ==============================================
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import logging
+from datetime import datetime
+
+import numpy
+
+import constants
+from util import *
+from util import nprand
+from loader import Loader, DEFAULT_PIPELINE_DEPTH
+
+## ==============================================
+## NumpyLoader
+## ==============================================
+class NumpyLoader(Loader):
+    """
+        A Loader that generates whole columns at a time with NumPy instead of
+        calling rand once per field. The columns go straight to drivers that
+        support loadColumns; everyone else gets tuples built at the last moment.
+    """
+    
+    def __init__(self, handle, scaleParameters, w_ids, needLoadItems, pipelineDepth = DEFAULT_PIPELINE_DEPTH):
+        Loader.__init__(self, handle, scaleParameters, w_ids, needLoadItems, pipelineDepth)
+        nprand.seed()
+    
+    ## ==============================================
+    ## executeUnit
+    ## ==============================================
+    def executeUnit(self, unit):
+        ## Every unit gets its own seed on rand, so the NumPy stream has to follow it
+        nprand.seed()
+        Loader.executeUnit(self, unit)
+    
+    ## ==============================================
+    ## loadItems
+    ## ==============================================
+    def loadItems(self, first = 1, last = None):
+        if last == None: last = self.scaleParameters.items
+        num_items = last - first + 1
+        
+        ## Select 10% of the rows to be marked "original"
+        originalRows = nprand.selectMask(num_items / 10, num_items)
+        
+        for offset in range(0, num_items, self.batch_size):
+            size = min(self.batch_size, num_items - offset)
+            i_ids = range(first + offset, first + offset + size)
+            i_im_ids = nprand.number(constants.MIN_IM, constants.MAX_IM, size).tolist()
+            i_names = nprand.astring(constants.MIN_I_NAME, constants.MAX_I_NAME, size)
+            i_prices = nprand.fixedPoint(constants.MONEY_DECIMALS, constants.MIN_PRICE, constants.MAX_PRICE, size).tolist()
+            i_datas = nprand.astring(constants.MIN_I_DATA, constants.MAX_I_DATA, size)
+            nprand.fillOriginal(i_datas, numpy.flatnonzero(originalRows[offset:offset + size]))
+            
+            logging.debug("LOAD - %s: %5d / %d" % (constants.TABLENAME_ITEM, offset + size, num_items))
+            self.loadColumns(constants.TABLENAME_ITEM, [ i_ids, i_im_ids, i_names, i_prices, i_datas ])
+        ## FOR
+    ## DEF
+
+    ## ==============================================
+    ## loadWarehouse
+    ## ==============================================
+    def loadWarehouse(self, w_id):
+        logging.debug("LOAD - %s: %d / %d" % (constants.TABLENAME_WAREHOUSE, w_id, len(self.w_ids)))
+        num_items = self.scaleParameters.items
+        
+        ## WAREHOUSE
+        w_tuples = [ self.generateWarehouse(w_id) ]
+        self.loadTuples(constants.TABLENAME_WAREHOUSE, w_tuples)
+
+        ## Select 10% of the stock to be marked "original"
+        selectedRows = nprand.selectMask(num_items / 10, num_items)
+        
+        for offset in range(0, num_items, self.batch_size):
+            size = min(self.batch_size, num_items - offset)
+            s_i_ids = range(offset + 1, offset + size + 1)
+            s_w_ids = [ w_id ] * size
+            s_dists = [ nprand.astring(constants.DIST, constants.DIST, size) for i in range(constants.DISTRICTS_PER_WAREHOUSE) ]
+            s_datas = nprand.astring(constants.MIN_I_DATA, constants.MAX_I_DATA, size)
+            nprand.fillOriginal(s_datas, numpy.flatnonzero(selectedRows[offset:offset + size]))
+            
+            sh_dates = [ datetime.now() ] * size
+            sh_quantities = nprand.number(constants.MIN_QUANTITY, constants.MAX_QUANTITY, size).tolist()
+            
+            logging.debug("LOAD - %s [W_ID=%d]: %5d / %d" % (constants.TABLENAME_STOCK, w_id, offset + size, num_items))
+            self.loadColumns(constants.TABLENAME_STOCK, [ s_i_ids, s_w_ids ] + s_dists + [ s_datas ])
+            self.loadColumns(constants.TABLENAME_STOCK_HISTORY, [ s_i_ids, s_w_ids, sh_dates, sh_quantities ])
+        ## FOR
+    ## DEF
+
+    ## ==============================================
+    ## loadDistricts
+    ## ==============================================
+    def loadDistricts(self, w_id):
+        logging.debug("LOAD - %s: %d / %d" % (constants.TABLENAME_WAREHOUSE, w_id, len(self.w_ids)))
+        num_customers = self.scaleParameters.customersPerDistrict
+        
+        for d_id in range(1, self.scaleParameters.districtsPerWarehouse+1):
+            d_tuples = [ self.generateDistrict(w_id, d_id) ]
+            
+            now = datetime.now()
+            c_ids = range(1, num_customers + 1)
+            d_ids = [ d_id ] * num_customers
+            w_ids = [ w_id ] * num_customers
+            dates = [ now ] * num_customers
+            
+            ## CUSTOMER
+            ## Select 10% of the customers to have bad credit
+            badCredit = nprand.selectMask(num_customers / 10, num_customers)
+            c_credits = numpy.where(badCredit, constants.BAD_CREDIT, constants.GOOD_CREDIT).tolist()
+            
+            ## The first 1000 customers get sequential last names, the rest are random. See TPC-C 4.3.3.1
+            c_lasts = nprand.NURand(255, 0, 999, num_customers)
+            c_lasts[:min(1000, num_customers)] = numpy.arange(min(1000, num_customers))
+            
+            c_columns = [
+                c_ids, d_ids, w_ids,
+                nprand.astring(constants.MIN_FIRST, constants.MAX_FIRST, num_customers),
+                [ constants.MIDDLE ] * num_customers,
+                nprand.lastNames(c_lasts),
+                nprand.astring(constants.MIN_STREET, constants.MAX_STREET, num_customers),
+                nprand.astring(constants.MIN_STREET, constants.MAX_STREET, num_customers),
+                nprand.astring(constants.MIN_CITY, constants.MAX_CITY, num_customers),
+                nprand.astring(constants.STATE, constants.STATE, num_customers),
+                self.generateZips(num_customers),
+                nprand.nstring(constants.PHONE, constants.PHONE, num_customers),
+                dates,
+                c_credits,
+                [ constants.INITIAL_CREDIT_LIM ] * num_customers,
+                nprand.fixedPoint(constants.DISCOUNT_DECIMALS, constants.MIN_DISCOUNT, constants.MAX_DISCOUNT, num_customers).tolist(),
+                nprand.astring(constants.MIN_C_DATA, constants.MAX_C_DATA, num_customers),
+            ]
+            
+            ## CUSTOMER_HISTORY + HISTORY
+            ch_columns = [ c_ids, d_ids, w_ids, dates, nprand.astring(constants.MIN_C_DATA, constants.MAX_C_DATA, num_customers) ]
+            h_columns = [ c_ids, d_ids, w_ids, d_ids, w_ids, dates,
+                          [ constants.INITIAL_AMOUNT ] * num_customers,
+                          nprand.astring(constants.MIN_DATA, constants.MAX_DATA, num_customers) ]
+            
+            ## ORDERS
+            ## TPC-C 4.3.3.1. says that o_c_id should be a permutation of [1, 3000]. See Loader.loadDistricts
+            o_ol_cnts = nprand.number(constants.MIN_OL_CNT, constants.MAX_OL_CNT, num_customers)
+            o_columns = [ c_ids, d_ids, w_ids,
+                          nprand.permutation(1, num_customers).tolist(),
+                          o_ol_cnts.tolist(),
+                          [ constants.INITIAL_ALL_LOCAL ] * num_customers,
+                          dates ]
+            
+            ## ORDER_LINE
+            ol_columns = self.generateOrderLineColumns(w_id, d_id, o_ol_cnts)
+            
+            self.loadTuples(constants.TABLENAME_DISTRICT, d_tuples)
+            self.loadColumns(constants.TABLENAME_CUSTOMER, c_columns)
+            self.loadColumns(constants.TABLENAME_CUSTOMER_HISTORY, ch_columns)
+            self.loadColumns(constants.TABLENAME_HISTORY, h_columns)
+            self.loadColumns(constants.TABLENAME_ORDERS, o_columns)
+            self.loadColumns(constants.TABLENAME_ORDER_LINE, ol_columns)
+        ## FOR
+    ## DEF
+
+    ## ==============================================
+    ## generateOrderLineColumns
+    ## ==============================================
+    def generateOrderLineColumns(self, ol_w_id, ol_d_id, o_ol_cnts):
+        """Return the ORDER_LINE columns for every order in the district, where
+        o_ol_cnts has the number of order lines of each order"""
+        total = int(o_ol_cnts.sum())
+        
+        ## Each order's lines are numbered starting from zero, like Loader.generateOrderLine
+        ol_o_ids = numpy.repeat(numpy.arange(1, len(o_ol_cnts) + 1), o_ol_cnts)
+        ol_numbers = numpy.arange(total) - numpy.repeat(numpy.cumsum(o_ol_cnts) - o_ol_cnts, o_ol_cnts)
+        ol_i_ids = nprand.number(1, self.scaleParameters.items, total)
+
+        ## 1% of items are from a remote warehouse
+        ol_supply_w_ids = numpy.empty(total, dtype=int)
+        ol_supply_w_ids.fill(ol_w_id)
+        if self.scaleParameters.warehouses > 1:
+            remote = (nprand.number(1, 100, total) == 1)
+            ol_supply_w_ids[remote] = nprand.numberExcluding(self.scaleParameters.starting_warehouse,
+                                                             self.scaleParameters.ending_warehouse,
+                                                             ol_w_id, int(remote.sum()))
+        
+        ol_amounts = nprand.fixedPoint(constants.MONEY_DECIMALS, constants.MIN_AMOUNT, constants.MAX_PRICE * constants.MAX_OL_QUANTITY, total)
+        ol_amounts[ol_o_ids < (constants.INITIAL_ORDERS_PER_DISTRICT - constants.INITIAL_NEW_ORDERS_PER_DISTRICT)] = 0.00
+        
+        return [ ol_o_ids.tolist(),
+                 [ ol_d_id ] * total,
+                 [ ol_w_id ] * total,
+                 ol_numbers.tolist(),
+                 ol_i_ids.tolist(),
+                 ol_supply_w_ids.tolist(),
+                 [ constants.INITIAL_QUANTITY ] * total,
+                 ol_amounts.tolist(),
+                 nprand.astring(constants.DIST, constants.DIST, total) ]
+    ## DEF
+
+    ## ==============================================
+    ## generateZips
+    ## ==============================================
+    def generateZips(self, size):
+        length = constants.ZIP_LENGTH - len(constants.ZIP_SUFFIX)
+        return [ z + constants.ZIP_SUFFIX for z in nprand.nstring(length, length, size) ]
+    ## DEF
+## CLASS
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import sys
+import time
+import math
+import threading
+import logging
+import Queue
+
+import constants
+from util import *
+from executor import Executor
+
+## ==============================================
+## TerminalPool
+## ==============================================
+class TerminalPool:
+    """
+        Runs many virtual terminals in one client process instead of forking a
+        process for each of them. Every terminal is a thread with its own driver
+        (and so its own connection), Executor and random stream. The drivers
+        spend most of their time waiting on the database, which they do without
+        holding the GIL. The Results of the terminals are merged the same way
+        as the Results of several client processes.
+    """
+
+    def __init__(self, driverClass, ddl, config, scaleParameters, mix, terminals, stop_on_error = False, warehouses = None):
+        assert terminals > 0
+        self.driverClass = driverClass
+        self.ddl = ddl
+        self.config = config
+        self.scaleParameters = scaleParameters
+        self.mix = mix
+        self.terminals = terminals
+        self.stop_on_error = stop_on_error
+        self.warehouses = warehouses
+
+        self.ready = threading.Semaphore(0)
+        self.go = threading.Event()
+        self.lock = threading.Lock()
+        self.results = [ ]
+        self.error = None
+    ## DEF
+
+    def execute(self, duration, warmup = 0, cooldown = 0, interval = 1.0, seed = None, client_id = 0):
+        """Run all of the terminals for the given time and return their merged Results,
+        or -1 if one of them was stopped"""
+        threads = [ ]
+        for terminal in range(self.terminals):
+            t = threading.Thread(target=self.run, name="terminal-%d" % terminal,
+                                 args=(terminal, duration, warmup, cooldown, interval, seed, client_id))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        ## FOR
+
+        ## Every terminal connects before any of them starts, so the first ones don't
+        ## run alone while the others are still setting up
+        for t in threads:
+            self.ready.acquire()
+        logging.info("Started %d terminals" % self.terminals)
+        self.go.set()
+
+        ## join() without a timeout can't be interrupted
+        for t in threads:
+            while t.isAlive():
+                t.join(1.0)
+        ## FOR
+
+        if self.error != None:
+            raise self.error[0], self.error[1], self.error[2]
+        total = results.Results()
+        for r in self.results:
+            if type(r) == int and r == -1: return -1
+            total.append(r)
+        return total
+    ## DEF
+
+    def run(self, terminal, duration, warmup, cooldown, interval, seed, client_id):
+        driver = None
+        try:
+            try:
+                rand.seedThread(seed, "execute", client_id, terminal)
+                driver = self.driverClass(self.ddl)
+                config = dict(self.config)
+                config['execute'] = True
+                config['reset'] = False
+                driver.loadConfig(config)
+                e = Executor(driver, self.scaleParameters, self.mix, stop_on_error=self.stop_on_error, warehouses=self.warehouses)
+                driver.executeStart()
+            finally:
+                self.ready.release()
+            self.go.wait()
+            if self.error != None: return
+
+            r = e.execute(duration, warmup, cooldown, interval)
+            driver.executeFinish()
+            with self.lock:
+                self.results.append(r)
+        except:
+            logging.warn("Terminal %d failed: %s" % (terminal, sys.exc_info()[1]))
+            with self.lock:
+                if self.error == None: self.error = sys.exc_info()
+            ## Don't leave the other terminals waiting for this one
+            self.go.set()
+    ## DEF
+
+## CLASS
+
+## ==============================================
+## homeTerminals
+## ==============================================
+def homeTerminals(scaleParameters, client_id = 0, clients = 1, warehouses = None):
+    """Return the (w_id, d_id) of the terminals that the given client emulates. The
+    warehouses are dealt out round-robin unless the client was given its own, and
+    every warehouse has one terminal for each of its districts (TPC-C 4.2.2)"""
+    homes = [ ]
+    for w_id in range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1):
+        if warehouses != None:
+            if not w_id in warehouses: continue
+        elif (w_id - scaleParameters.starting_warehouse) % clients != client_id: continue
+        for d_id in range(1, min(scaleParameters.districtsPerWarehouse, constants.TERMINALS_PER_WAREHOUSE)+1):
+            homes.append((w_id, d_id))
+    ## FOR
+    return homes
+## DEF
+
+## ==============================================
+## TerminalEmulator
+## ==============================================
+class TerminalEmulator:
+    """
+        Emulates TPC-C terminals with keying and think times (TPC-C 5.2.5).
+        Each terminal is bound to its home warehouse and district, waits the
+        keying time of its next transaction, submits it and then thinks for a
+        negative exponential time before the next one. Most of the time a
+        terminal is only waiting, so the terminals are timers in a TimerWheel
+        instead of threads: one scheduler thread expires them into a queue and
+        a few workers, each with its own driver, run the transactions.
+
+        The response time of a transaction is measured from the moment its
+        terminal submitted it, so it includes any time spent waiting for a free
+        worker but not the keying and think times.
+    """
+
+    def __init__(self, driverClass, ddl, config, scaleParameters, mix, homes, workers = 1, stop_on_error = False):
+        assert homes
+        assert workers > 0
+        self.driverClass = driverClass
+        self.ddl = ddl
+        self.config = config
+        self.scaleParameters = scaleParameters
+        self.mix = mix
+        self.homes = homes
+        self.workers = workers
+        self.stop_on_error = stop_on_error
+
+        ## The transaction that each terminal is keying in
+        self.next = [ None ] * len(homes)
+        self.wheel = None
+        self.queue = Queue.Queue()
+        self.ready = threading.Semaphore(0)
+        self.go = threading.Event()
+        self.lock = threading.Lock()
+        self.results = [ ]
+        self.error = None
+    ## DEF
+
+    def execute(self, duration, warmup = 0, cooldown = 0, interval = 1.0, seed = None, client_id = 0):
+        """Emulate the terminals for the given time and return the merged Results of
+        the workers, or -1 if one of them was stopped"""
+        rand.seedThread(seed, "emulate", client_id)
+        threads = [ ]
+        for worker in range(self.workers):
+            t = threading.Thread(target=self.run, name="emulator-%d" % worker,
+                                 args=(worker, duration, warmup, cooldown, interval, seed, client_id))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        ## FOR
+        for t in threads:
+            self.ready.acquire()
+        if self.error != None:
+            self.go.set()
+            raise self.error[0], self.error[1], self.error[2]
+
+        ## Every terminal starts keying in its first transaction at a random point,
+        ## so they don't all submit at the same moment
+        start = time.time()
+        chooser = Executor(None, self.scaleParameters, self.mix)
+        self.wheel = timerwheel.TimerWheel(start)
+        for terminal in range(len(self.homes)):
+            self.next[terminal] = chooser.chooseTransaction()
+            keying = constants.KEYING_TIMES[self.next[terminal]]
+            self.wheel.schedule(start + rand.stream().random() * keying, terminal)
+        ## FOR
+        logging.info("Emulating %d terminals with %d workers" % (len(self.homes), self.workers))
+        self.go.set()
+
+        stop = start + warmup + duration + cooldown
+        try:
+            while time.time() <= stop and self.error == None:
+                time.sleep(self.wheel.tick)
+                with self.lock:
+                    expired = self.wheel.advance(time.time())
+                ## A terminal submits when its timer expires, which can be up to a tick
+                ## after it was due. That lag is the emulator's, not the system's
+                submitted = time.time()
+                for due, terminal in expired:
+                    self.queue.put((submitted, terminal))
+            ## WHILE
+        finally:
+            ## Terminals that are still waiting when the time is up are dropped
+            for t in threads:
+                self.queue.put(None)
+        for t in threads:
+            while t.isAlive():
+                t.join(1.0)
+        ## FOR
+
+        if self.error != None:
+            raise self.error[0], self.error[1], self.error[2]
+        total = results.Results()
+        for r in self.results:
+            if type(r) == int and r == -1: return -1
+            total.append(r)
+        return total
+    ## DEF
+
+    def run(self, worker, duration, warmup, cooldown, interval, seed, client_id):
+        driver = None
+        try:
+            try:
+                rand.seedThread(seed, "execute", client_id, worker)
+                driver = self.driverClass(self.ddl)
+                config = dict(self.config)
+                config['execute'] = True
+                config['reset'] = False
+                driver.loadConfig(config)
+                e = Executor(driver, self.scaleParameters, self.mix, stop_on_error=self.stop_on_error)
+                driver.executeStart()
+            finally:
+                self.ready.release()
+            self.go.wait()
+            if self.error != None: return
+
+            r = self.emulate(e, duration, warmup, cooldown, interval)
+            driver.executeFinish()
+            with self.lock:
+                self.results.append(r)
+        except:
+            logging.warn("Emulator worker %d failed: %s" % (worker, sys.exc_info()[1]))
+            with self.lock:
+                if self.error == None: self.error = sys.exc_info()
+            self.go.set()
+    ## DEF
+
+    def emulate(self, e, duration, warmup, cooldown, interval):
+        """Run the transactions of the terminals that come off the queue until the
+        scheduler sends None"""
+        r = results.Results(warmup, cooldown, interval, self.mix, self.scaleParameters.warehouses)
+        r.startBenchmark(duration)
+        while True:
+            entry = self.queue.get()
+            if entry == None: break
+            submitted, terminal = entry
+            txn = self.next[terminal]
+            e.home = self.homes[terminal]
+            params = e.generateParams(txn)
+
+            txn_id = r.startTransaction(txn, submitted)
+            try:
+                e.driver.executeTransaction(txn, params)
+                r.stopTransaction(txn_id)
+            except KeyboardInterrupt:
+                return -1
+            except (Exception, AssertionError) as ex:
+                logging.warn("Failed to execute Transaction '%s': %s" % (txn, ex))
+                if self.stop_on_error: raise
+                r.abortTransaction(txn_id)
+
+            ## The terminal thinks about this transaction and then keys in the next one
+            self.next[terminal] = e.chooseTransaction()
+            delay = self.thinkTime(txn) + constants.KEYING_TIMES[self.next[terminal]]
+            with self.lock:
+                self.wheel.schedule(time.time() + delay, terminal)
+        ## WHILE
+        r.stopBenchmark()
+        return r
+    ## DEF
+
+    def thinkTime(self, txn):
+        """Negative exponential think time with the mean of the transaction,
+        truncated at MAX_THINK_TIME_FACTOR times the mean (TPC-C 5.2.5.4)"""
+        mean = constants.THINK_TIMES[txn]
+        think = -math.log(1.0 - rand.stream().random()) * mean
+        return min(think, mean * constants.MAX_THINK_TIME_FACTOR)
+    ## DEF
+
+## CLASS
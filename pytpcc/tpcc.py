@@ -34,6 +34,7 @@ import re
 import argparse
 import glob
 import time 
+import traceback
 import multiprocessing
 from ConfigParser import SafeConfigParser
 from pprint import pprint,pformat
@@ -70,47 +71,97 @@ def getDrivers():
 ## ==============================================
 ## startLoading
 ## ==============================================
-def startLoading(driverClass, scaleParameters, args, config):
-    logging.debug("Creating client pool with %d processes" % args['clients'])
-    pool = multiprocessing.Pool(args['clients'])
+def startLoading(driverClass, scaleParameters, args, config, manifest, shardMap = None):
+    logging.debug("Creating %d loader processes" % args['clients'])
     debug = logging.getLogger().isEnabledFor(logging.DEBUG)
     
-    # Split the warehouses into chunks
-    w_ids = map(lambda x: [ ], range(args['clients']))
-    for w_id in range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1):
-        idx = w_id % args['clients']
-        w_ids[idx].append(w_id)
-    ## FOR
+    ## The loaders pull units from a shared queue, so a fast loader simply
+    ## takes more of them. Each phase has to finish before the next one is queued
+    phases = getLoadPhases(scaleParameters, manifest, shardMap)
+    progress = loader.LoadProgress(scaleParameters, phases)
+    tasks = multiprocessing.Queue()
+    finished = multiprocessing.Queue()
     
-    loader_results = [ ]
+    procs = [ ]
     for i in range(args['clients']):
-        r = pool.apply_async(loaderFunc, (driverClass, scaleParameters, args, config, w_ids[i], scaleParameters.starting_warehouse == 1))
-        loader_results.append(r)
+        p = multiprocessing.Process(target=loaderFunc, args=(driverClass, scaleParameters, args, config, tasks, finished, i, debug))
+        p.start()
+        procs.append(p)
     ## FOR
     
-    pool.close()
+    try:
+        for phase in phases:
+            for unit in phase:
+                tasks.put(unit)
+            for i in range(len(phase)):
+                client_id, unit, elapsed, error = finished.get()
+                if error != None:
+                    raise Exception("Loader %d failed: %s" % (client_id, error))
+                progress.finished(unit, client_id, elapsed)
+                if manifest: manifest.finish(unit)
+            ## FOR
+        ## FOR
+    except:
+        for p in procs: p.terminate()
+        raise
+    
+    for p in procs: tasks.put(None)
     logging.debug("Waiting for %d loaders to finish" % args['clients'])
-    pool.join()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0, "Loader process exited with code %d" % p.exitcode
+    ## FOR
+## DEF
+
+## ==============================================
+## getLoadPhases
+## ==============================================
+def getLoadPhases(scaleParameters, manifest, shardMap = None):
+    phases = loader.makeLoadUnits(scaleParameters, scaleParameters.starting_warehouse == 1)
+    if manifest: phases = manifest.pending(phases)
+    if shardMap: phases = [ loader.interleaveUnits(phase, shardMap) for phase in phases ]
+    return (phases)
+## DEF
+
+## ==============================================
+## loadUnit
+## ==============================================
+def loadUnit(l, args, unit):
+    """Load a single unit and return how long it took. Every unit has its own
+    seed, so the data does not depend on which loader happens to pick it up."""
+    rand.seedProcess(args['seed'], "load", *unit)
+    start = time.time()
+    l.executeUnit(unit)
+    return time.time() - start
 ## DEF
 
 ## ==============================================
 ## loaderFunc
 ## ==============================================
-def loaderFunc(driverClass, scaleParameters, args, config, w_ids, debug):
-    driver = driverClass(args['ddl'])
-    assert driver != None
-    logging.debug("Starting client execution: %s [warehouses=%d]" % (driver, len(w_ids)))
-    
-    config['load'] = True
-    config['execute'] = False
-    config['reset'] = False
-    driver.loadConfig(config)
-   
+def loaderFunc(driverClass, scaleParameters, args, config, tasks, finished, client_id, debug):
+    ## A loader that can't connect reports it like a failed unit, otherwise
+    ## startLoading would wait for it forever
+    unit = None
     try:
-        loadItems = (1 in w_ids)
-        l = loader.Loader(driver, scaleParameters, w_ids, loadItems)
+        driver = driverClass(args['ddl'])
+        assert driver != None
+        logging.debug("Starting client execution: %s" % driver)
+        
+        config['load'] = True
+        config['execute'] = False
+        config['reset'] = False
+        driver.loadConfig(config)
+        
+        w_ids = range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1)
+        l = loader.getLoaderClass(args['generator'])(driver, scaleParameters, w_ids, False, args['load_pipeline'])
         driver.loadStart()
-        l.execute()
+        while True:
+            unit = tasks.get()
+            if unit == None: break
+            elapsed = loadUnit(l, args, unit)
+            finished.put((client_id, unit, elapsed, None))
+        ## WHILE
+        l.finishUnits()
         driver.loadFinish()   
     except KeyboardInterrupt:
             return -1
@@ -118,6 +169,7 @@ def loaderFunc(driverClass, scaleParameters, args, config, w_ids, debug):
         logging.warn("Failed to load data: %s" % (ex))
         #if debug:
         traceback.print_exc(file=sys.stdout)
+        finished.put((client_id, unit, None, str(ex)))
         raise
         
 ## DEF
@@ -125,14 +177,16 @@ def loaderFunc(driverClass, scaleParameters, args, config, w_ids, debug):
 ## ==============================================
 ## startExecution
 ## ==============================================
-def startExecution(driverClass, scaleParameters, args, config):
+def startExecution(driverClass, scaleParameters, args, config, homeSets = None):
     logging.debug("Creating client pool with %d processes" % args['clients'])
     pool = multiprocessing.Pool(args['clients'])
     debug = logging.getLogger().isEnabledFor(logging.DEBUG)
     
+    if homeSets == None: homeSets = [ None ] * args['clients']
+    
     worker_results = [ ]
     for i in range(args['clients']):
-        r = pool.apply_async(executorFunc, (driverClass, scaleParameters, args, config, debug,))
+        r = pool.apply_async(executorFunc, (driverClass, scaleParameters, args, config, i, debug, homeSets[i],))
         worker_results.append(r)
     ## FOR
     pool.close()
@@ -153,7 +207,12 @@ def startExecution(driverClass, scaleParameters, args, config):
 ## ==============================================
 ## executorFunc
 ## ==============================================
-def executorFunc(driverClass, scaleParameters, args, config, debug):
+def executorFunc(driverClass, scaleParameters, args, config, client_id, debug, warehouses = None):
+    rand.seedProcess(args['seed'], "execute", client_id)
+    if args['emulate_terminals']:
+        return emulateTerminals(driverClass, scaleParameters, args, config, client_id, warehouses)
+    if args['terminals'] > 1:
+        return executeTerminals(driverClass, scaleParameters, args, config, client_id, warehouses)
     driver = driverClass(args['ddl'])
     assert driver != None
     logging.debug("Starting client execution: %s" % driver)
@@ -162,14 +221,87 @@ def executorFunc(driverClass, scaleParameters, args, config, debug):
     config['reset'] = False
     driver.loadConfig(config)
 
-    e = executor.Executor(driver, scaleParameters, stop_on_error=args['stop_on_error'])
+    mix = [ int(i) for i in args['mix'].split(',') ]
+    e = executor.Executor(driver, scaleParameters, mix, stop_on_error=args['stop_on_error'], warehouses=warehouses)
     driver.executeStart()
-    results = e.execute(args['duration'])
+    results = e.execute(args['duration'], args['warmup'], args['cooldown'], args['sample_interval'])
     driver.executeFinish()
     
     return results
 ## DEF
 
+## ==============================================
+## executeTerminals
+## ==============================================
+def executeTerminals(driverClass, scaleParameters, args, config, client_id, warehouses = None):
+    """Run args['terminals'] virtual terminals in this process, each with its own driver"""
+    mix = [ int(i) for i in args['mix'].split(',') ]
+    pool = terminals.TerminalPool(driverClass, args['ddl'], config, scaleParameters, mix, args['terminals'], stop_on_error=args['stop_on_error'], warehouses=warehouses)
+    return pool.execute(args['duration'], args['warmup'], args['cooldown'], args['sample_interval'], args['seed'], client_id)
+## DEF
+
+## ==============================================
+## emulateTerminals
+## ==============================================
+def emulateTerminals(driverClass, scaleParameters, args, config, client_id, warehouses = None):
+    """Emulate the TPC-C terminals of this client's warehouses, with keying and think
+    times, over args['terminals'] connections"""
+    mix = [ int(i) for i in args['mix'].split(',') ]
+    homes = terminals.homeTerminals(scaleParameters, client_id, args['clients'], warehouses)
+    if not homes:
+        logging.warn("Client %d has no warehouses to emulate terminals for" % client_id)
+        return results.Results()
+    emulator = terminals.TerminalEmulator(driverClass, args['ddl'], config, scaleParameters, mix, homes, args['terminals'], stop_on_error=args['stop_on_error'])
+    return emulator.execute(args['duration'], args['warmup'], args['cooldown'], args['sample_interval'], args['seed'], client_id)
+## DEF
+
+## ==============================================
+## startCompactor
+## ==============================================
+def startCompactor(driverClass, args, config):
+    """Run the driver's compaction in a separate process while the benchmark executes.
+    Returns the handles that stopCompactor needs."""
+    stop = multiprocessing.Event()
+    rounds = multiprocessing.Queue()
+    p = multiprocessing.Process(target=compactorFunc, args=(driverClass, args, dict(config), stop, rounds))
+    p.start()
+    return (p, stop, rounds)
+## DEF
+
+## ==============================================
+## stopCompactor
+## ==============================================
+def stopCompactor(p, stop, rounds):
+    stop.set()
+    ret = rounds.get()
+    p.join()
+    return ret
+## DEF
+
+## ==============================================
+## compactorFunc
+## ==============================================
+def compactorFunc(driverClass, args, config, stop, rounds):
+    ## stopCompactor waits for the rounds, so they have to be sent even if
+    ## the driver can't be set up
+    c = None
+    try:
+        rand.seedProcess(args['seed'], "compact")
+        driver = driverClass(args['ddl'])
+        assert driver != None
+        config['execute'] = True
+        config['reset'] = False
+        driver.loadConfig(config)
+        
+        c = compactor.Compactor(driver, args['compact_interval'])
+        c.run(stop)
+    except (Exception, AssertionError), ex:
+        logging.warn("Failed to compact the database: %s" % (ex))
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        rounds.put(c.rounds if c != None else [ ])
+## DEF
+
 ## ==============================================
 ## main
 ## ==============================================
@@ -191,10 +323,40 @@ if __name__ == '__main__':
                          help='Number of Warehouses')
     aparser.add_argument('--duration', default=60, type=int, metavar='D',
                          help='How long to run the benchmark in seconds')
+    aparser.add_argument('--warmup', default=0, type=int, metavar='W',
+                         help='Seconds to run before the measured duration starts')
+    aparser.add_argument('--cooldown', default=0, type=int, metavar='C',
+                         help='Seconds to keep running after the measured duration ends')
+    aparser.add_argument('--sample-interval', default=1.0, type=float, metavar='S',
+                         help='Length in seconds of each time-series sample interval')
+    aparser.add_argument('--timeseries', metavar='FILE',
+                         help='Write the time-series samples to FILE (.json for JSON, otherwise CSV)')
+    aparser.add_argument('--results-json', metavar='FILE',
+                         help='Write a machine-readable summary of the results to FILE')
+    aparser.add_argument('--generator', default='python', choices=loader.GENERATORS,
+                         help='Data generator backend used by the loader')
+    aparser.add_argument('--load-pipeline', default=loader.DEFAULT_PIPELINE_DEPTH, type=int, metavar='N',
+                         help='Number of batches the loader may generate ahead of the database (0 disables the generator thread)')
+    aparser.add_argument('--checkpoint', metavar='FILE',
+                         help='Record the finished load units in FILE and skip the ones it already lists. Use with --seed so that a resumed load generates the same data')
+    aparser.add_argument('--seed', type=int, metavar='N',
+                         help='Seed the random generators so that runs are reproducible')
     aparser.add_argument('--ddl', default=os.path.realpath(os.path.join(os.path.dirname(__file__), "tpcc.sql")),
                          help='Path to the TPC-C DDL SQL file')
     aparser.add_argument('--clients', default=1, type=int, metavar='N',
                          help='The number of blocking clients to fork')
+    aparser.add_argument('--terminals', default=1, type=int, metavar='N',
+                         help='The number of virtual terminals that each client runs as threads, each with its own connection')
+    aparser.add_argument('--emulate-terminals', action='store_true',
+                         help='Emulate 10 terminals per warehouse with TPC-C keying and think times, multiplexed over --terminals connections per client')
+    aparser.add_argument('--partitioning', default=partitioner.STRATEGY_MODULO, choices=partitioner.STRATEGIES,
+                         help='How the sharded drivers spread the warehouses over their nodes')
+    aparser.add_argument('--no-item-replication', action='store_true',
+                         help='Store the ITEM table only on the first shard instead of on every shard')
+    aparser.add_argument('--affinity', action='store_true',
+                         help='Give every client its own set of home warehouses, following the shards on sharded drivers. Remote warehouses are still picked from all of them')
+    aparser.add_argument('--compact-interval', default=0, type=float, metavar='S',
+                         help='Compact the database\'s event logs every S seconds while the workload runs (0 disables it)')
     aparser.add_argument('--stop-on-error', action='store_true',
                          help='Stop the transaction execution when the driver throws an exception.')
     aparser.add_argument('--no-load', action='store_true',
@@ -230,18 +392,32 @@ if __name__ == '__main__':
         logging.debug("Using default configuration for %s" % args['system'])
         defaultConfig = driver.makeDefaultConfig()
         config = dict(map(lambda x: (x, defaultConfig[x][1]), defaultConfig.keys()))
+
+    ## Create ScaleParameters
+    scaleParameters = scaleparameters.makeWithScaleFactor(args['warehouses'], args['scalefactor'])
+    if args['debug']: logging.debug("Scale Parameters:\n%s" % scaleParameters)
+    scaleParameters.starting_warehouse = int(args['skip_warehouses'])+1
+
     config['reset'] = args['reset']
     config['load'] = False
     config['execute'] = False
+    config['partitioning'] = partitioner.makeSpec(args['partitioning'], scaleParameters, not args['no_item_replication'])
     if config['reset']: logging.info("Reseting database")
     driver.loadConfig(config)
     logging.info("Initializing TPC-C benchmark using %s" % driver)
-
-    ## Create ScaleParameters
-    scaleParameters = scaleparameters.makeWithScaleFactor(args['warehouses'], args['scalefactor'])
-    nurand = rand.setNURand(nurand.makeForLoad())
-    if args['debug']: logging.debug("Scale Parameters:\n%s" % scaleParameters)
-    scaleParameters.starting_warehouse = int(args['skip_warehouses'])+1
+    shardMap = driver.getPartitioner()
+    if shardMap: logging.info(shardMap.formatSkew())
+    
+    ## With affinity every client gets its own home warehouses, following the shards if
+    ## there are any. They are worked out now so that a bad setup fails before the load
+    homeSets = None
+    if args['affinity'] and args['clients'] > 1:
+        homeSets = partitioner.assignWarehouses(scaleParameters, args['clients'], shardMap)
+    
+    ## All clients must share the same NURand constants. See TPC-C 2.1.6 (page 20)
+    rand.seedProcess(args['seed'], "nurand")
+    loadC = nurand.makeForLoad()
+    runC = nurand.makeForRun(loadC)
 
     mix = [ int(i) for i in args['mix'].split(',') ]
     
@@ -250,27 +426,50 @@ if __name__ == '__main__':
     if not args['no_load']:
         logging.info("Loading TPC-C benchmark data using %s" % (driver))
         load_start = time.time()
+        rand.setNURand(loadC)
+        manifest = None
+        if args['checkpoint']:
+            manifest = checkpoint.LoadManifest(args['checkpoint'], checkpoint.describeLoad(scaleParameters, args), args['reset'])
         if args['clients'] == 1:
-            l = loader.Loader(driver, scaleParameters, range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1), scaleParameters.starting_warehouse == 1)
+            l = loader.getLoaderClass(args['generator'])(driver, scaleParameters, range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1), False, args['load_pipeline'])
+            phases = getLoadPhases(scaleParameters, manifest)
+            progress = loader.LoadProgress(scaleParameters, phases)
             driver.loadStart()
-            l.execute()
+            for unit in [ unit for phase in phases for unit in phase ]:
+                progress.finished(unit, 0, loadUnit(l, args, unit))
+                if manifest: manifest.finish(unit)
+            l.finishUnits()
             driver.loadFinish()
         else:
-            startLoading(driverClass, scaleParameters, args, config)
+            startLoading(driverClass, scaleParameters, args, config, manifest, shardMap)
+        if manifest: manifest.close()
         load_time = time.time() - load_start
     ## IF
     
     ## WORKLOAD DRIVER!!!
     if not args['no_execute']:
-        if args['clients'] == 1:
+        rand.setNURand(runC)
+        compaction = None
+        if args['compact_interval'] > 0:
+            compaction = startCompactor(driverClass, args, config)
+        if args['clients'] == 1 and args['emulate_terminals']:
+            results = emulateTerminals(driverClass, scaleParameters, args, config, 0)
+        elif args['clients'] == 1 and args['terminals'] > 1:
+            results = executeTerminals(driverClass, scaleParameters, args, config, 0)
+        elif args['clients'] == 1:
+            rand.seedProcess(args['seed'], "execute", 0)
             e = executor.Executor(driver, scaleParameters, mix, stop_on_error=args['stop_on_error'])
             driver.executeStart()
-            results = e.execute(args['duration'])
+            results = e.execute(args['duration'], args['warmup'], args['cooldown'], args['sample_interval'])
             driver.executeFinish()
         else:
-            results = startExecution(driverClass, scaleParameters, args, config)
+            results = startExecution(driverClass, scaleParameters, args, config, homeSets)
+        if compaction: compaction = stopCompactor(*compaction)
         assert results
         print results.show(load_time)
+        if compaction != None: print compactor.formatSummary(compaction)
+        if args['timeseries']: results.exportTimeSeries(args['timeseries'])
+        if args['results_json']: results.exportSummary(args['results_json'], load_time)
     ## IF
     
 ## MAIN
\ No newline at end of file
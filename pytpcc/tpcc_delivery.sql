@@ -0,0 +1,30 @@
+-- Delivered watermark of every district: the o_id of the oldest order that has
+-- not been delivered yet. "delivery_orders" stays the record of what has been
+-- delivered: the table is seeded from it once the data is loaded and the
+-- trigger below moves the watermark forward as deliveries are appended, so
+-- DELIVERY can find the next order of all of the districts in one statement.
+
+DROP TABLE IF EXISTS "delivery_watermark";
+CREATE TABLE "delivery_watermark" AS (
+  SELECT
+    d_w_id AS dw_w_id,
+    d_id AS dw_d_id,
+    COALESCE(MAX(dlo_o_id), 0) + 1 AS dw_next_o_id
+  FROM district
+  LEFT JOIN delivery_orders ON dlo_w_id = d_w_id AND dlo_d_id = d_id
+  GROUP BY d_w_id, d_id
+);
+ALTER TABLE "delivery_watermark" ADD PRIMARY KEY ("dw_w_id", "dw_d_id");
+
+-- delivery_orders: move the district's watermark past the delivered order
+CREATE OR REPLACE FUNCTION "delivery_orders_watermark"() RETURNS trigger AS $$
+BEGIN
+  UPDATE delivery_watermark SET dw_next_o_id = GREATEST(dw_next_o_id, NEW.dlo_o_id + 1)
+  WHERE dw_w_id = NEW.dlo_w_id AND dw_d_id = NEW.dlo_d_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "delivery_orders_watermark" ON "delivery_orders";
+CREATE TRIGGER "delivery_orders_watermark" AFTER INSERT ON "delivery_orders"
+  FOR EACH ROW EXECUTE PROCEDURE "delivery_orders_watermark"();
@@ -0,0 +1,196 @@
+-- Server-side versions of the five TPC-C transactions of the "postgres" driver.
+-- Each function runs the same statements as the client-side do* method, in
+-- the same order, so that a transaction is a single round trip. The reads go
+-- through the same views; "#variable_conflict use_column" lets the OUT
+-- parameters share the names of the columns they are read from.
+
+-- DELIVERY: one row (d_id, no_o_id) for every district that had an order to deliver
+CREATE OR REPLACE FUNCTION "tpcc_delivery"(p_w_id int, p_o_carrier_id int, p_delivery_d timestamp, p_districts int)
+RETURNS TABLE (d_id int, no_o_id int) AS $$
+#variable_conflict use_column
+DECLARE
+  v_d_id int;
+  v_o_id int;
+BEGIN
+  INSERT INTO delivery VALUES (p_delivery_d, p_w_id, p_o_carrier_id);
+  FOR v_d_id IN 1..p_districts LOOP
+    SELECT MAX(dlo_o_id) + 1 INTO v_o_id FROM delivery_orders WHERE dlo_d_id = v_d_id AND dlo_w_id = p_w_id;
+    PERFORM o_id FROM orders WHERE o_id = v_o_id AND o_d_id = v_d_id AND o_w_id = p_w_id;
+    -- No orders for this district: skip it
+    CONTINUE WHEN NOT FOUND;
+    INSERT INTO delivery_orders VALUES (p_delivery_d, p_w_id, v_o_id, v_d_id);
+    d_id := v_d_id;
+    no_o_id := v_o_id;
+    RETURN NEXT;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- NEW_ORDER: the customer, the totals and one array element per order line.
+-- All of the columns are NULL when one of the items does not exist, before
+-- anything has been written, and the caller rolls back
+CREATE OR REPLACE FUNCTION "tpcc_new_order"(p_w_id int, p_d_id int, p_c_id int, p_o_entry_d timestamp,
+    p_i_ids int[], p_i_w_ids int[], p_i_qtys int[],
+    OUT c_discount numeric, OUT c_last varchar, OUT c_credit char(2),
+    OUT w_tax numeric, OUT d_tax numeric, OUT o_id int, OUT total numeric,
+    OUT i_names varchar[], OUT s_quantities int[], OUT brand_generics char(1)[], OUT i_prices numeric[], OUT ol_amounts numeric[]) AS $$
+#variable_conflict use_column
+DECLARE
+  v_ol_cnt int := array_length(p_i_ids, 1);
+  v_items item[] := '{}';
+  v_item item;
+  v_s_quantity int;
+  v_s_data varchar;
+  v_ol_dist_info char(24);
+  v_ol_amount numeric;
+BEGIN
+  FOR i IN 1..v_ol_cnt LOOP
+    SELECT * INTO v_item FROM item WHERE i_id = p_i_ids[i];
+    -- 1% of the NEW_ORDERs use an unknown item on purpose
+    IF NOT FOUND THEN
+      RETURN;
+    END IF;
+    v_items := v_items || v_item;
+  END LOOP;
+
+  SELECT w_tax INTO w_tax FROM warehouse WHERE w_id = p_w_id;
+  SELECT d_tax INTO d_tax FROM district WHERE d_id = p_d_id AND d_w_id = p_w_id;
+  UPDATE district_order_counter SET d_next_o_id = d_next_o_id + 1
+  WHERE d_id = p_d_id AND d_w_id = p_w_id
+  RETURNING d_next_o_id - 1 INTO o_id;
+  SELECT c_discount, c_last, c_credit INTO c_discount, c_last, c_credit
+  FROM customer WHERE c_w_id = p_w_id AND c_d_id = p_d_id AND c_id = p_c_id;
+
+  INSERT INTO orders VALUES (o_id, p_d_id, p_w_id, p_c_id, v_ol_cnt, p_w_id = ALL(p_i_w_ids), p_o_entry_d);
+
+  total := 0;
+  i_names := '{}';
+  s_quantities := '{}';
+  brand_generics := '{}';
+  i_prices := '{}';
+  ol_amounts := '{}';
+  FOR i IN 1..v_ol_cnt LOOP
+    v_item := v_items[i];
+    SELECT s_quantity, s_data,
+        CASE p_d_id
+          WHEN 1 THEN s_dist_01 WHEN 2 THEN s_dist_02 WHEN 3 THEN s_dist_03 WHEN 4 THEN s_dist_04 WHEN 5 THEN s_dist_05
+          WHEN 6 THEN s_dist_06 WHEN 7 THEN s_dist_07 WHEN 8 THEN s_dist_08 WHEN 9 THEN s_dist_09 WHEN 10 THEN s_dist_10
+        END
+      INTO v_s_quantity, v_s_data, v_ol_dist_info
+    FROM stock_view WHERE s_i_id = p_i_ids[i] AND s_w_id = p_i_w_ids[i];
+
+    IF v_s_quantity >= p_i_qtys[i] + 10 THEN
+      v_s_quantity := v_s_quantity - p_i_qtys[i];
+    ELSE
+      v_s_quantity := v_s_quantity + 91 - p_i_qtys[i];
+    END IF;
+    INSERT INTO stock_history VALUES (p_i_ids[i], p_i_w_ids[i], p_o_entry_d, v_s_quantity);
+
+    v_ol_amount := p_i_qtys[i] * v_item.i_price;
+    INSERT INTO order_line VALUES (o_id, p_d_id, p_w_id, i, p_i_ids[i], p_i_w_ids[i], p_i_qtys[i], v_ol_amount, v_ol_dist_info);
+
+    i_names := i_names || v_item.i_name;
+    s_quantities := s_quantities || v_s_quantity;
+    brand_generics := brand_generics || (CASE WHEN strpos(v_item.i_data, 'ORIGINAL') > 0 AND strpos(v_s_data, 'ORIGINAL') > 0 THEN 'B' ELSE 'G' END)::char(1);
+    i_prices := i_prices || v_item.i_price;
+    ol_amounts := ol_amounts || v_ol_amount;
+    total := total + v_ol_amount;
+  END LOOP;
+
+  total := total * (1 - c_discount) * (1 + w_tax + d_tax);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ORDER_STATUS: the customer, its last order (NULL if there is none) and one
+-- array element per line of that order. The customer is looked up by c_last
+-- when p_c_id is NULL
+CREATE OR REPLACE FUNCTION "tpcc_order_status"(p_w_id int, p_d_id int, p_c_id int, p_c_last varchar,
+    OUT c_id int, OUT c_first varchar, OUT c_middle char(2), OUT c_last varchar, OUT c_balance numeric,
+    OUT o_id int, OUT o_carrier_id int, OUT o_entry_d timestamp,
+    OUT ol_supply_w_ids int[], OUT ol_i_ids int[], OUT ol_quantities int[], OUT ol_amounts numeric[], OUT ol_delivery_ds timestamp[]) AS $$
+#variable_conflict use_column
+DECLARE
+  v_namecnt int;
+BEGIN
+  IF p_c_id IS NOT NULL THEN
+    SELECT c_id, c_first, c_middle, c_last, c_balance INTO c_id, c_first, c_middle, c_last, c_balance
+    FROM customer_view WHERE c_w_id = p_w_id AND c_d_id = p_d_id AND c_id = p_c_id;
+  ELSE
+    -- The midpoint customer with that last name
+    SELECT COUNT(*) INTO v_namecnt FROM customer_view WHERE c_w_id = p_w_id AND c_d_id = p_d_id AND c_last = p_c_last;
+    IF v_namecnt = 0 THEN
+      RAISE EXCEPTION 'No customer with last name % in district (%, %)', p_c_last, p_w_id, p_d_id;
+    END IF;
+    SELECT c_id, c_first, c_middle, c_last, c_balance INTO c_id, c_first, c_middle, c_last, c_balance
+    FROM customer_view WHERE c_w_id = p_w_id AND c_d_id = p_d_id AND c_last = p_c_last
+    ORDER BY c_first OFFSET (v_namecnt - 1) / 2 LIMIT 1;
+  END IF;
+
+  SELECT o_id, o_carrier_id, o_entry_d INTO o_id, o_carrier_id, o_entry_d
+  FROM orders_view WHERE o_w_id = p_w_id AND o_d_id = p_d_id AND o_c_id = c_id ORDER BY o_id DESC LIMIT 1;
+  IF FOUND THEN
+    SELECT array_agg(ol_supply_w_id), array_agg(ol_i_id), array_agg(ol_quantity), array_agg(ol_amount), array_agg(ol_delivery_d)
+      INTO ol_supply_w_ids, ol_i_ids, ol_quantities, ol_amounts, ol_delivery_ds
+    FROM order_line_view WHERE ol_w_id = p_w_id AND ol_d_id = p_d_id AND ol_o_id = o_id;
+  END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- PAYMENT: the warehouse, the district and the customer as they were read.
+-- The customer is looked up by c_last when p_c_id is NULL
+CREATE OR REPLACE FUNCTION "tpcc_payment"(p_w_id int, p_d_id int, p_h_amount numeric,
+    p_c_w_id int, p_c_d_id int, p_c_id int, p_c_last varchar, p_h_date timestamp,
+    OUT w_name varchar, OUT w_street_1 varchar, OUT w_street_2 varchar, OUT w_city varchar, OUT w_state char(2), OUT w_zip char(9),
+    OUT d_name varchar, OUT d_street_1 varchar, OUT d_street_2 varchar, OUT d_city varchar, OUT d_state char(2), OUT d_zip char(9),
+    OUT c_id int, OUT c_first varchar, OUT c_middle char(2), OUT c_last varchar, OUT c_street_1 varchar, OUT c_street_2 varchar,
+    OUT c_city varchar, OUT c_state char(2), OUT c_zip char(9), OUT c_phone char(16), OUT c_since timestamp,
+    OUT c_discount numeric, OUT c_credit char(2), OUT c_credit_lim numeric, OUT c_data varchar) AS $$
+#variable_conflict use_column
+DECLARE
+  v_namecnt int;
+BEGIN
+  IF p_c_id IS NOT NULL THEN
+    SELECT c_id, c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, c_since, c_discount, c_credit, c_credit_lim, c_data
+      INTO c_id, c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, c_since, c_discount, c_credit, c_credit_lim, c_data
+    FROM customer_view WHERE c_w_id = p_c_w_id AND c_d_id = p_c_d_id AND c_id = p_c_id;
+  ELSE
+    -- The midpoint customer with that last name
+    SELECT COUNT(*) INTO v_namecnt FROM customer_view WHERE c_w_id = p_c_w_id AND c_d_id = p_c_d_id AND c_last = p_c_last;
+    IF v_namecnt = 0 THEN
+      RAISE EXCEPTION 'No customer with last name % in district (%, %)', p_c_last, p_c_w_id, p_c_d_id;
+    END IF;
+    SELECT c_id, c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, c_since, c_discount, c_credit, c_credit_lim, c_data
+      INTO c_id, c_first, c_middle, c_last, c_street_1, c_street_2, c_city, c_state, c_zip, c_phone, c_since, c_discount, c_credit, c_credit_lim, c_data
+    FROM customer_view WHERE c_w_id = p_c_w_id AND c_d_id = p_c_d_id AND c_last = p_c_last
+    ORDER BY c_first OFFSET (v_namecnt - 1) / 2 LIMIT 1;
+  END IF;
+
+  SELECT w_name, w_street_1, w_street_2, w_city, w_state, w_zip INTO w_name, w_street_1, w_street_2, w_city, w_state, w_zip
+  FROM warehouse WHERE w_id = p_w_id;
+  SELECT d_name, d_street_1, d_street_2, d_city, d_state, d_zip INTO d_name, d_street_1, d_street_2, d_city, d_state, d_zip
+  FROM district WHERE d_w_id = p_w_id AND d_id = p_d_id;
+
+  -- Customer credit information
+  IF c_credit = 'BC' THEN
+    INSERT INTO customer_history VALUES (c_id, p_c_d_id, p_c_w_id, p_h_date,
+      left(concat_ws(' ', c_id, p_c_d_id, p_c_w_id, p_d_id, p_w_id, p_h_amount) || '|' || c_data, 500));
+  END IF;
+
+  INSERT INTO history VALUES (c_id, p_c_d_id, p_c_w_id, p_d_id, p_w_id, p_h_date, p_h_amount, w_name || '    ' || d_name);
+END;
+$$ LANGUAGE plpgsql;
+
+-- STOCK_LEVEL: the number of recently sold items below the threshold
+CREATE OR REPLACE FUNCTION "tpcc_stock_level"(p_w_id int, p_d_id int, p_threshold int) RETURNS bigint AS $$
+#variable_conflict use_column
+DECLARE
+  v_o_id int;
+BEGIN
+  SELECT d_next_o_id INTO v_o_id FROM district_order_counter WHERE d_w_id = p_w_id AND d_id = p_d_id;
+  RETURN (
+    SELECT COUNT(DISTINCT(s_i_id)) FROM order_line, stock_view
+    WHERE ol_w_id = p_w_id AND ol_d_id = p_d_id AND ol_o_id >= v_o_id - 20
+      AND s_w_id = p_w_id AND s_i_id = ol_i_id AND s_quantity < p_threshold
+  );
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,112 @@
+-- Current state of the stock and customer rows that "stock_view" and
+-- "customer_view" compute from the event tables. The views stay the reference
+-- definition: these tables are seeded from them once the data is loaded and
+-- the triggers below keep them up to date as new events are appended, so
+-- reading the state no longer scans whole event tables.
+
+DROP TABLE IF EXISTS "stock_state";
+CREATE TABLE "stock_state" AS (
+  SELECT
+    s_w_id,
+    s_i_id,
+    s_quantity,
+    COALESCE(s_ytd, 0) AS s_ytd,
+    COALESCE(s_order_cnt, 0) AS s_order_cnt,
+    COALESCE(s_remote_cnt, 0) AS s_remote_cnt
+  FROM stock_view
+);
+ALTER TABLE "stock_state" ADD PRIMARY KEY ("s_w_id", "s_i_id");
+
+-- Every loaded customer has a payment and an order, so c_balance is only NULL
+-- in the view when one of them is missing
+DROP TABLE IF EXISTS "customer_state";
+CREATE TABLE "customer_state" AS (
+  SELECT
+    c_w_id,
+    c_d_id,
+    c_id,
+    COALESCE(c_balance, -COALESCE(c_ytd_payment, 0)) AS c_balance,
+    COALESCE(c_ytd_payment, 0) AS c_ytd_payment,
+    COALESCE(c_payment_cnt, 0) AS c_payment_cnt,
+    COALESCE(c_delivery_cnt, 0) AS c_delivery_cnt,
+    c_data
+  FROM customer_view
+);
+ALTER TABLE "customer_state" ADD PRIMARY KEY ("c_w_id", "c_d_id", "c_id");
+
+-- stock_history: the latest quantity
+CREATE OR REPLACE FUNCTION "stock_history_state"() RETURNS trigger AS $$
+BEGIN
+  UPDATE stock_state SET s_quantity = NEW.sh_quantity
+  WHERE s_w_id = NEW.sh_s_w_id AND s_i_id = NEW.sh_s_i_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "stock_history_state" ON "stock_history";
+CREATE TRIGGER "stock_history_state" AFTER INSERT ON "stock_history"
+  FOR EACH ROW EXECUTE PROCEDURE "stock_history_state"();
+
+-- order_line: the stock's ytd and order counts, and the customer's balance
+CREATE OR REPLACE FUNCTION "order_line_state"() RETURNS trigger AS $$
+BEGIN
+  UPDATE stock_state SET
+    s_ytd = s_ytd + NEW.ol_amount,
+    s_order_cnt = s_order_cnt + 1,
+    s_remote_cnt = s_remote_cnt + (CASE WHEN NEW.ol_supply_w_id <> NEW.ol_w_id THEN 1 ELSE 0 END)
+  WHERE s_w_id = NEW.ol_supply_w_id AND s_i_id = NEW.ol_i_id;
+  UPDATE customer_state SET c_balance = c_balance + NEW.ol_amount
+  FROM orders
+  WHERE o_w_id = NEW.ol_w_id AND o_d_id = NEW.ol_d_id AND o_id = NEW.ol_o_id
+    AND c_w_id = o_w_id AND c_d_id = o_d_id AND c_id = o_c_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "order_line_state" ON "order_line";
+CREATE TRIGGER "order_line_state" AFTER INSERT ON "order_line"
+  FOR EACH ROW EXECUTE PROCEDURE "order_line_state"();
+
+-- history: the customer's payments
+CREATE OR REPLACE FUNCTION "history_state"() RETURNS trigger AS $$
+BEGIN
+  UPDATE customer_state SET
+    c_balance = c_balance - NEW.h_amount,
+    c_ytd_payment = c_ytd_payment + NEW.h_amount,
+    c_payment_cnt = c_payment_cnt + 1
+  WHERE c_w_id = NEW.h_c_w_id AND c_d_id = NEW.h_c_d_id AND c_id = NEW.h_c_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "history_state" ON "history";
+CREATE TRIGGER "history_state" AFTER INSERT ON "history"
+  FOR EACH ROW EXECUTE PROCEDURE "history_state"();
+
+-- delivery_orders: the customer's deliveries
+CREATE OR REPLACE FUNCTION "delivery_orders_state"() RETURNS trigger AS $$
+BEGIN
+  UPDATE customer_state SET c_delivery_cnt = c_delivery_cnt + 1
+  FROM orders
+  WHERE o_w_id = NEW.dlo_w_id AND o_d_id = NEW.dlo_d_id AND o_id = NEW.dlo_o_id
+    AND c_w_id = o_w_id AND c_d_id = o_d_id AND c_id = o_c_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "delivery_orders_state" ON "delivery_orders";
+CREATE TRIGGER "delivery_orders_state" AFTER INSERT ON "delivery_orders"
+  FOR EACH ROW EXECUTE PROCEDURE "delivery_orders_state"();
+
+-- customer_history: the latest c_data
+CREATE OR REPLACE FUNCTION "customer_history_state"() RETURNS trigger AS $$
+BEGIN
+  UPDATE customer_state SET c_data = NEW.ch_data
+  WHERE c_w_id = NEW.ch_c_w_id AND c_d_id = NEW.ch_c_d_id AND c_id = NEW.ch_c_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "customer_history_state" ON "customer_history";
+CREATE TRIGGER "customer_history_state" AFTER INSERT ON "customer_history"
+  FOR EACH ROW EXECUTE PROCEDURE "customer_history_state"();
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+## Number of bits used for the linear sub-buckets inside each power of two.
+## With 7 bits every recorded value is within 1/64 (~1.5%) of its bucket.
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+## Values larger than this (in microseconds, ~19 hours) are clamped
+MAX_TRACKABLE_VALUE = (1 << 36) - 1
+
+PERCENTILES = [ 50.0, 90.0, 95.0, 99.0, 99.9 ]
+
+def bucketIndex(value):
+    """Return the bucket index for the given non-negative integer value.
+    Values below SUB_BUCKET_COUNT get their own bucket. Above that, each
+    power of two is split into SUB_BUCKET_HALF linear sub-buckets."""
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift * SUB_BUCKET_HALF) + (value >> shift)
+## DEF
+
+def bucketRange(index):
+    """Return the (lowest, highest) values that map into the given bucket"""
+    if index < SUB_BUCKET_COUNT:
+        return (index, index)
+    shift = (index // SUB_BUCKET_HALF) - 1
+    mantissa = index - (shift * SUB_BUCKET_HALF)
+    return (mantissa << shift, ((mantissa + 1) << shift) - 1)
+## DEF
+
+class Histogram:
+    """
+        A mergeable, fixed-precision latency histogram using HDR-style
+        logarithmic buckets. Values are recorded in microseconds. Only the
+        non-empty buckets are stored, so the memory used is bounded by the
+        number of buckets needed to cover MAX_TRACKABLE_VALUE.
+    """
+
+    def __init__(self):
+        self.counts = { }
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+    ## DEF
+
+    def record(self, value):
+        """Record a single value (in microseconds)"""
+        value = min(max(int(value), 0), MAX_TRACKABLE_VALUE)
+        idx = bucketIndex(value)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min == None or value < self.min: self.min = value
+        if self.max == None or value > self.max: self.max = value
+    ## DEF
+
+    def merge(self, other):
+        """Add all of the values recorded in the other histogram to this one"""
+        for idx, cnt in other.counts.iteritems():
+            self.counts[idx] = self.counts.get(idx, 0) + cnt
+        self.count += other.count
+        self.total += other.total
+        if other.min != None and (self.min == None or other.min < self.min): self.min = other.min
+        if other.max != None and (self.max == None or other.max > self.max): self.max = other.max
+    ## DEF
+
+    def mean(self):
+        if self.count == 0: return 0
+        return self.total / float(self.count)
+    ## DEF
+
+    def percentile(self, p):
+        """Return the value at the given percentile (0-100). The result is the
+        highest value in the matching bucket, capped at the maximum recorded."""
+        if self.count == 0: return 0
+        target = max(1, int(round((p / 100.0) * self.count)))
+        seen = 0
+        for idx in sorted(self.counts.keys()):
+            seen += self.counts[idx]
+            if seen >= target:
+                return min(bucketRange(idx)[1], self.max)
+        ## FOR
+        return self.max
+    ## DEF
+
+    def percentiles(self, ps = PERCENTILES):
+        """Return a dict from each of the given percentiles to its value"""
+        return dict([ (p, self.percentile(p)) for p in ps ])
+    ## DEF
+
+    def __len__(self):
+        return self.count
+
+## CLASS
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+## Vectorized versions of the generators in rand. Each function returns a
+## whole column of values at once. The NumPy stream is seeded from the rand
+## module's stream, so --seed still gives reproducible data.
+
+import numpy
+
+import constants
+import rand
+
+rs = None # numpy.random.RandomState
+
+def seed():
+    """(Re)seed the NumPy random stream from this process' rand stream"""
+    global rs
+    rs = numpy.random.RandomState(rand.stream().randint(0, 2**32 - 1))
+## DEF
+
+def getState():
+    if rs is None: seed()
+    return rs
+## DEF
+
+def number(minimum, maximum, size):
+    """An array of size integers in the range [minimum, maximum]"""
+    return getState().randint(minimum, maximum + 1, size)
+## DEF
+
+def numberExcluding(minimum, maximum, excluding, size):
+    """An array of size integers in the range [minimum, maximum], excluding excluding."""
+    assert minimum < maximum
+    assert minimum <= excluding and excluding <= maximum
+    num = number(minimum, maximum - 1, size)
+    num[num >= excluding] += 1
+    return num
+## DEF
+
+def fixedPoint(decimal_places, minimum, maximum, size):
+    assert decimal_places > 0
+    assert minimum < maximum
+    multiplier = 10 ** decimal_places
+    int_min = int(minimum * multiplier + 0.5)
+    int_max = int(maximum * multiplier + 0.5)
+    return number(int_min, int_max, size) / float(multiplier)
+## DEF
+
+def NURand(a, x, y, size):
+    """An array of non-uniform random numbers, as defined by TPC-C 2.1.6. (page 20)."""
+    assert x <= y
+    c = rand.getNURandC(a)
+    return (((number(0, a, size) | number(x, y, size)) + c) % (y - x + 1)) + x
+## DEF
+
+def permutation(minimum, maximum):
+    """A random permutation of the integers in the range [minimum, maximum]"""
+    return getState().permutation(maximum - minimum + 1) + minimum
+## DEF
+
+def selectMask(numUnique, size):
+    """A boolean array of the given size with numUnique randomly selected entries set"""
+    mask = numpy.zeros(size, dtype=bool)
+    mask[getState().choice(size, numUnique, replace=False)] = True
+    return mask
+## DEF
+
+def astring(minimum_length, maximum_length, size):
+    """A list of random alphabetic strings with length in range [minimum_length, maximum_length]."""
+    return randomStrings(minimum_length, maximum_length, 'a', 26, size)
+## DEF
+
+def nstring(minimum_length, maximum_length, size):
+    """A list of random numeric strings with length in range [minimum_length, maximum_length]."""
+    return randomStrings(minimum_length, maximum_length, '0', 10, size)
+## DEF
+
+def randomStrings(minimum_length, maximum_length, base, numCharacters, size):
+    """Build all of the strings from a single byte matrix. Each row is viewed as
+    a fixed-length string and then cut down to its random length."""
+    lengths = number(minimum_length, maximum_length, size)
+    chars = getState().randint(0, numCharacters, (size, maximum_length)).astype(numpy.uint8)
+    chars += ord(base)
+    strings = chars.view('S%d' % maximum_length).ravel().tolist()
+    if minimum_length == maximum_length:
+        return strings
+    return [ s[:l] for s, l in zip(strings, lengths.tolist()) ]
+## DEF
+
+def fillOriginal(strings, indexes):
+    """Put ORIGINAL_STRING at a random position in each of the strings at the given indexes (in place)"""
+    originalLength = len(constants.ORIGINAL_STRING)
+    for idx in indexes:
+        data = strings[idx]
+        position = getState().randint(0, len(data) - originalLength + 1)
+        strings[idx] = data[:position] + constants.ORIGINAL_STRING + data[position + originalLength:]
+    ## FOR
+    return strings
+## DEF
+
+LAST_NAMES = [ rand.makeLastName(i) for i in range(1000) ]
+
+def lastNames(numbers):
+    """A list with the last name of each number, as defined by TPC-C 4.3.2.3."""
+    return [ LAST_NAMES[n] for n in numbers.tolist() ]
+## DEF
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import bisect
+import hashlib
+
+STRATEGY_MODULO = "modulo"
+STRATEGY_RANGE = "range"
+STRATEGY_HASH = "hash"
+STRATEGIES = [ STRATEGY_MODULO, STRATEGY_RANGE, STRATEGY_HASH ]
+
+## Number of points each shard gets on the consistent-hash ring. More points
+## spread the warehouses more evenly at the cost of a slightly larger ring.
+VIRTUAL_NODES = 64
+
+def makeSpec(strategy, scaleParameters, replicateItems = True):
+    """Return the partitioning settings that get passed to every driver
+    in config['partitioning'] so that all processes build the same map"""
+    assert strategy in STRATEGIES, "Unknown partitioning strategy '%s'" % strategy
+    return {
+        "strategy": strategy,
+        "first_w_id": scaleParameters.starting_warehouse,
+        "last_w_id": scaleParameters.ending_warehouse,
+        "replicate_items": replicateItems,
+    }
+## DEF
+
+def makePartitioner(spec, shards):
+    """Build a Partitioner from a spec created by makeSpec(). Without a spec
+    the warehouses are spread over the shards with the modulo strategy."""
+    if spec == None:
+        return Partitioner(shards)
+    return Partitioner(shards, spec["strategy"], spec["first_w_id"], spec["last_w_id"], spec["replicate_items"])
+## DEF
+
+def assignWarehouses(scaleParameters, clients, shardMap = None):
+    """Return one list of home warehouses per client for the affinity mode.
+    On a sharded driver the lists follow the shards (see Partitioner.clientWarehouses),
+    otherwise the clients take every clients-th warehouse. The lists never overlap,
+    so this fails if a client would be left without a warehouse of its own."""
+    if shardMap == None:
+        shardMap = Partitioner(1, STRATEGY_MODULO, scaleParameters.starting_warehouse, scaleParameters.ending_warehouse)
+    assignment = [ shardMap.clientWarehouses(i, clients) for i in range(clients) ]
+    idle = len([ w_ids for w_ids in assignment if len(w_ids) == 0 ])
+    if idle > 0:
+        raise Exception("Affinity needs at least one warehouse per client, but %d of the %d clients would have none. "
+                        "Use fewer clients or more warehouses" % (idle, clients))
+    return assignment
+## DEF
+
+def ringPosition(key):
+    return int(hashlib.md5(key).hexdigest()[:8], 16)
+## DEF
+
+class Partitioner:
+    """
+        Maps warehouses onto shards for the sharded drivers.
+
+        modulo -- W_ID % shards. Neighbouring warehouses land on different shards.
+        range  -- contiguous blocks of warehouses, one block per shard.
+        hash   -- a consistent-hash ring, so adding a shard only moves the
+                  warehouses that fall into its slices of the ring.
+
+        The ITEM table is either replicated on every shard (the default) or
+        stored only on the first one.
+    """
+
+    def __init__(self, shards, strategy = STRATEGY_MODULO, first_w_id = None, last_w_id = None, replicateItems = True):
+        assert shards > 0
+        assert strategy in STRATEGIES, "Unknown partitioning strategy '%s'" % strategy
+        if strategy == STRATEGY_RANGE:
+            assert first_w_id != None and last_w_id != None, "The range strategy needs the warehouse range"
+        self.shards = shards
+        self.strategy = strategy
+        self.first_w_id = first_w_id
+        self.last_w_id = last_w_id
+        self.replicateItems = replicateItems
+
+        self.ring = [ ]
+        self.ringShards = [ ]
+        if strategy == STRATEGY_HASH:
+            points = sorted([ (ringPosition("shard-%d-%d" % (s, v)), s) for s in range(shards) for v in range(VIRTUAL_NODES) ])
+            self.ring = [ p[0] for p in points ]
+            self.ringShards = [ p[1] for p in points ]
+        ## IF
+    ## DEF
+
+    def shard(self, w_id):
+        """Return the shard that holds the given warehouse"""
+        w_id = int(w_id)
+        if self.shards == 1:
+            return 0
+        elif self.strategy == STRATEGY_MODULO:
+            return w_id % self.shards
+        elif self.strategy == STRATEGY_RANGE:
+            w_id = min(max(w_id, self.first_w_id), self.last_w_id)
+            count = self.last_w_id - self.first_w_id + 1
+            return ((w_id - self.first_w_id) * self.shards) // count
+        else:
+            idx = bisect.bisect(self.ring, ringPosition("w-%d" % w_id))
+            return self.ringShards[idx % len(self.ring)]
+    ## DEF
+
+    def warehouses(self, shard):
+        """Return the warehouses in the configured range that map to the given shard"""
+        assert self.first_w_id != None and self.last_w_id != None
+        return [ w_id for w_id in range(self.first_w_id, self.last_w_id+1) if self.shard(w_id) == shard ]
+    ## DEF
+
+    def itemShards(self):
+        """Return the shards that the ITEM table is loaded into"""
+        if self.replicateItems:
+            return range(self.shards)
+        return [ 0 ]
+    ## DEF
+
+    def itemShard(self, w_id):
+        """Return the shard to read ITEM records from for a transaction on the given warehouse"""
+        if self.replicateItems:
+            return self.shard(w_id)
+        return 0
+    ## DEF
+
+    def clientWarehouses(self, client_id, clients):
+        """Return the home warehouses for the given client so that every
+        client only touches the shards it was given. With fewer clients than
+        shards each client takes whole shards; otherwise the clients sharing a
+        shard split its warehouses between them. The sets of the clients never
+        overlap, so a client gets an empty one if there are not enough warehouses."""
+        if clients <= self.shards:
+            return [ w_id for s in range(client_id, self.shards, clients) for w_id in self.warehouses(s) ]
+        shard = client_id % self.shards
+        sharing = range(shard, clients, self.shards)
+        return self.warehouses(shard)[sharing.index(client_id)::len(sharing)]
+    ## DEF
+
+    def skew(self, weights = None):
+        """Return (per-shard load, max/mean ratio). The load of a shard is
+        the sum of the weights of its warehouses, one each by default."""
+        load = [ 0 ] * self.shards
+        for w_id in range(self.first_w_id, self.last_w_id+1):
+            load[self.shard(w_id)] += weights.get(w_id, 0) if weights != None else 1
+        mean = sum(load) / float(self.shards)
+        return (load, max(load) / mean if mean > 0 else 0.0)
+    ## DEF
+
+    def formatSkew(self, weights = None):
+        load, ratio = self.skew(weights)
+        total = float(sum(load)) or 1.0
+        ret = "Partitioning: %s over %d shards (ITEM %s)\n" % (self.strategy, self.shards, "replicated" if self.replicateItems else "on shard 0")
+        for s in range(self.shards):
+            ret += "  Shard %-3d %6d (%5.1f%%)\n" % (s, load[s], load[s] / total * 100)
+        ret += "  Skew (max/mean): %.2f" % ratio
+        return ret
+    ## DEF
+
+## CLASS
@@ -30,37 +30,86 @@
 # -----------------------------------------------------------------------
 
 import random
+import hashlib
+import threading
 import nurand
 
 SYLLABLES = [ "BAR", "OUGHT", "ABLE", "PRI", "PRES", "ESE", "ANTI", "CALLY", "ATION", "EING" ]
 
+## Every process draws from its own random.Random instance instead of the
+## global one, so forked workers don't repeat each other's streams
+rng = random.Random()
+
+def seed(value = None):
+    """Reset this process' random stream. If value is None, the stream is seeded from the OS."""
+    global rng
+    rng = random.Random(value)
+## DEF
+
+## Threads that run their own virtual terminals (see runtime/terminals.py) can
+## have a stream of their own on top of the process' one
+streams = threading.local()
+
+def seedThread(base, *keys):
+    """Give the calling thread its own random stream, derived like seedProcess()"""
+    if base == None:
+        streams.rng = random.Random(None)
+    else:
+        streams.rng = random.Random(deriveSeed(base, *keys))
+## DEF
+
+def stream():
+    """Return the random stream of the calling thread, or else the process' one"""
+    return getattr(streams, "rng", rng)
+## DEF
+
+def deriveSeed(base, *keys):
+    """Derive an independent seed from the base seed and the given keys (e.g., the
+    phase and client id). The same inputs always produce the same seed."""
+    digest = hashlib.sha1(repr((base,) + tuple(keys))).hexdigest()
+    return int(digest[:16], 16)
+## DEF
+
+def seedProcess(base, *keys):
+    """Give this process its own random stream. If base is None, the stream is
+    seeded from the OS so the run is not reproducible but still independent."""
+    if base == None:
+        seed(None)
+    else:
+        seed(deriveSeed(base, *keys))
+## DEF
+
 nurandVar = None # NURand
 def setNURand(nu):
     global nurandVar
     nurandVar = nu
 ## DEF
 
-def NURand(a, x, y):
-    """A non-uniform random number, as defined by TPC-C 2.1.6. (page 20)."""
+def getNURandC(a):
+    """Return the NURand C constant for the given value of A"""
     global nurandVar
-    assert x <= y
     if nurandVar is None:
 		setNURand(nurand.makeForLoad())
     
     if a == 255:
-        c = nurandVar.cLast
+        return nurandVar.cLast
     elif a == 1023:
-        c = nurandVar.cId
+        return nurandVar.cId
     elif a == 8191:
-        c = nurandVar.orderLineItemId
+        return nurandVar.orderLineItemId
     else:
-        raise Exception("a = " + a + " is not a supported value")
-    
+        raise Exception("a = %d is not a supported value" % a)
+## DEF
+
+def NURand(a, x, y):
+    """A non-uniform random number, as defined by TPC-C 2.1.6. (page 20)."""
+    assert x <= y
+    c = getNURandC(a)
     return (((number(0, a) | number(x, y)) + c) % (y - x + 1)) + x
 ## DEF
 
 def number(minimum, maximum):
-    value = random.randint(minimum, maximum)
+    value = stream().randint(minimum, maximum)
     assert minimum <= value and value <= maximum
     return value
 ## DEF
@@ -93,6 +142,11 @@ def fixedPoint(decimal_places, minimum, maximum):
     return float(number(int_min, int_max) / float(multiplier))
 ## DEF
 
+def shuffle(values):
+    """Shuffle the given list in place"""
+    stream().shuffle(values)
+## DEF
+
 def selectUniqueIds(numUnique, minimum, maximum):
     rows = set()
     for i in range(0, numUnique):
@@ -119,10 +173,7 @@ def nstring(minimum_length, maximum_length):
 def randomString(minimum_length, maximum_length, base, numCharacters):
     length = number(minimum_length, maximum_length)
     baseByte = ord(base)
-    string = ""
-    for i in range(length):
-        string += chr(baseByte + number(0, numCharacters-1))
-    return string
+    return "".join([ chr(baseByte + number(0, numCharacters-1)) for i in range(length) ])
 ## DEF
 
 def makeLastName(number):
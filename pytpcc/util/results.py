@@ -26,23 +26,52 @@
 
 import logging
 import time
+import csv
+import json
+
+import constants
+import histogram
+
+## Names of the phases that a time-series interval can belong to
+PHASE_WARMUP = "warmup"
+PHASE_MEASURE = "measure"
+PHASE_COOLDOWN = "cooldown"
 
 class Results:
     
-    def __init__(self):
+    def __init__(self, warmup = 0, cooldown = 0, interval = 1.0, mix = None, warehouses = None):
         self.start = None
         self.stop = None
         self.txn_id = 0
         
+        ## The requested transaction mix (in constants.TRANSACTION_MIX order)
+        ## and the number of warehouses, used for the tpmC and mix reports
+        self.mix = mix
+        self.warehouses = warehouses
+        
+        ## Transactions that finish inside the warmup/cooldown windows are
+        ## only kept in the time-series samples, not in the headline numbers
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self.duration = None
+        
+        ## Time-series samples: interval # -> txn name -> Histogram
+        assert interval > 0
+        self.interval = interval
+        self.samples = { }
+        
         self.txn_counters = { }
         self.txn_times = { }
+        self.txn_histograms = { }
         self.running = { }
         
-    def startBenchmark(self):
-        """Mark the benchmark as having been started"""
+    def startBenchmark(self, duration = None):
+        """Mark the benchmark as having been started. If the measured duration is
+        given, transactions finishing after warmup + duration are excluded as cooldown"""
         assert self.start == None
         logging.debug("Starting benchmark statistics collection")
         self.start = time.time()
+        self.duration = duration
         return self.start
         
     def stopBenchmark(self):
@@ -52,10 +81,12 @@ class Results:
         logging.debug("Stopping benchmark statistics collection")
         self.stop = time.time()
         
-    def startTransaction(self, txn):
+    def startTransaction(self, txn, start = None):
+        """Start timing a transaction. The start time can be given if the transaction
+        was submitted earlier than it started running"""
         self.txn_id += 1
         id = self.txn_id
-        self.running[id] = (txn, time.time())
+        self.running[id] = (txn, start if start != None else time.time())
         return id
         
     def abortTransaction(self, id):
@@ -70,13 +101,39 @@ class Results:
         txn_name, txn_start = self.running[id]
         del self.running[id]
         
-        duration = time.time() - txn_start
+        txn_stop = time.time()
+        duration = txn_stop - txn_start
+        elapsed = (txn_stop - self.start) if self.start != None else 0
+        
+        ## Every transaction goes into its time-series interval
+        idx = int(elapsed / self.interval)
+        if not idx in self.samples:
+            self.samples[idx] = { }
+        if not txn_name in self.samples[idx]:
+            self.samples[idx][txn_name] = histogram.Histogram()
+        self.samples[idx][txn_name].record(duration * 1000000)
+        
+        if self.getPhase(elapsed) != PHASE_MEASURE:
+            return
+        
         total_time = self.txn_times.get(txn_name, 0)
         self.txn_times[txn_name] = total_time + duration
         
         total_cnt = self.txn_counters.get(txn_name, 0)
         self.txn_counters[txn_name] = total_cnt + 1
         
+        if not txn_name in self.txn_histograms:
+            self.txn_histograms[txn_name] = histogram.Histogram()
+        self.txn_histograms[txn_name].record(duration * 1000000)
+        
+    def getPhase(self, elapsed):
+        """Return the phase of the benchmark at the given number of seconds after the start"""
+        if elapsed < self.warmup:
+            return PHASE_WARMUP
+        if self.duration != None and elapsed > (self.warmup + self.duration):
+            return PHASE_COOLDOWN
+        return PHASE_MEASURE
+        
     def append(self, r):
         for txn_name in r.txn_counters.keys():
             orig_cnt = self.txn_counters.get(txn_name, 0)
@@ -84,10 +141,156 @@ class Results:
 
             self.txn_counters[txn_name] = orig_cnt + r.txn_counters[txn_name]
             self.txn_times[txn_name] = orig_time + r.txn_times[txn_name]
+            
+            ## Merge the latency histograms instead of shipping the raw samples
+            if txn_name in r.txn_histograms:
+                if not txn_name in self.txn_histograms:
+                    self.txn_histograms[txn_name] = histogram.Histogram()
+                self.txn_histograms[txn_name].merge(r.txn_histograms[txn_name])
             #logging.debug("%s [cnt=%d, time=%d]" % (txn_name, self.txn_counters[txn_name], self.txn_times[txn_name]))
+        
+        ## Intervals are relative to each client's own start time
+        for idx in r.samples.keys():
+            if not idx in self.samples:
+                self.samples[idx] = { }
+            for txn_name, h in r.samples[idx].iteritems():
+                if not txn_name in self.samples[idx]:
+                    self.samples[idx][txn_name] = histogram.Histogram()
+                self.samples[idx][txn_name].merge(h)
+        ## FOR
+        
         ## HACK
         self.start = r.start
         self.stop = r.stop
+        self.warmup = r.warmup
+        self.cooldown = r.cooldown
+        self.duration = r.duration
+        self.interval = r.interval
+        self.mix = r.mix
+        self.warehouses = r.warehouses
+    
+    def getDuration(self):
+        """Return the number of seconds that were measured, excluding warmup and cooldown"""
+        if self.stop == None:
+            elapsed = time.time() - self.start
+        else:
+            elapsed = self.stop - self.start
+        duration = elapsed - self.warmup
+        if self.duration != None:
+            duration = min(duration, self.duration)
+        return max(duration, 0)
+        
+    def getSummary(self, load_time = None):
+        """Return a machine-readable dict with the headline metrics of this run"""
+        duration = self.getDuration()
+        total_cnt = sum(self.txn_counters.values())
+        
+        ## The official TPC-C metric: NEW_ORDER commits per minute. See TPC-C 5.4.2 (page 71)
+        new_orders = self.txn_counters.get(constants.TransactionTypes.NEW_ORDER, 0)
+        tpmC = (new_orders / (duration / 60.0)) if duration > 0 else 0.0
+        efficiency = None
+        if self.warehouses:
+            efficiency = 100.0 * tpmC / (constants.MAX_TPMC_PER_WAREHOUSE * self.warehouses)
+        
+        targets = { }
+        if self.mix:
+            assert len(self.mix) == len(constants.TRANSACTION_MIX)
+            mix_total = float(sum(self.mix))
+            for txn, weight in zip(constants.TRANSACTION_MIX, self.mix):
+                targets[txn] = 100.0 * weight / mix_total
+        
+        txns = { }
+        for txn in sorted(set(self.txn_counters.keys() + targets.keys())):
+            txn_cnt = self.txn_counters.get(txn, 0)
+            txn_time = self.txn_times.get(txn, 0)
+            h = self.txn_histograms.get(txn, histogram.Histogram())
+            observed = (100.0 * txn_cnt / total_cnt) if total_cnt > 0 else 0.0
+            
+            stats = {
+                "count": txn_cnt,
+                "rate": (txn_cnt / duration) if duration > 0 else 0.0,
+                "avg_us": (txn_time / txn_cnt * 1000000) if txn_cnt > 0 else 0.0,
+                "max_us": h.max,
+                "mix_observed": observed,
+            }
+            for p in histogram.PERCENTILES:
+                stats["p%g_us" % p] = h.percentile(p)
+            
+            ## The mix percentages are *minimums* for everything except NEW_ORDER,
+            ## which gets whatever is left over. See TPC-C 5.2.3 (page 68)
+            if txn in targets:
+                stats["mix_target"] = targets[txn]
+                stats["mix_deviation"] = observed - targets[txn]
+                stats["mix_compliant"] = (txn == constants.TransactionTypes.NEW_ORDER or observed >= targets[txn])
+            txns[txn] = stats
+        ## FOR
+        
+        return {
+            "start": self.start,
+            "stop": self.stop,
+            "duration": duration,
+            "warmup": self.warmup,
+            "cooldown": self.cooldown,
+            "load_time": load_time,
+            "warehouses": self.warehouses,
+            "tpmC": tpmC,
+            "efficiency": efficiency,
+            "total_count": total_cnt,
+            "total_rate": (total_cnt / duration) if duration > 0 else 0.0,
+            "mix_compliant": all([ t.get("mix_compliant", True) for t in txns.values() ]),
+            "transactions": txns,
+        }
+        
+    def exportSummary(self, path, load_time = None):
+        """Write the summary of this run as JSON to the given file"""
+        logging.info("Writing benchmark summary to '%s'" % path)
+        with open(path, "w") as fd:
+            json.dump(self.getSummary(load_time), fd, indent=2, sort_keys=True)
+        ## WITH
+        
+    def getTimeSeries(self):
+        """Return a list of dicts with the throughput and latencies of each txn per interval"""
+        rows = [ ]
+        for idx in sorted(self.samples.keys()):
+            offset = idx * self.interval
+            for txn_name in sorted(self.samples[idx].keys()):
+                h = self.samples[idx][txn_name]
+                row = {
+                    "time": offset,
+                    "phase": self.getPhase(offset),
+                    "txn": txn_name,
+                    "count": h.count,
+                    "rate": h.count / float(self.interval),
+                    "avg_us": h.mean(),
+                    "max_us": h.max,
+                }
+                for p in histogram.PERCENTILES:
+                    row["p%g_us" % p] = h.percentile(p)
+                rows.append(row)
+            ## FOR
+        ## FOR
+        return (rows)
+        
+    def exportTimeSeries(self, path):
+        """Write the time-series samples to the given file. The format is
+        picked from the extension: '.json' for JSON, anything else is CSV"""
+        rows = self.getTimeSeries()
+        columns = [ "time", "phase", "txn", "count", "rate", "avg_us" ] + \
+                  [ "p%g_us" % p for p in histogram.PERCENTILES ] + \
+                  [ "max_us" ]
+        logging.info("Writing %d time-series samples to '%s'" % (len(rows), path))
+        with open(path, "w") as fd:
+            if path.lower().endswith(".json"):
+                json.dump({ "interval": self.interval,
+                            "warmup": self.warmup,
+                            "cooldown": self.cooldown,
+                            "samples": rows }, fd, indent=2)
+            else:
+                writer = csv.writer(fd)
+                writer.writerow(columns)
+                for row in rows:
+                    writer.writerow([ row[c] for c in columns ])
+        ## WITH
             
     def __str__(self):
         return self.show()
@@ -95,10 +298,7 @@ class Results:
     def show(self, load_time = None):
         if self.start == None:
             return "Benchmark not started"
-        if self.stop == None:
-            duration = time.time() - self.start
-        else:
-            duration = self.stop - self.start
+        duration = self.getDuration()
         
         col_width = 16
         total_width = (col_width*4)+2
@@ -109,7 +309,10 @@ class Results:
         if load_time != None:
             ret += "Data Loading Time: %d seconds\n\n" % (load_time)
         
-        ret += "Execution Results after %d seconds\n%s" % (duration, line)
+        ret += "Execution Results after %d seconds" % (duration)
+        if self.warmup or self.cooldown:
+            ret += " (excluding %d seconds warmup, %d seconds cooldown)" % (self.warmup, self.cooldown)
+        ret += "\n%s" % (line)
         ret += f % ("", "Executed", u"Avg. RT (µs)", "Rate")
         
         total_time = 0
@@ -125,6 +328,56 @@ class Results:
         ret += "\n" + ("-"*total_width)
         total_rate = "%.02f txn/s" % ((total_cnt / duration))
         ret += f % ("TOTAL", str(total_cnt), str(total_time / total_cnt * 1000000), total_rate)
+        
+        summary = self.getSummary(load_time)
+        ret += "\n\n%-18s%.02f" % ("tpmC:", summary["tpmC"])
+        if summary["efficiency"] != None:
+            ret += "\n%-18s%.02f%% (%d warehouses @ %.02f tpmC max)" % \
+                   ("Efficiency:", summary["efficiency"], self.warehouses, constants.MAX_TPMC_PER_WAREHOUSE)
+        if self.mix:
+            ret += "\n\n" + self.showMix(summary)
+        
+        ret += "\n\n" + self.showLatencies()
 
         return (ret.encode('utf-8'))
+        
+    def showMix(self, summary):
+        """Return a table comparing the observed transaction mix against the requested one"""
+        col_width = 16
+        total_width = (col_width*5)+2
+        f = "\n  " + (("%-" + str(col_width) + "s")*5)
+        line = "-"*total_width
+        
+        ret = u"Transaction Mix\n%s" % line
+        ret += f % ("", "Target", "Observed", "Deviation", "Status")
+        for txn in sorted(summary["transactions"].keys()):
+            stats = summary["transactions"][txn]
+            if not "mix_target" in stats: continue
+            ret += f % (txn,
+                        "%.02f%%" % stats["mix_target"],
+                        "%.02f%%" % stats["mix_observed"],
+                        "%+.02f%%" % stats["mix_deviation"],
+                        "OK" if stats["mix_compliant"] else "BELOW MINIMUM")
+        ## FOR
+        return (ret)
+        
+    def showLatencies(self):
+        """Return a table with the response time percentiles of each transaction"""
+        col_width = 14
+        num_cols = len(histogram.PERCENTILES) + 2
+        total_width = (col_width*num_cols)+2
+        f = "\n  " + (("%-" + str(col_width) + "s")*num_cols)
+        line = "-"*total_width
+        
+        ret = u"Response Time Percentiles (µs)\n%s" % line
+        ret += f % tuple([ "" ] + [ "p%g" % p for p in histogram.PERCENTILES ] + [ "Max" ])
+        
+        total_hist = histogram.Histogram()
+        for txn in sorted(self.txn_histograms.keys()):
+            h = self.txn_histograms[txn]
+            ret += f % tuple([ txn ] + [ str(h.percentile(p)) for p in histogram.PERCENTILES ] + [ str(h.max) ])
+            total_hist.merge(h)
+        ret += "\n" + line
+        ret += f % tuple([ "TOTAL" ] + [ str(total_hist.percentile(p)) for p in histogram.PERCENTILES ] + [ str(total_hist.max) ])
+        return (ret)
 ## CLASS
\ No newline at end of file
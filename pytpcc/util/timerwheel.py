@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------
+# Copyright (C) 2011
+# Andy Pavlo
+# http://www.cs.brown.edu/~pavlo/
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT
+# IN NO EVENT SHALL THE AUTHORS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+# -----------------------------------------------------------------------
+
+import math
+
+## Seconds covered by one slot, and the number of slots. Timers further
+## away than one turn of the wheel wait in their slot for the extra turns
+DEFAULT_TICK = 0.1
+DEFAULT_SLOTS = 1024
+
+class TimerWheel:
+    """
+        A hashed timer wheel. Every timer goes into the slot of the tick it is
+        due in, so scheduling is O(1) and expiring a tick only looks at the
+        timers in its slot, however many are pending. Timers are never expired
+        before they are due, but can be up to one tick late. It is not thread
+        safe: the caller holds a lock if several threads use it.
+    """
+
+    def __init__(self, start, tick = DEFAULT_TICK, slots = DEFAULT_SLOTS):
+        assert tick > 0
+        assert slots > 0
+        self.tick = tick
+        self.slots = [ [ ] for i in range(slots) ]
+        self.current = self.tickOf(start)
+        self.count = 0
+    ## DEF
+
+    def tickOf(self, when):
+        return int(math.ceil(when / self.tick))
+    ## DEF
+
+    def schedule(self, due, item):
+        """Add a timer for the given item, due at the given time"""
+        t = max(self.tickOf(due), self.current)
+        self.slots[t % len(self.slots)].append((t, due, item))
+        self.count += 1
+    ## DEF
+
+    def advance(self, now):
+        """Expire all of the timers due up to now and return their (due, item) pairs in
+        the order of their ticks"""
+        expired = [ ]
+        last = int(math.floor(now / self.tick))
+        while self.current <= last:
+            idx = self.current % len(self.slots)
+            slot = self.slots[idx]
+            if slot:
+                pending = [ ]
+                for entry in slot:
+                    if entry[0] <= self.current:
+                        expired.append((entry[1], entry[2]))
+                    else:
+                        pending.append(entry)
+                ## FOR
+                self.slots[idx] = pending
+            self.current += 1
+        ## WHILE
+        self.count -= len(expired)
+        return expired
+    ## DEF
+
+    def __len__(self):
+        return self.count
+
+## CLASS
@@ -57,37 +57,50 @@ def createDriverClass(name):
 ## ==============================================
 ## loaderFunc
 ## ==============================================
-def loaderFunc(driverClass, scaleParameters, args, config, w_ids, debug):
+def loaderFunc(driverClass, scaleParameters, args, config, client_id, debug):
+    """Create the driver and the loader that will load the units sent by the coordinator"""
     driver = driverClass(args['ddl'])
     assert driver != None
-    logging.debug("Starting client execution: %s [warehouses=%d]" % (driver, len(w_ids)))
+    logging.debug("Starting client execution: %s" % driver)
     
     config['load'] = True
     config['execute'] = False
     config['reset'] = False
     driver.loadConfig(config)
    
+    w_ids = range(scaleParameters.starting_warehouse, scaleParameters.ending_warehouse+1)
+    l = loader.getLoaderClass(args['generator'])(driver, scaleParameters, w_ids, False, args['load_pipeline'])
+    driver.loadStart()
+    return l
+## DEF
+
+## ==============================================
+## loadUnit
+## ==============================================
+def loadUnit(l, args, unit):
+    """Load a single unit and return how long it took. Every unit has its own
+    seed, so the data does not depend on which worker happens to get it."""
+    rand.seedProcess(args['seed'], "load", *unit)
+    start = time.time()
     try:
-        loadItems = (1 in w_ids)
-        l = loader.Loader(driver, scaleParameters, w_ids, loadItems)
-        driver.loadStart()
-        l.execute()
-        driver.loadFinish()   
-    except KeyboardInterrupt:
-            return -1
+        l.executeUnit(unit)
     except (Exception, AssertionError), ex:
         logging.warn("Failed to load data: %s" % (ex))
-        #if debug:
         traceback.print_exc(file=sys.stdout)
         raise
-        
+    return time.time() - start
 ## DEF
 
 
 ## ==============================================
 ## executorFunc
 ## ==============================================
-def executorFunc(driverClass, scaleParameters, args, config, debug):
+def executorFunc(driverClass, scaleParameters, args, config, client_id, debug, warehouses = None):
+    rand.seedProcess(args['seed'], "execute", client_id)
+    if args['emulate_terminals']:
+        return emulateTerminals(driverClass, scaleParameters, args, config, client_id, warehouses)
+    if args['terminals'] > 1:
+        return executeTerminals(driverClass, scaleParameters, args, config, client_id, warehouses)
     driver = driverClass(args['ddl'])
     assert driver != None
     logging.debug("Starting client execution: %s" % driver)
@@ -96,14 +109,40 @@ def executorFunc(driverClass, scaleParameters, args, config, debug):
     config['reset'] = False
     driver.loadConfig(config)
 
-    e = executor.Executor(driver, scaleParameters, stop_on_error=args['stop_on_error'])
+    mix = [ int(i) for i in args['mix'].split(',') ]
+    e = executor.Executor(driver, scaleParameters, mix, stop_on_error=args['stop_on_error'], warehouses=warehouses)
     driver.executeStart()
-    results = e.execute(args['duration'])
+    results = e.execute(args['duration'], args['warmup'], args['cooldown'], args['sample_interval'])
     driver.executeFinish()
     
     return results
 ## DEF
 
+## ==============================================
+## executeTerminals
+## ==============================================
+def executeTerminals(driverClass, scaleParameters, args, config, client_id, warehouses = None):
+    """Run args['terminals'] virtual terminals in this process, each with its own driver"""
+    mix = [ int(i) for i in args['mix'].split(',') ]
+    pool = terminals.TerminalPool(driverClass, args['ddl'], config, scaleParameters, mix, args['terminals'], stop_on_error=args['stop_on_error'], warehouses=warehouses)
+    return pool.execute(args['duration'], args['warmup'], args['cooldown'], args['sample_interval'], args['seed'], client_id)
+## DEF
+
+## ==============================================
+## emulateTerminals
+## ==============================================
+def emulateTerminals(driverClass, scaleParameters, args, config, client_id, warehouses = None):
+    """Emulate the TPC-C terminals of this client's warehouses, with keying and think
+    times, over args['terminals'] connections"""
+    mix = [ int(i) for i in args['mix'].split(',') ]
+    homes = terminals.homeTerminals(scaleParameters, client_id, args['clients'], warehouses)
+    if not homes:
+        logging.warn("Client %d has no warehouses to emulate terminals for" % client_id)
+        return results.Results()
+    emulator = terminals.TerminalEmulator(driverClass, args['ddl'], config, scaleParameters, mix, homes, args['terminals'], stop_on_error=args['stop_on_error'])
+    return emulator.execute(args['duration'], args['warmup'], args['cooldown'], args['sample_interval'], args['seed'], client_id)
+## DEF
+
 ## MAIN
 if __name__=='__channelexec__':
     driverClass=None
@@ -113,21 +152,33 @@ if __name__=='__channelexec__':
 	   scaleParameters=command.data[0]
 	   args=command.data[1]
 	   config=command.data[2]
-	   w_ids=command.data[3]
+           client_id=command.data[4]
+           rand.setNURand(command.data[3])
 	   
 	   ## Create a handle to the target client driver at the client side
            driverClass = createDriverClass(args['system'])
            assert driverClass != None, "Failed to find '%s' class" % args['system']
-           driver = driverClass(args['ddl'])
-           assert driver != None, "Failed to create '%s' driver" % args['system']
         
-           loaderFunc(driverClass,scaleParameters,args,config,w_ids,True)
+           l=loaderFunc(driverClass,scaleParameters,args,config,client_id,True)
+           ## Tell the coordinator that we are ready for the first unit
+           m=message.Message(header=message.LOAD_UNIT_COMPLETED,data=[client_id,None,0])
+           channel.send(pickle.dumps(m,-1))
+       elif command.header==message.CMD_LOAD_UNIT:
+           unit=command.data
+           elapsed=loadUnit(l,args,unit)
+           m=message.Message(header=message.LOAD_UNIT_COMPLETED,data=[client_id,unit,elapsed])
+           channel.send(pickle.dumps(m,-1))
+       elif command.header==message.CMD_LOAD_FINISH:
+           l.finishUnits()
+           l.handle.loadFinish()
 	   m=message.Message(header=message.LOAD_COMPLETED)
            channel.send(pickle.dumps(m,-1))          
        elif command.header==message.CMD_EXECUTE:
 	   scaleParameters=command.data[0]
 	   args=command.data[1]
 	   config=command.data[2]
+           client_id=command.data[4]
+           rand.setNURand(command.data[3])
 	  
 	   ## Create a handle to the target client driver at the client side
 	   if driverClass==None:
@@ -136,7 +187,7 @@ if __name__=='__channelexec__':
                driver = driverClass(args['ddl'])
                assert driver != None, "Failed to create '%s' driver" % args['system']
            
-           results=executorFunc(driverClass,scaleParameters,args,config,True)
+           results=executorFunc(driverClass,scaleParameters,args,config,client_id,True,command.data[5])
            m=message.Message(header=message.EXECUTE_COMPLETED,data=results)
            channel.send(pickle.dumps(m,-1))
            